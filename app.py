@@ -1,18 +1,30 @@
+import hashlib
+import json
+import mimetypes
 import os
 import socket
 import sys
 import traceback
+import urllib.parse
 import psutil
 from enum import Enum
+from typing import Dict, List
 
-from flask import Flask, url_for, render_template, request
+from flask import Flask, Response, url_for, render_template, request, jsonify, make_response, send_from_directory, abort, stream_with_context, redirect
+from werkzeug.serving import is_running_from_reloader
 
 import menvloader
+from mconfig import ArchiveSendfileMode
+from mexecutorlanes import LaneFullError
+from mmetrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
 from mcontext import AppContext
-from mrepository import RepositoryType
-from mrepository_entities import TaskClassAndType, TaskClass, TaskType
+from mrepository import Repository, RepositoryType
+from mrepository_entities import TaskClassAndType, TaskClass, TaskType, MTaskE, MTaskItemE, TaskStatusEnum, ItemRetryStatusEnum
+from mthumbnails import ORIGINAL_VARIANT
 
 CONFIG_FILE = "config.yaml"
+ARCHIVE_URL_PREFIX = "/archive/"
+SQL_PROFILE_ROWS = 20
 app = Flask(__name__)
 app.ctx = None
 
@@ -42,8 +54,8 @@ def get_page_data(page_values: dict = None):
 		},
 		"page_values": page_values,
 		"current": {
-			"endpoint": None if request.endpoint is None else url_for(request.endpoint, **page_values if page_values is not None else {}),
-			"image_dir": url_for("static", filename=app_context.config.scrappers.storage_path_for_static),
+			"endpoint": None if request.endpoint is None else url_for(request.endpoint, **page_values if page_values is not None else request.view_args or {}),
+			"image_dir": get_archive_base_path(),
 			"debug": app_context.config.app_debug,
 		},
 		"links": {
@@ -76,6 +88,158 @@ def get_page_data(page_values: dict = None):
 	return page_data
 
 
+def get_repository(repository: str) -> Repository:
+	app_context = get_app_context()
+	match repository:
+		case RepositoryType.IN_MEMORY.value: return app_context.repository_in_memory
+		case RepositoryType.PERSISTENT.value: return app_context.repository_persistent
+		case _: return app_context.repository_in_memory  # fallback
+
+
+def get_view_task_def(view_source: str) -> TaskClassAndType:
+	match view_source:
+		case ViewSources.ROUMEN_KECY.value: return TaskClassAndType(TaskClass.SCRAP, TaskType.ROUMEN_KECY)
+		case ViewSources.ROUMEN_MASO.value: return TaskClassAndType(TaskClass.SCRAP, TaskType.ROUMEN_MASO)
+		case _: raise ValueError(f"Invalid view type '{view_source}'.")
+
+
+def get_archive_base_path() -> str:
+	return request.script_root + ARCHIVE_URL_PREFIX
+
+
+def get_page_cursor(name: str) -> int | None:
+	value = request.args.get(name, None)
+	return None if value in (None, "") else int(value)
+
+
+def split_page(entities: list, page_size: int) -> tuple:
+	""" entities are read with page_size + 1 limit, returns the page and the pk_id cursor of the next one (None on the last page) """
+	if len(entities) > page_size:
+		page = entities[:page_size]
+		return page, page[-1].pk_id
+	return entities, None
+
+
+def read_tasks_page(repo: Repository, before_pk_id: int | None) -> tuple:
+	page_size = get_app_context().config.listing_limits.scraps
+	return split_page(repo.read_recent_tasks_all(page_size + 1, before_pk_id), page_size)
+
+
+def read_task_items_page(repo: Repository, task: MTaskE, after_pk_id: int | None) -> tuple:
+	page_size = get_app_context().config.listing_limits.task_items
+	return split_page(repo.read_task_items(task, page_size + 1, after_pk_id), page_size)
+
+
+def read_view_items_page(task_def: TaskClassAndType, before_pk_id: int | None) -> tuple:
+	page_size = get_app_context().config.listing_limits.images
+	items, next_pk_id = split_page(get_app_context().repository_persistent.read_recent_task_items(task_def, page_size + 1, before_pk_id), page_size)
+	return [item for item in items if item.destination_path is not None], next_pk_id
+
+
+def get_image_sources(base_path: str, task_items: List[MTaskItemE]) -> Dict[str, dict]:
+	""" src, srcset (jpeg and webp) and sizes of the images by the destination path, thumbnails are used when generated """
+	app_context = get_app_context()
+	thumbnails = app_context.config.scrappers.thumbnails
+	variants_by_path = app_context.repository_persistent.read_item_variants([item.destination_path for item in task_items])
+
+	image_sources = {}
+	for item in task_items:
+		sources = {"original": base_path + item.destination_path, "src": base_path + item.destination_path}
+		variants = variants_by_path.get(item.destination_path, [])
+		original = next((v for v in variants if v.variant == ORIGINAL_VARIANT), None)
+		jpegs = [v for v in variants if v.variant.endswith(".jpg")]
+		webps = [v for v in variants if v.variant.endswith(".webp")]
+
+		if original is not None and thumbnails is not None and len(jpegs) > 0:
+			# the original is the widest candidate, the thumbnails are narrower by definition
+			display_width = min(original.width, max(thumbnails.widths))
+			sources.update({
+				"src": base_path + jpegs[-1].path,
+				"srcset": ", ".join(f"{base_path}{v.path} {v.width}w" for v in (*jpegs, original)),
+				# webp only when it covers the displayed width, the original is no webp candidate
+				"srcset_webp": None if len(webps) == 0 or webps[-1].width < display_width else ", ".join(f"{base_path}{v.path} {v.width}w" for v in webps),
+				"sizes": f"(max-width: {display_width}px) 100vw, {display_width}px",
+				"width": original.width,
+				"height": original.height,
+			})
+		image_sources[item.destination_path] = sources
+	return image_sources
+
+
+class TaskNotFoundError(Exception):
+	pass
+
+
+def load_task(repo: Repository, repository: str, task_id) -> MTaskE:
+	task = repo.load_entity_task(task_id)
+	if task is None:
+		raise TaskNotFoundError(f"Task '{task_id}' not found in the {repository} repository.")
+	return task
+
+
+def get_validator(change_marker: str) -> str:
+	""" the listing changes with the data, the request (page, cursor) and the deployment (restart) """
+	validator_source = f"{get_app_context().start_time.isoformat()}|{request.full_path}|{change_marker}"
+	return hashlib.sha1(validator_source.encode("utf-8")).hexdigest()
+
+
+def get_not_modified_response(etag: str, cache_control: str) -> Response | None:
+	if not request.if_none_match.contains_weak(etag):
+		return None
+	return with_validator(Response(status=304), etag, cache_control)
+
+
+def with_validator(response, etag: str, cache_control: str) -> Response:
+	# weak, the pages contain the time dependent values (age, uptime) too
+	response = make_response(response)
+	response.set_etag(etag, weak=True)
+	response.headers["Cache-Control"] = cache_control
+	return response
+
+
+def get_state(active_repository: str | None) -> dict:
+	app_context = get_app_context()
+	return {
+		"uptime": app_context.uptime,
+		"psutil": {
+			# since the previous call, never blocks the request
+			"cpu_load": psutil.cpu_percent(None),
+			"memory_percent": psutil.virtual_memory().percent,
+			"disk_percent": psutil.disk_usage("/").percent,
+		},
+		"process": {
+			"pid": os.getpid(),
+		},
+		"active_repository": active_repository,
+		"repositories": {
+			repository_type.value: url_for("page_state", repository=repository_type.value) for repository_type in RepositoryType
+		},
+		"retries": url_for("page_state_retries"),
+		"python_version": sys.version,
+		"executor_lanes": app_context.executor_lanes.stats(),
+		"sql_profile": None if app_context.sql_profiler is None else app_context.sql_profiler.stats()[:SQL_PROFILE_ROWS],
+	}
+
+
+def task_as_json(task: MTaskE) -> dict:
+	return {
+		**task.as_row(),
+		"start_date": task.start_date,
+		"age": task.age,
+		"time_taken": task.time_taken,
+		"success_percentage": task.success_percentage,
+	}
+
+
+def task_item_as_json(task_item: MTaskItemE) -> dict:
+	return {
+		**task_item.as_row(),
+		"start_date": task_item.start_date,
+		"age": task_item.age,
+		"time_taken": task_item.time_taken,
+	}
+
+
 @app.route("/")
 def page_index():
 	return render_template("home.html", page_data=get_page_data())
@@ -93,48 +257,71 @@ def page_state(repository: str = RepositoryType.IN_MEMORY.value, task_id: int =
 	app_context = get_app_context()
 	page_data = get_page_data()
 	try:
-		match repository:
-			case RepositoryType.IN_MEMORY.value: repo = app_context.repository_in_memory
-			case RepositoryType.PERSISTENT.value: repo = app_context.repository_persistent
-			case _: repo = app_context.repository_in_memory  # fallback
+		repo = get_repository(repository)
 
-		page_data["state"] = {
-			"uptime": app_context.uptime,
-			"psutil": {
-				"cpu_load": psutil.cpu_percent(0.1),
-				"memory_percent": psutil.virtual_memory().percent,
-				"disk_percent": psutil.disk_usage("/").percent,
-			},
-			"process": {
-				"pid": os.getpid(),
-			},
-			"active_repository": repository,
-			"active_task_id": task_id,
-			"repositories": {
-				repository_type.value: url_for("page_state", repository=repository_type.value) for repository_type in RepositoryType
-			},
-			"python_version": sys.version,
-		}
+		# not validated, the page shows the live values (load, lanes, sql profile) besides the listing
+		page_data["state"] = get_state(repository)
+		page_data["state"]["active_task_id"] = task_id
 
 		if task_id is not None:
-			task = repo.load_entity_task(task_id)
+			task = load_task(repo, repository, task_id)
+			task_items, next_pk_id = read_task_items_page(repo, task, get_page_cursor("after"))
 			page_data["state"].update({
 				"page_view_mode": "task_detail",
 				"task": task,
-				"task_items": repo.read_task_items(task),
+				"task_items": task_items,
+				"events": url_for("events_task", repository=repository, task_id=task_id),
+				"cancel": url_for("page_state_cancel", repository=repository, task_id=task_id),
+				"cancellable": task.status in (TaskStatusEnum.CREATED.value, TaskStatusEnum.RUNNING.value),
+				"first_page": url_for("page_state", repository=repository, task_id=task_id),
+				"next_page": None if next_pk_id is None else url_for("page_state", repository=repository, task_id=task_id, after=next_pk_id),
 			})
 		else:
+			tasks, next_pk_id = read_tasks_page(repo, get_page_cursor("before"))
 			page_data["state"].update({
 				"page_view_mode": "task_overview",
-				"tasks": repo.read_recent_tasks_all(app_context.config.listing_limits.scraps),
+				"tasks": tasks,
 				"task_detail_link_base": url_for("page_state", repository=repository),
+				"first_page": url_for("page_state", repository=repository),
+				"next_page": None if next_pk_id is None else url_for("page_state", repository=repository, before=next_pk_id),
 			})
 
+		response = make_response(render_template("state.html", page_data=page_data))
+		response.headers["Cache-Control"] = app_context.config.http_cache.state
+		return response
+	except Exception as ex:
+		return render_exception_page(ex, page_data)
+
+
+@app.route("/state/retries/")
+def page_state_retries():
+	app_context = get_app_context()
+	page_data = get_page_data()
+	try:
+		item_limit = app_context.config.listing_limits.retries
+		page_data["state"] = get_state(None)
+		page_data["state"].update({
+			"page_view_mode": "item_retries",
+			"retry_queue": app_context.retry_queue.read_recent(ItemRetryStatusEnum.RETRY, item_limit),
+			"dead_letter_queue": app_context.retry_queue.read_recent(ItemRetryStatusEnum.DEAD, item_limit),
+		})
 		return render_template("state.html", page_data=page_data)
 	except Exception as ex:
 		return render_exception_page(ex, page_data)
 
 
+@app.route("/state/<repository>/<task_id>/cancel/", methods=["POST"])
+def page_state_cancel(repository: str, task_id: int):
+	app_context = get_app_context()
+	page_data = get_page_data()
+	try:
+		if not app_context.task_cancellations.cancel(repository, int(task_id)):
+			app_context.logger.info(f"Task '{task_id}' not cancelled, it is not queued or running.")
+		return redirect(url_for("page_state", repository=repository, task_id=task_id))
+	except Exception as ex:
+		return render_exception_page(ex, page_data)
+
+
 @app.route("/scrap/", methods=["GET", "POST"])
 def page_scrap():
 	app_context = get_app_context()
@@ -148,22 +335,34 @@ def page_scrap():
 		}
 
 		page_data["sources"] = list(ViewSources)
-		tasks = []
+		page_data["refused"] = []
+		task_factory, task_dispatcher = app_context.task_factory, app_context.task_dispatcher
 
 		match request.method, request.form.get("form", None):
 			case ("POST", "scrap"):
-				if request.form.get(f"source-{ViewSources.ROUMEN_KECY.value}", None) is not None:
-					tasks.append(app_context.task_factory.create_task_roumen_kecy())
-				if request.form.get(f"source-{ViewSources.ROUMEN_MASO.value}", None) is not None:
-					tasks.append(app_context.task_factory.create_task_roumen_maso())
+				for view_source, create_task in (
+					(ViewSources.ROUMEN_KECY, task_factory.create_task_roumen_kecy),
+					(ViewSources.ROUMEN_MASO, task_factory.create_task_roumen_maso),
+				):
+					if request.form.get(f"source-{view_source.value}", None) is not None:
+						task_def = get_view_task_def(view_source.value)
+						try:
+							if task_dispatcher.submit(task_def, create_task) is None:
+								page_data["refused"].append(f"{task_def} (already queued or running)")
+						except LaneFullError as ex:
+							page_data["refused"].append(str(ex))
 
 			case ("POST", "yt_dl"):
 				if request.form.get("url-list", None) is not None:
 					urls = tuple(url.strip() for url in request.form.get("url-list", "").split())
-					tasks.append(app_context.task_factory.create_task_youtube_dl(urls))
-
-		for task in tasks:
-			app_context.task_executor.submit(task)
+					try:
+						task_dispatcher.submit(
+							TaskClassAndType(TaskClass.SCRAP, TaskType.YOUTUBE_DL),
+							lambda: task_factory.create_task_youtube_dl(urls),
+							exclusive=False
+						)
+					except LaneFullError as ex:
+						page_data["refused"].append(str(ex))
 
 	except Exception as ex:
 		return render_exception_page(ex, page_data=page_data)
@@ -176,26 +375,174 @@ def page_view(view_source: str):
 	app_context = get_app_context()
 	page_data = get_page_data({"view_source": view_source})
 	try:
-		match view_source:
-			case ViewSources.ROUMEN_KECY.value: task_def = TaskClassAndType(TaskClass.SCRAP, TaskType.ROUMEN_KECY)
-			case ViewSources.ROUMEN_MASO.value: task_def = TaskClassAndType(TaskClass.SCRAP, TaskType.ROUMEN_MASO)
-			case _: raise ValueError(f"Invalid view type '{view_source}'.")
+		task_def = get_view_task_def(view_source)
 
-		items = app_context.repository_persistent.read_recent_task_items(
-			task_def,
-			app_context.config.listing_limits.images
-		)
+		etag = get_validator(app_context.repository_persistent.read_change_marker(task_def))
+		if (not_modified := get_not_modified_response(etag, app_context.config.http_cache.view)) is not None:
+			return not_modified
+
+		task_items, next_pk_id = read_view_items_page(task_def, get_page_cursor("before"))
+		base_path = get_archive_base_path()
 
 		page_data.update({
-			"base_path": url_for("static", filename=app_context.config.scrappers.storage_path_for_static),
-			"task_items": [item for item in items if item.destination_path is not None]
+			"base_path": base_path,
+			"task_items": task_items,
+			"image_sources": get_image_sources(base_path, task_items),
+			"first_page": url_for("page_view", view_source=view_source),
+			"next_page": None if next_pk_id is None else url_for("page_view", view_source=view_source, before=next_pk_id),
+			"next_page_json": None if next_pk_id is None else url_for("api_view", view_source=view_source, before=next_pk_id),
 		})
 
-		return render_template("view.html", page_data=page_data)
+		return with_validator(render_template("view.html", page_data=page_data), etag, app_context.config.http_cache.view)
 	except Exception as ex:
 		return render_exception_page(ex, page_data=page_data)
 
 
+@app.route("/api/state/<repository>/")
+def api_state_tasks(repository: str):
+	app_context = get_app_context()
+	try:
+		repo = get_repository(repository)
+
+		etag = get_validator(repo.read_change_marker())
+		if (not_modified := get_not_modified_response(etag, app_context.config.http_cache.api)) is not None:
+			return not_modified
+
+		tasks, next_pk_id = read_tasks_page(repo, get_page_cursor("before"))
+		return with_validator(jsonify({
+			"tasks": [task_as_json(task) for task in tasks],
+			"next": None if next_pk_id is None else url_for("api_state_tasks", repository=repository, before=next_pk_id),
+		}), etag, app_context.config.http_cache.api)
+	except Exception as ex:
+		return render_exception_json(ex)
+
+
+@app.route("/api/state/<repository>/<task_id>/")
+def api_state_task_items(repository: str, task_id: int):
+	app_context = get_app_context()
+	try:
+		repo = get_repository(repository)
+
+		etag = get_validator(repo.read_change_marker())
+		if (not_modified := get_not_modified_response(etag, app_context.config.http_cache.api)) is not None:
+			return not_modified
+
+		task_items, next_pk_id = read_task_items_page(repo, load_task(repo, repository, task_id), get_page_cursor("after"))
+		return with_validator(jsonify({
+			"task_items": [task_item_as_json(task_item) for task_item in task_items],
+			"next": None if next_pk_id is None else url_for("api_state_task_items", repository=repository, task_id=task_id, after=next_pk_id),
+		}), etag, app_context.config.http_cache.api)
+	except Exception as ex:
+		return render_exception_json(ex)
+
+
+@app.route("/api/view/<view_source>/")
+def api_view(view_source: str):
+	app_context = get_app_context()
+	try:
+		task_def = get_view_task_def(view_source)
+
+		etag = get_validator(app_context.repository_persistent.read_change_marker(task_def))
+		if (not_modified := get_not_modified_response(etag, app_context.config.http_cache.api)) is not None:
+			return not_modified
+
+		task_items, next_pk_id = read_view_items_page(task_def, get_page_cursor("before"))
+		base_path = get_archive_base_path()
+		image_sources = get_image_sources(base_path, task_items)
+		return with_validator(jsonify({
+			"task_items": [
+				{
+					"pk_id": item.pk_id,
+					"item_name": item.item_name,
+					"date": str(item.start_as_timestamp),
+					"age": item.age,
+					**image_sources[item.destination_path],
+				}
+				for item in task_items
+			],
+			"next": None if next_pk_id is None else url_for("api_view", view_source=view_source, before=next_pk_id),
+		}), etag, app_context.config.http_cache.api)
+	except Exception as ex:
+		return render_exception_json(ex)
+
+
+@app.route("/events/<repository>/<task_id>/")
+def events_task(repository: str, task_id: int):
+	app_context = get_app_context()
+	progress_hub = app_context.progress_hub
+	if not str(task_id).isdigit():
+		abort(404)
+	progress_id = progress_hub.find(repository, int(task_id))
+	if progress_id is None:
+		# not a recent task, no content stops the event source reconnecting
+		return Response(status=204)
+
+	last_event_id = request.headers.get("Last-Event-ID", request.args.get("after", "")) or "0"
+	if not last_event_id.isdigit():
+		abort(400)
+	last_seq = int(last_event_id)
+	keep_alive_seconds = app_context.config.progress.keep_alive_seconds
+
+	def generate():
+		yield f"retry: {keep_alive_seconds * 1000}\n\n"
+		seq, finished = last_seq, False
+		while not finished:
+			events, finished = progress_hub.read(progress_id, seq, keep_alive_seconds)
+			if len(events) == 0 and not finished:
+				yield ": keep-alive\n\n"
+			for event in events:
+				seq = event["seq"]
+				yield f"id: {seq}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+		yield f"event: end\ndata: {{}}\n\n"
+
+	response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+	response.headers["Cache-Control"] = "no-cache"
+	response.headers["X-Accel-Buffering"] = "no"
+	return response
+
+
+@app.route("/metrics")
+def metrics():
+	app_context = get_app_context()
+	if app_context.metrics is None:
+		abort(404)
+	response = Response(app_context.metrics.registry.render(), content_type=METRICS_CONTENT_TYPE)
+	response.headers["Cache-Control"] = "no-store"
+	return response
+
+
+@app.route(f"{ARCHIVE_URL_PREFIX}<path:file_path>")
+def page_archive(file_path: str):
+	""" the scrapped files, served as immutable (conditional and range requests are handled by send_file) """
+	config = get_app_context().config
+	# no content store blobs, thumbnail temporaries or partial downloads
+	if any(part.startswith(".") for part in file_path.split("/")) or file_path.endswith(".part"):
+		abort(404)
+
+	match config.archive.sendfile_mode:
+		case ArchiveSendfileMode.X_ACCEL_REDIRECT:
+			if not os.path.isfile(os.path.join(config.scrappers.storage_path, file_path)):
+				abort(404)
+			# the front proxy streams the file from its internal location, validators and ranges included
+			# (it decodes the uri, so the names with spaces, '?', '%' or non-ascii characters are quoted)
+			response = Response(mimetype=mimetypes.guess_type(file_path)[0] or "application/octet-stream")
+			response.headers["X-Accel-Redirect"] = urllib.parse.quote(config.archive.x_accel_redirect_prefix + file_path)
+		case _:
+			# X-Sendfile is sent by send_file itself (USE_X_SENDFILE)
+			response = send_from_directory(
+				os.path.abspath(config.scrappers.storage_path),
+				file_path,
+				conditional=True,
+				etag=True,
+				max_age=config.archive.max_age_seconds
+			)
+
+	response.cache_control.public = True
+	response.cache_control.max_age = config.archive.max_age_seconds
+	response.cache_control.immutable = True
+	return response
+
+
 @app.route("/throw_error")
 def page_throw_error():
 	page_data = get_page_data()
@@ -229,8 +576,17 @@ def render_exception_page(ex: Exception, page_data: dict):
 	return render_template("exception.html", page_data=page_data)
 
 
-def init_app_context(flask_app: Flask) -> AppContext:
-	ctx = AppContext.create(flask_app=flask_app, config_file=CONFIG_FILE)
+def render_exception_json(ex: Exception):
+	match ex:
+		case TaskNotFoundError(): status = 404
+		# the invalid parameters of the request
+		case ValueError() | KeyError(): status = 400
+		case _: status = 500
+	return jsonify({"exception": {"type": ex.__class__.__name__, "value": str(ex)}}), status
+
+
+def init_app_context(flask_app: Flask, start_scheduler: bool = True) -> AppContext:
+	ctx = AppContext.create(flask_app=flask_app, config_file=CONFIG_FILE, start_scheduler=start_scheduler)
 
 	ctx.logger.info(f"App context created using config '{CONFIG_FILE}'.")
 	ctx.logger.debug(f"{ctx.config=}")
@@ -241,12 +597,20 @@ def init_app_context(flask_app: Flask) -> AppContext:
 	if ctx.config.server.port is None:
 		raise ValueError(f"Server port not specified in '{CONFIG_FILE}'")
 
+	# the first cpu_percent(None) call only starts the measurement
+	psutil.cpu_percent(None)
+
+	flask_app.config["USE_X_SENDFILE"] = ctx.config.archive.sendfile_mode == ArchiveSendfileMode.X_SENDFILE
+
 	flask_app.ctx = ctx
 	return ctx
 
 
 if __name__ == "__main__":
-	ctx = init_app_context(app)
+	# with the reloader (debug) the app is served by a child process, the parent just watches the files
+	ctx = init_app_context(app, start_scheduler=False)
+	if ctx.scheduler is not None and (is_running_from_reloader() or not ctx.config.server.debug):
+		ctx.scheduler.start()
 
 	app.run(
 		host=ctx.config.server.host,
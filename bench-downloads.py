@@ -0,0 +1,141 @@
+"""
+TaskRoumen download throughput benchmark against a local stub HTTP server.
+usage: python bench-downloads.py [image_count] [latency_ms] [image_size_kb]
+"""
+
+import logging
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from mcancellation import CancellationToken
+from mconfig import ConfigScrapperRoumen, ConfigHttpClient, ConfigRetry
+from mhttpclient import HttpClient
+from mmetrics import AppMetrics
+from mrepository import RepositoryInMemory, RepositorySqlite3
+from mrepository_entities import TaskClassAndType, TaskClass, TaskType
+from mrepository_installer import RepositoryInstaller
+from mscrappers_api import TaskEventDispatcher
+from mscrappers_eventhandlers import TaskEventRepositoryWriter, TaskEventMetrics
+from mscrappertaskfactory import TaskRoumen
+from mretryqueue import RetryQueue
+from mseenindex import SeenItemIndex
+from msqlite_api import SqliteApi
+
+WORKER_COUNTS = (1, 4, 16)
+
+
+def create_stub_server(image_count: int, latency_seconds: float, image_size: int) -> ThreadingHTTPServer:
+	listing = "".join(f'<a href="/roumingShow.php?file=image_{i:05d}.jpg">image {i}</a>\n' for i in range(image_count))
+	listing = f"<html><body>{listing}</body></html>".encode("utf-8")
+	image = bytes(i % 256 for i in range(image_size))
+
+	class _StubHandler(BaseHTTPRequestHandler):
+		def do_GET(self):
+			if self.path.startswith("/upload/"):
+				time.sleep(latency_seconds)
+				body, content_type = image, "image/jpeg"
+			else:
+				body, content_type = listing, "text/html; charset=utf-8"
+			self.send_response(200)
+			self.send_header("Content-Type", content_type)
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+			pass
+
+	server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+
+def run_task(logger: logging.Logger, http_client: HttpClient, base_url: str, image_count: int, download_workers: int) -> tuple[float, int, int]:
+	task_def = TaskClassAndType(TaskClass.SCRAP, TaskType.ROUMEN_KECY)
+	config_scrapper = ConfigScrapperRoumen(
+		request_timeout_seconds=10,
+		request_chunk_size=8196,
+		base_url=base_url,
+		img_base=f"{base_url}/upload",
+		href_needle="roumingShow.php",
+		download_workers=download_workers,
+	)
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		sqlite_api = SqliteApi(logger, str(Path(tmp_dir) / "bench.sqlite3"))
+		metrics = AppMetrics()
+		sqlite_api.add_observer(metrics.observe_sql)
+		RepositoryInstaller(sqlite_api).upgrade()
+		repository_persistent = RepositorySqlite3(logger, sqlite_api)
+		repository_in_memory = RepositoryInMemory(logger)
+
+		task = TaskRoumen(
+			TaskEventDispatcher((
+				TaskEventRepositoryWriter(repository_in_memory, task_def),
+				TaskEventRepositoryWriter(repository_persistent, task_def),
+				TaskEventMetrics(metrics, task_def, str(Path(tmp_dir) / "scrap") + "/"),
+			)),
+			CancellationToken(),
+			logger,
+			task_def,
+			config_scrapper,
+			str(Path(tmp_dir) / "scrap") + "/",
+			repository_persistent,
+			SeenItemIndex(logger, repository_persistent, image_count),
+			RetryQueue(logger, repository_persistent, ConfigRetry()),
+			http_client,
+			None
+		)
+
+		ts_start = time.perf_counter()
+		task()
+		elapsed = time.perf_counter() - ts_start
+
+		task_entity = repository_in_memory.read_recent_tasks_all(1).pop()
+		return elapsed, task_entity.item_count_success, task_entity.item_count_fail
+
+
+def main():
+	image_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+	latency_ms = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+	image_size_kb = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+
+	logging.basicConfig(level=logging.CRITICAL)
+	logger = logging.getLogger("bench")
+
+	server = create_stub_server(image_count, latency_ms / 1000, image_size_kb * 1024)
+	base_url = f"http://127.0.0.1:{server.server_address[1]}"
+	print(f"{image_count} images, {latency_ms}ms server latency, {image_size_kb}kB per image")
+
+	try:
+		for download_workers in WORKER_COUNTS:
+			# a client per run, the download slots of the host are set by its first task
+			http_client = HttpClient(logger, ConfigHttpClient(
+				pool_connections=1,
+				pool_maxsize=max(WORKER_COUNTS),
+				keep_alive=True,
+				retry_total=0,
+				retry_backoff_factor=0,
+				retry_status_forcelist=[],
+			))
+			try:
+				elapsed, succeeded, failed = run_task(logger, http_client, base_url, image_count, download_workers)
+			finally:
+				http_client.close()
+			print(
+				f"workers: {download_workers:>3}"
+				f", time: {elapsed:7.2f}s"
+				f", throughput: {succeeded / elapsed:8.1f} images/s"
+				f", succ/fail: {succeeded}/{failed}"
+			)
+	finally:
+		server.shutdown()
+
+
+if __name__ == "__main__":
+	main()
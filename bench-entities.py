@@ -0,0 +1,124 @@
+"""
+task item mapping and rendering benchmark, plain dataclasses with "select *" vs. the slotted entities.
+usage: python bench-entities.py [row_count]
+"""
+
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import jinja2
+
+from mformatters import Formatter, TimestampFormat
+from mrepository import RepositorySqlite3
+from mrepository_entities import MTaskE, MTaskItemE, TaskStatusEnum
+from mrepository_installer import RepositoryInstaller
+from msqlite_api import SqliteApi
+
+# the task item columns of the state page
+TEMPLATE = jinja2.Template(
+	"{% for i in items %}<tr><td>{{ i.item_name }}</td><td>{{ i.start_date }}</td><td>{{ i.age }}</td><td>{{ i.time_taken }}</td></tr>{% endfor %}"
+)
+
+
+@dataclass
+class _PlainTaskItemE:
+	""" the entity before, every property parses the timestamps again """
+	pk_id: int | None
+	ref_id: int | None
+	task_id: int
+	ts_start: str
+	ts_end: str | None
+	status: str
+	item_name: str
+	destination_path: str | None
+	exception_type: str | None
+	exception_value: str | None
+	sync_status: str
+
+	@property
+	def start_as_timestamp(self) -> datetime | None:
+		return Formatter.str_to_ts_safe(TimestampFormat.DATETIME_MS, self.ts_start, None)
+
+	@property
+	def start_date(self) -> datetime | None:
+		return Formatter.ts_to_str(TimestampFormat.DATETIME, self.start_as_timestamp)
+
+	@property
+	def end_as_timestamp(self) -> datetime | None:
+		return Formatter.str_to_ts_safe(TimestampFormat.DATETIME_MS, self.ts_end, None)
+
+	@property
+	def age(self) -> str:
+		s = self.start_as_timestamp
+		return Formatter.NOT_AVAILABLE_STR if s is None else Formatter.ts_diff_to_str(s, datetime.now(), False)
+
+	@property
+	def time_taken(self) -> str:
+		s, e = self.start_as_timestamp, self.end_as_timestamp
+		return Formatter.NOT_AVAILABLE_STR if None in (s, e) else Formatter.ts_diff_to_str(s, e, False)
+
+
+def populate(repository: RepositorySqlite3, row_count: int) -> MTaskE:
+	ts = datetime.now() - timedelta(days=1)
+	task = MTaskE(None, "scrap", "roumen_kecy", Formatter.ts_to_str(TimestampFormat.DATETIME_MS, ts), None, TaskStatusEnum.COMPLETED.value, row_count, 0, None, None)
+	repository.save_entities([task])
+	repository.save_entities([
+		MTaskItemE(
+			None, None, task.pk_id,
+			Formatter.ts_to_str(TimestampFormat.DATETIME_MS, ts + timedelta(seconds=i)),
+			Formatter.ts_to_str(TimestampFormat.DATETIME_MS, ts + timedelta(seconds=i, milliseconds=350)),
+			TaskStatusEnum.COMPLETED.value, f"image_{i:06d}.jpg", None, None, None, "not_synced"
+		)
+		for i in range(row_count)
+	])
+	return task
+
+
+def measure(name: str, read, row_count: int):
+	tracemalloc.start()
+	items = read()
+	mapped_memory, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del items
+
+	ts_start = time.perf_counter()
+	items = read()
+	ts_mapped = time.perf_counter()
+	html = TEMPLATE.render(items=items)
+	ts_rendered = time.perf_counter()
+	print(
+		f"{name:>8}: mapping {(ts_mapped - ts_start) * 1000:7.0f}ms"
+		f", rendering {(ts_rendered - ts_mapped) * 1000:7.0f}ms"
+		f", entities {mapped_memory / row_count:5.0f}B/row"
+		f", html {len(html) / 1024:.0f}kB"
+	)
+
+
+def main():
+	row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	logger = logging.getLogger("bench")
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		sqlite_api = SqliteApi(logger, str(Path(tmp_dir) / "bench.sqlite3"))
+		RepositoryInstaller(sqlite_api).upgrade()
+		repository = RepositorySqlite3(logger, sqlite_api)
+		task = populate(repository, row_count)
+		print(f"{row_count} task items")
+
+		measure("before", lambda: sqlite_api.read(
+			"select * from task_item where task_id=:task_id order by pk_id asc",
+			{"task_id": task.pk_id},
+			lambda rs: _PlainTaskItemE(*rs)
+		), row_count)
+		measure("after", lambda: repository.read_task_items(task), row_count)
+		sqlite_api.close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,66 @@
+"""
+link extractors benchmark over saved source pages (both extractors must return identical names).
+usage: python bench-extractors.py [--needle roumingShow.php] [--encoding utf-8] [--repeat 20] page.html [page.html ...]
+without any page a synthetic one is generated.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from mlinkextractors import LinkExtractorType, create_link_extractor
+
+
+def synthetic_page(href_needle: str, link_count: int = 1000) -> bytes:
+	rows = []
+	for i in range(link_count):
+		rows.append(
+			f'<tr><td class="n"><a href="{href_needle}?file=image_{i:05d}.jpg&amp;x=1" title="image {i}">image {i}</a></td>'
+			f'<td><img src="/thumbs/{i}.jpg" alt="" /></td><td><a href="/profile.php?id={i}">author {i}</a></td>'
+			f'<td><span class="c">comment {i}</span></td></tr>'
+		)
+	return f'<html><head><title>bench</title></head><body><table>{"".join(rows)}</table></body></html>'.encode("utf-8")
+
+
+def measure(content: bytes, encoding: str, href_needle: str, repeat: int) -> dict:
+	results = {}
+	for extractor_type in LinkExtractorType:
+		extractor = create_link_extractor(extractor_type, href_needle)
+		ts_start = time.perf_counter()
+		for _ in range(repeat):
+			names = extractor.extract(content, encoding)
+		results[extractor_type] = ((time.perf_counter() - ts_start) / repeat, names)
+	return results
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--needle", default="roumingShow.php")
+	parser.add_argument("--encoding", default="utf-8")
+	parser.add_argument("--repeat", type=int, default=20)
+	parser.add_argument("pages", nargs="*")
+	args = parser.parse_args()
+
+	pages = [(p, Path(p).read_bytes()) for p in args.pages] if len(args.pages) > 0 else [("(synthetic)", synthetic_page(args.needle))]
+
+	all_identical = True
+	for page_name, content in pages:
+		results = measure(content, args.encoding, args.needle, args.repeat)
+		soup_time, soup_names = results[LinkExtractorType.SOUP]
+		streaming_time, streaming_names = results[LinkExtractorType.STREAMING]
+		identical = soup_names == streaming_names
+		all_identical &= identical
+		print(
+			f"{page_name}: {len(content) / 1024:.0f}kB, {len(soup_names)} names"
+			f", soup: {soup_time * 1000:.2f}ms"
+			f", streaming: {streaming_time * 1000:.2f}ms"
+			f", speedup: {soup_time / streaming_time:.1f}x"
+			f", identical: {identical}"
+		)
+
+	if not all_identical:
+		raise SystemExit("Extractors returned different names.")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,94 @@
+import threading
+import time
+import weakref
+from typing import Dict
+
+
+class TaskCancelledError(Exception):
+	pass
+
+
+class TaskTimeoutError(TaskCancelledError):
+	pass
+
+
+class CancellationToken(object):
+	"""
+	cooperative cancellation, the tasks check it between the items and while the item is transferred.
+	a token is cancelled explicitly, by its time budget or by its parent (a task token for the item tokens).
+	"""
+
+	def __init__(self, timeout_seconds: float | None = None, parent: "CancellationToken | None" = None, event=None, started: bool = True):
+		# the event may be a manager proxy, to cancel in a worker process
+		self._event = threading.Event() if event is None else event
+		self._timeout_seconds = timeout_seconds
+		self._deadline = None
+		self._parent = parent
+		self._reason = None
+		if started:
+			self.start()
+
+	def start(self) -> None:
+		""" the time budget runs from now (a queued task is cancellable, but its budget starts when it runs) """
+		self._deadline = None if self._timeout_seconds is None else time.monotonic() + self._timeout_seconds
+
+	def cancel(self, reason: str = "Cancelled.") -> None:
+		self._reason = reason
+		self._event.set()
+
+	def child(self, timeout_seconds: float | None = None) -> "CancellationToken":
+		return CancellationToken(timeout_seconds, self)
+
+	@property
+	def remaining_seconds(self) -> float | None:
+		remaining = None if self._deadline is None else max(0.0, self._deadline - time.monotonic())
+		parent_remaining = None if self._parent is None else self._parent.remaining_seconds
+		if None in (remaining, parent_remaining):
+			return remaining if parent_remaining is None else parent_remaining
+		return min(remaining, parent_remaining)
+
+	@property
+	def is_cancel_requested(self) -> bool:
+		""" cancelled explicitly (not by the time budget) """
+		return self._event.is_set() or (self._parent is not None and self._parent.is_cancel_requested)
+
+	@property
+	def is_cancelled(self) -> bool:
+		try:
+			self.raise_if_cancelled()
+			return False
+		except TaskCancelledError:
+			return True
+
+	def raise_if_cancelled(self) -> None:
+		if self._parent is not None:
+			self._parent.raise_if_cancelled()
+		if self._event.is_set():
+			raise TaskCancelledError(self._reason or "Cancelled.")
+		if self._deadline is not None and time.monotonic() > self._deadline:
+			raise TaskTimeoutError(f"Time budget of {self._timeout_seconds}s exceeded.")
+
+
+class TaskCancellations(object):
+	"""
+	tokens of the queued and running tasks by the (repository type, task id) of their entities,
+	held weakly, a token goes away with its task.
+	"""
+
+	def __init__(self):
+		self._tokens: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+		self._lock = threading.Lock()
+
+	def register(self, aliases: Dict[str, int | None], token: CancellationToken) -> None:
+		with self._lock:
+			for repository_type, task_id in aliases.items():
+				if task_id is not None:
+					self._tokens[(repository_type, int(task_id))] = token
+
+	def cancel(self, repository_type: str, task_id: int, reason: str = "Cancelled by user.") -> bool:
+		with self._lock:
+			token = self._tokens.get((repository_type, int(task_id)), None)
+		if token is None:
+			return False
+		token.cancel(reason)
+		return True
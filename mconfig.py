@@ -1,6 +1,9 @@
 from dataclasses import dataclass, field
 from dataclass_wizard import YAMLWizard
-from typing import Dict
+from enum import Enum
+from typing import Dict, List
+
+from mlinkextractors import LinkExtractorType
 
 
 @dataclass
@@ -17,14 +20,115 @@ class ConfigServer:
 	debug: bool
 
 
+@dataclass
+class ConfigSqlProfiler:
+	# off by default, the timing and the lock are paid by every statement
+	enabled: bool = False
+	# statements over the threshold are logged with their query plan
+	slow_query_ms: float = 100
+	# recent calls per statement (for the p95)
+	samples: int = 200
+	max_statements: int = 200
+
+
 @dataclass
 class ConfigPersistence:
 	sqlite_datafile: str
+	connection_pool_size: int = 4
+	journal_mode: str = "wal"
+	synchronous: str = "normal"
+	cache_size: int = -16000
+	mmap_size: int = 0
+	temp_store: str = "default"
+	busy_timeout_ms: int = 5000
+	write_behind: bool = False
+	write_behind_batch_size: int = 200
+	write_behind_flush_interval_seconds: float = 2.0
+	profiler: ConfigSqlProfiler | None = None
+
+	@property
+	def pragmas(self) -> Dict[str, str | int]:
+		return {
+			"journal_mode": self.journal_mode,
+			"busy_timeout": self.busy_timeout_ms,
+			"synchronous": self.synchronous,
+			"cache_size": self.cache_size,
+			"mmap_size": self.mmap_size,
+			"temp_store": self.temp_store,
+		}
+
+
+@dataclass
+class ConfigHttpCache:
+	# Cache-Control of the listings, they are validated by (weak) ETag (except the state page)
+	state: str
+	view: str
+	api: str
+
+
+class ArchiveSendfileMode(Enum):
+	NONE = "none"  # the bytes are sent by the app
+	X_SENDFILE = "x-sendfile"  # apache / lighttpd
+	X_ACCEL_REDIRECT = "x-accel-redirect"  # nginx, internal location of the storage path
+
+
+@dataclass
+class ConfigArchive:
+	# the archive files never change once written
+	max_age_seconds: int = 31536000
+	sendfile_mode: ArchiveSendfileMode = ArchiveSendfileMode.NONE
+	x_accel_redirect_prefix: str = "/internal-scrap/"
+
+
+@dataclass
+class ConfigProgress:
+	# live progress of the recent tasks, served as server-sent events
+	max_tasks: int = 50
+	events_per_task: int = 200
+	keep_alive_seconds: int = 15
+
+
+@dataclass
+class ConfigMetrics:
+	# prometheus text format on /metrics
+	enabled: bool = True
+
+
+@dataclass
+class ConfigSchedulerSource:
+	interval_seconds: int
+	min_interval_seconds: int
+	max_interval_seconds: int
+	initial_delay_seconds: int = 60
+
+
+@dataclass
+class ConfigScheduler:
+	enabled: bool = False
+	jitter: float = 0.1
+	# the intervals adapt to find about this many new items per fetch
+	target_new_items: float = 10
+	smoothing: float = 0.5
+	roumen_kecy: ConfigSchedulerSource | None = None
+	roumen_maso: ConfigSchedulerSource | None = None
+	# held by the process running the scheduler, defaults to the sqlite datafile with the ".scheduler.lock" suffix
+	lock_file: str | None = None
+
+
+@dataclass
+class ConfigExecutorLane:
+	max_workers: int
+	max_queued: int
+	# task type -> priority within the lane, the lower runs first
+	task_types: Dict[str, int] = field(default_factory=dict)
 
 
 @dataclass
 class ConfigWorkerThread:
+	# the default lane, for the task types without a lane
 	max_workers: int
+	max_queued: int = 100
+	lanes: Dict[str, ConfigExecutorLane] = field(default_factory=dict)
 
 
 @dataclass
@@ -34,10 +138,47 @@ class ConfigRepositoryLimits:
 	select_fallback: int
 
 
+@dataclass
+class ConfigRepositoryInMemory:
+	max_tasks: int
+	max_task_items: int
+
+
 @dataclass
 class ConfigListingLimits:
+	# page sizes
 	images: int
 	scraps: int
+	task_items: int
+	retries: int = 500  # per retry / dead-letter queue
+
+
+@dataclass
+class ConfigHttpClient:
+	pool_connections: int
+	pool_maxsize: int
+	keep_alive: bool
+	retry_total: int
+	retry_backoff_factor: float
+	retry_status_forcelist: List[int]
+
+
+@dataclass
+class ConfigRateLimit:
+	requests_per_second: float
+	burst: int = 1
+
+	def __post_init__(self):
+		# checked when the config is loaded, not in the download threads
+		if not self.requests_per_second > 0:
+			raise ValueError(f"Rate limit requests_per_second must be positive, got {self.requests_per_second}.")
+
+
+@dataclass
+class ConfigCircuitBreaker:
+	# consecutive failures (connection errors, timeouts, 5xx and 429 responses) opening the circuit
+	failure_threshold: int = 5
+	cooldown_seconds: float = 60
 
 
 @dataclass
@@ -48,6 +189,48 @@ class ConfigScrapperRoumen:
 	img_base: str
 	href_needle: str
 	url_params: Dict[str, str] = field(default_factory=dict)
+	# concurrent downloads of the image host, shared by the tasks (the first task of the host sets it)
+	download_workers: int = 1
+	request_connect_timeout_seconds: float = 5
+	skip_unchanged_page: bool = True
+	link_extractor: LinkExtractorType = LinkExtractorType.SOUP
+	# time budgets, the task (or the item) is cancelled when exceeded
+	task_timeout_seconds: float | None = None
+	item_timeout_seconds: float | None = None
+	# per host, shared by the tasks
+	rate_limit: ConfigRateLimit | None = None
+	circuit_breaker: ConfigCircuitBreaker | None = None
+
+	@property
+	def request_timeout(self) -> tuple[float, float]:
+		return self.request_connect_timeout_seconds, self.request_timeout_seconds
+
+
+@dataclass
+class ConfigThumbnails:
+	widths: List[int]
+	formats: List[str] = field(default_factory=lambda: ["jpeg"])  # jpeg, webp
+	quality: int = 80
+	workers: int = 2
+	path: str = "thumbs/"  # relative to the scrappers storage path
+	extensions: List[str] = field(default_factory=lambda: [".jpg", ".jpeg", ".png", ".webp"])
+
+
+@dataclass
+class ConfigYoutubeDl:
+	# downloads in worker processes, off the gil of the web process
+	process_pool: bool = False
+	process_workers: int = 1
+	task_timeout_seconds: float | None = None
+	item_timeout_seconds: float | None = None
+
+
+@dataclass
+class ConfigRetry:
+	# a failed item is retried by the next tasks after the backoff (doubled per attempt), dead after max_attempts
+	max_attempts: int = 5
+	backoff_base_seconds: float = 600
+	backoff_max_seconds: float = 86400
 
 
 @dataclass
@@ -56,6 +239,11 @@ class ConfigScrappers:
 	storage_path_for_static: str
 	roumen_kecy: ConfigScrapperRoumen
 	roumen_maso: ConfigScrapperRoumen
+	seen_item_cache_size: int = 20000
+	content_store_path: str | None = None
+	thumbnails: ConfigThumbnails | None = None
+	youtube_dl: ConfigYoutubeDl = field(default_factory=ConfigYoutubeDl)
+	retry: ConfigRetry = field(default_factory=ConfigRetry)
 
 
 @dataclass
@@ -66,6 +254,13 @@ class Config(YAMLWizard):
 	server: ConfigServer
 	persistence: ConfigPersistence
 	repository_limits: ConfigRepositoryLimits
+	repository_in_memory: ConfigRepositoryInMemory
 	listing_limits: ConfigListingLimits
+	http_cache: ConfigHttpCache
+	archive: ConfigArchive
+	progress: ConfigProgress
+	scheduler: ConfigScheduler
 	worker_thread: ConfigWorkerThread
+	http_client: ConfigHttpClient
 	scrappers: ConfigScrappers
+	metrics: ConfigMetrics = field(default_factory=ConfigMetrics)
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import shutil
+from logging import Logger
+from pathlib import Path
+
+
+class ContentStore(object):
+	"""
+	content addressed blob storage, every distinct content is stored just once as "{store}/{ab}/{cd}/{hash}".
+	the archive paths are hardlinks to the blobs (copies, when the filesystem can't hardlink).
+	"""
+
+	HASH_ALGORITHM = "sha256"
+
+	def __init__(self, logger: Logger, store_path: str):
+		self._logger = logger
+		self._store_path = Path(store_path)
+
+	@staticmethod
+	def new_hasher():
+		return hashlib.new(ContentStore.HASH_ALGORITHM)
+
+	def blob_path(self, digest: str) -> Path:
+		return self._store_path / digest[:2] / digest[2:4] / digest
+
+	def store_file(self, source_file: Path, digest: str, destination_file: Path) -> bool:
+		"""
+		moves the (already hashed) source file into the store and links the destination file to the blob.
+		returns True, when the same content has been stored before.
+		"""
+		blob = self.blob_path(digest)
+		blob.parent.mkdir(parents=True, exist_ok=True)
+
+		try:
+			# linking fails on existing blob, so this is also an atomic "store if absent"
+			os.link(source_file, blob)
+			duplicate = False
+		except FileExistsError:
+			duplicate = True
+		except OSError as ex:
+			self._logger.warning(f"Can't hardlink '{source_file!s}' into the store ({ex!s}), copying.")
+			if blob.exists():
+				duplicate = True
+			else:
+				shutil.copyfile(source_file, blob)
+				duplicate = False
+
+		self._logger.debug(f"Content {digest} {'already stored' if duplicate else 'stored'}, linking '{destination_file!s}'.")
+		self._link(blob, destination_file)
+		os.unlink(source_file)
+		return duplicate
+
+	def _link(self, blob: Path, destination_file: Path):
+		# link under a temporary name first, so the destination is replaced atomically
+		destination_tmp = destination_file.with_name(f".{destination_file.name}.link")
+		destination_tmp.unlink(missing_ok=True)
+		try:
+			os.link(blob, destination_tmp)
+		except OSError as ex:
+			self._logger.warning(f"Can't hardlink '{destination_file!s}' to the store ({ex!s}), copying.")
+			shutil.copyfile(blob, destination_tmp)
+		os.replace(destination_tmp, destination_file)
@@ -1,15 +1,30 @@
-from concurrent.futures import ThreadPoolExecutor
+import atexit
 from dataclasses import dataclass
 from datetime import datetime
 from logging import Logger, basicConfig, getLogger
 
 from flask import Flask
 
+from mcancellation import TaskCancellations
 from mconfig import Config
+from mcontentstore import ContentStore
+from mexecutorlanes import ExecutorLanes
 from mformatters import Formatter
+from mmetrics import AppMetrics
+from mprocesspool import ProcessTaskRunner
+from mprogress import TaskProgressHub
+from mhttpclient import HttpClient
 from mrepository import RepositoryFactory, RepositoryType, Repository
+from mrepository_entities import TaskClassAndType, TaskClass, TaskType
+from mrepository_installer import RepositoryInstaller
+from mrepository_writebehind import RepositoryWriteBehind
+from mretryqueue import RetryQueue
+from mscheduler import TaskDispatcher, ScrapScheduler
 from mscrappertaskfactory import TaskFactory
+from mseenindex import SeenItemIndex
+from mthumbnails import Thumbnailer, is_available as is_thumbnailer_available
 from msqlite_api import SqliteApi
+from msqlprofiler import SqlProfiler
 
 
 @dataclass
@@ -20,11 +35,21 @@ class AppContext(object):
 	config: Config
 	repository_persistent: Repository
 	repository_in_memory: Repository
+	repository_write_behind: RepositoryWriteBehind | None
+	http_client: HttpClient
+	thumbnailer: Thumbnailer | None
+	progress_hub: TaskProgressHub
+	retry_queue: RetryQueue
+	task_cancellations: TaskCancellations
 	task_factory: TaskFactory
-	task_executor: ThreadPoolExecutor
+	executor_lanes: ExecutorLanes
+	task_dispatcher: TaskDispatcher
+	scheduler: ScrapScheduler | None
+	metrics: AppMetrics | None
+	sql_profiler: SqlProfiler | None
 
 	@classmethod
-	def create(cls, flask_app: Flask, config_file: str):
+	def create(cls, flask_app: Flask, config_file: str, start_scheduler: bool = True):
 
 		config = Config.from_yaml_file(config_file)
 
@@ -37,14 +62,111 @@ class AppContext(object):
 		logger.info(f"Logger created with level '{config.logger.level}'.")
 		logger.info(f"Config '{config_file}' loaded.")
 
-		repository_factory = RepositoryFactory(
-			logger.getChild("repository"),
-			SqliteApi(logger.getChild("sqlite3"), config.persistence.sqlite_datafile)
+		sql_profiler = None
+		if config.persistence.profiler is not None and config.persistence.profiler.enabled:
+			sql_profiler = SqlProfiler(logger.getChild("sqlite3.profiler"), config.persistence.profiler)
+
+		sqlite_api = SqliteApi(
+			logger.getChild("sqlite3"),
+			config.persistence.sqlite_datafile,
+			config.persistence.connection_pool_size,
+			config.persistence.pragmas,
+			sql_profiler
 		)
 
+		metrics = None
+		if config.metrics.enabled:
+			metrics = AppMetrics()
+			sqlite_api.add_observer(metrics.observe_sql)
+
+		RepositoryInstaller(sqlite_api, logger.getChild("installer")).upgrade()
+
+		repository_factory = RepositoryFactory(logger.getChild("repository"), sqlite_api, config.repository_in_memory)
+
 		repository_persistent = repository_factory.create(RepositoryType.PERSISTENT)
 		repository_in_memory = repository_factory.create(RepositoryType.IN_MEMORY)
 
+		repository_write_behind = None
+		if config.persistence.write_behind:
+			repository_write_behind = RepositoryWriteBehind(
+				logger.getChild("write_behind"),
+				repository_persistent,
+				config.persistence.write_behind_batch_size,
+				config.persistence.write_behind_flush_interval_seconds
+			)
+			# the writer thread is a daemon, the queued entities are written at exit
+			atexit.register(repository_write_behind.close)
+
+		http_client = HttpClient(logger.getChild("http"), config.http_client)
+
+		content_store = None
+		if config.scrappers.content_store_path is not None:
+			content_store = ContentStore(logger.getChild("content_store"), config.scrappers.content_store_path)
+
+		thumbnailer = None
+		if config.scrappers.thumbnails is not None:
+			if is_thumbnailer_available():
+				thumbnailer = Thumbnailer(
+					logger.getChild("thumbnailer"),
+					config.scrappers.thumbnails,
+					config.scrappers.storage_path,
+					repository_persistent
+				)
+				atexit.register(thumbnailer.close)
+			else:
+				logger.warning("Thumbnails configured, but Pillow is not installed, images are shown in the original size.")
+
+		process_runner = None
+		if config.scrappers.youtube_dl.process_pool:
+			process_runner = ProcessTaskRunner(logger.getChild("process_pool"), config.logger, config.scrappers.youtube_dl.process_workers)
+			atexit.register(process_runner.close)
+
+		progress_hub = TaskProgressHub(config.progress.max_tasks, config.progress.events_per_task)
+		task_cancellations = TaskCancellations()
+		retry_queue = RetryQueue(logger.getChild("retry_queue"), repository_persistent, config.scrappers.retry)
+
+		task_factory = TaskFactory(
+			logger.getChild("task"),
+			config,
+			repository_persistent,
+			repository_in_memory,
+			repository_write_behind,
+			SeenItemIndex(logger.getChild("seen_index"), repository_persistent, config.scrappers.seen_item_cache_size),
+			retry_queue,
+			http_client,
+			content_store,
+			thumbnailer,
+			progress_hub,
+			process_runner,
+			task_cancellations,
+			metrics
+		)
+		executor_lanes = ExecutorLanes(logger.getChild("lanes"), config.worker_thread)
+		# the lane workers are daemons, the running (and queued) tasks are finished at exit,
+		# the exit handlers run in the reverse order (the scheduler first, the write-behind writer last)
+		atexit.register(executor_lanes.shutdown)
+		task_dispatcher = TaskDispatcher(logger.getChild("dispatcher"), executor_lanes)
+		if metrics is not None:
+			metrics.registry.add_collector(lambda: metrics.collect_lanes(executor_lanes.stats()))
+
+		scheduler = None
+		if config.scheduler.enabled:
+			scheduler = ScrapScheduler(
+				logger.getChild("scheduler"),
+				config.scheduler,
+				task_dispatcher,
+				config.scheduler.lock_file or f"{config.persistence.sqlite_datafile}.scheduler.lock"
+			)
+			for task_def, config_source, create_task in (
+				(TaskClassAndType(TaskClass.SCRAP, TaskType.ROUMEN_KECY), config.scheduler.roumen_kecy, task_factory.create_task_roumen_kecy),
+				(TaskClassAndType(TaskClass.SCRAP, TaskType.ROUMEN_MASO), config.scheduler.roumen_maso, task_factory.create_task_roumen_maso),
+			):
+				if config_source is not None:
+					scheduler.add_source(task_def, config_source, create_task)
+			if start_scheduler:
+				scheduler.start()
+			atexit.register(scheduler.close)
+
 		return cls(
 			app=flask_app,
 			start_time=datetime.now(),
@@ -52,8 +174,18 @@ class AppContext(object):
 			config=config,
 			repository_persistent=repository_persistent,
 			repository_in_memory=repository_in_memory,
-			task_factory=TaskFactory(logger.getChild("task"), config, repository_persistent, repository_in_memory),
-			task_executor=ThreadPoolExecutor(max_workers=config.worker_thread.max_workers),
+			repository_write_behind=repository_write_behind,
+			http_client=http_client,
+			thumbnailer=thumbnailer,
+			progress_hub=progress_hub,
+			retry_queue=retry_queue,
+			task_cancellations=task_cancellations,
+			task_factory=task_factory,
+			executor_lanes=executor_lanes,
+			task_dispatcher=task_dispatcher,
+			scheduler=scheduler,
+			metrics=metrics,
+			sql_profiler=sql_profiler,
 		)
 
 	@property
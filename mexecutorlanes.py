@@ -0,0 +1,126 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+from logging import Logger
+from typing import Callable, Dict, List, Tuple
+
+from mconfig import ConfigWorkerThread
+from mrepository_entities import TaskClassAndType
+
+DEFAULT_LANE = "default"
+
+
+class LaneFullError(Exception):
+	pass
+
+
+class ExecutorLane(object):
+	"""
+	fixed pool of worker threads over a bounded priority queue (lower priority runs first, fifo within a priority).
+	"""
+
+	_STOP = object()
+
+	def __init__(self, logger: Logger, name: str, max_workers: int, max_queued: int):
+		self._logger = logger
+		self.name = name
+		self.max_workers = max(1, max_workers)
+		self.max_queued = max_queued
+		self._queue = queue.PriorityQueue()
+		self._sequence = itertools.count()
+		self._lock = threading.Lock()
+		self._queued = 0
+		self._active = 0
+		self._completed = 0
+		self._threads: List[threading.Thread] = []
+
+	def submit(self, create_task: Callable[[], Callable], priority: int = 0) -> Future:
+		""" the task is created only when the lane accepts it (creating a task records it as new) """
+		with self._lock:
+			if self._queued >= self.max_queued:
+				raise LaneFullError(f"Executor lane '{self.name}' is full ({self._queued} queued).")
+			self._queued += 1
+			if len(self._threads) < self.max_workers:
+				thread = threading.Thread(target=self._run, name=f"lane-{self.name}-{len(self._threads)}", daemon=True)
+				self._threads.append(thread)
+				thread.start()
+		try:
+			fn = create_task()
+		except Exception:
+			with self._lock:
+				self._queued -= 1
+			raise
+		future = Future()
+		self._queue.put((priority, next(self._sequence), future, fn))
+		return future
+
+	def _run(self) -> None:
+		while True:
+			_, _, future, fn = self._queue.get()
+			if future is ExecutorLane._STOP:
+				break
+			with self._lock:
+				self._queued -= 1
+				self._active += 1
+			try:
+				if future.set_running_or_notify_cancel():
+					try:
+						future.set_result(fn())
+					except BaseException as ex:
+						self._logger.exception(f"Task failed in lane '{self.name}'.")
+						future.set_exception(ex)
+			finally:
+				with self._lock:
+					self._active -= 1
+					self._completed += 1
+
+	def stats(self) -> Dict[str, int | str]:
+		with self._lock:
+			return {
+				"name": self.name,
+				"max_workers": self.max_workers,
+				"max_queued": self.max_queued,
+				"queued": self._queued,
+				"active": self._active,
+				"completed": self._completed,
+			}
+
+	def shutdown(self) -> None:
+		# after the queued tasks (the stop marker sorts last)
+		for _ in self._threads:
+			self._queue.put((float("inf"), next(self._sequence), ExecutorLane._STOP, None))
+		for thread in self._threads:
+			thread.join()
+
+
+class ExecutorLanes(object):
+	"""
+	named executor lanes, the tasks are routed to the lanes by their type (with the priority of the type),
+	so e.g. a long download cannot hold up the scraps. the types not configured go to the default lane.
+	"""
+
+	def __init__(self, logger: Logger, config: ConfigWorkerThread):
+		self._logger = logger
+		self._lanes: Dict[str, ExecutorLane] = {
+			DEFAULT_LANE: ExecutorLane(logger.getChild(DEFAULT_LANE), DEFAULT_LANE, config.max_workers, config.max_queued),
+		}
+		self._routes: Dict[str, Tuple[ExecutorLane, int]] = {}
+		for name, config_lane in config.lanes.items():
+			lane = ExecutorLane(logger.getChild(name), name, config_lane.max_workers, config_lane.max_queued)
+			self._lanes[name] = lane
+			for task_type, priority in config_lane.task_types.items():
+				self._routes[task_type] = (lane, priority)
+		self._logger.info(f"Executor lanes: {', '.join(f'{l.name} ({l.max_workers})' for l in self._lanes.values())}.")
+
+	def submit(self, task_def: TaskClassAndType, create_task: Callable[[], Callable]) -> Future:
+		lane, priority = self._routes.get(task_def.typ.value, (self._lanes[DEFAULT_LANE], 0))
+		self._logger.debug(f"Task '{task_def}' queued in lane '{lane.name}' with priority {priority}.")
+		return lane.submit(create_task, priority)
+
+	def stats(self) -> List[Dict[str, int | str]]:
+		return [lane.stats() for lane in self._lanes.values()]
+
+	def shutdown(self) -> None:
+		for lane in self._lanes.values():
+			lane.shutdown()
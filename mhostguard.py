@@ -0,0 +1,154 @@
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+
+from mcancellation import CancellationToken
+from mconfig import ConfigRateLimit, ConfigCircuitBreaker
+
+
+class CircuitOpenError(Exception):
+	pass
+
+
+class CircuitState(Enum):
+	CLOSED = "closed"
+	OPEN = "open"
+	HALF_OPEN = "half-open"
+
+
+class TokenBucket(object):
+	""" at most burst requests at once, refilled by rate per second """
+
+	def __init__(self, rate: float, burst: int):
+		if not rate > 0:
+			raise ValueError(f"Rate must be positive, got {rate}.")
+		self._rate = rate
+		self._burst = max(1, burst)
+		self._tokens = float(self._burst)
+		self._ts_refill = time.monotonic()
+		self._lock = threading.Lock()
+
+	def acquire(self) -> None:
+		while True:
+			with self._lock:
+				now = time.monotonic()
+				self._tokens = min(self._burst, self._tokens + (now - self._ts_refill) * self._rate)
+				self._ts_refill = now
+				if self._tokens >= 1:
+					self._tokens -= 1
+					return
+				wait = (1 - self._tokens) / self._rate
+			time.sleep(wait)
+
+
+class CircuitBreaker(object):
+	"""
+	opens after failure_threshold consecutive failures, the requests fail fast then.
+	after the cooldown a single probe request is let through (half-open), its result closes or opens the circuit again.
+	"""
+
+	def __init__(self, failure_threshold: int, cooldown_seconds: float):
+		self._failure_threshold = max(1, failure_threshold)
+		self._cooldown_seconds = cooldown_seconds
+		self._state = CircuitState.CLOSED
+		self._failures = 0
+		self._ts_opened = 0.0
+		self._lock = threading.Lock()
+
+	@property
+	def state(self) -> CircuitState:
+		return self._state
+
+	@property
+	def is_open(self) -> bool:
+		""" open and still cooling down (no probe due), or the probe is in flight """
+		with self._lock:
+			match self._state:
+				case CircuitState.OPEN:
+					return time.monotonic() < self._ts_opened + self._cooldown_seconds
+				case CircuitState.HALF_OPEN:
+					return True
+				case _:
+					return False
+
+	def allow_request(self) -> bool:
+		with self._lock:
+			match self._state:
+				case CircuitState.CLOSED:
+					return True
+				case CircuitState.OPEN if time.monotonic() >= self._ts_opened + self._cooldown_seconds:
+					self._state = CircuitState.HALF_OPEN
+					return True
+				case _:
+					# open, or the probe is in flight
+					return False
+
+	def record_success(self) -> None:
+		with self._lock:
+			self._state = CircuitState.CLOSED
+			self._failures = 0
+
+	def record_failure(self) -> None:
+		with self._lock:
+			self._failures += 1
+			if self._state == CircuitState.HALF_OPEN or self._failures >= self._failure_threshold:
+				self._state = CircuitState.OPEN
+				self._ts_opened = time.monotonic()
+
+
+class HostGuard(object):
+	""" rate limit, circuit breaker and concurrent downloads of a single host, shared by all the tasks talking to it """
+
+	def __init__(
+			self,
+			host: str,
+			rate_limit: ConfigRateLimit | None,
+			circuit_breaker: ConfigCircuitBreaker | None,
+			max_downloads: int | None = None
+	):
+		self.host = host
+		self._bucket = None if rate_limit is None else TokenBucket(rate_limit.requests_per_second, rate_limit.burst)
+		self._breaker = None if circuit_breaker is None else CircuitBreaker(circuit_breaker.failure_threshold, circuit_breaker.cooldown_seconds)
+		self._downloads = None if max_downloads is None else threading.BoundedSemaphore(max(1, max_downloads))
+
+	@property
+	def is_open(self) -> bool:
+		return self._breaker is not None and self._breaker.is_open
+
+	@property
+	def state(self) -> CircuitState:
+		return CircuitState.CLOSED if self._breaker is None else self._breaker.state
+
+	def limit_downloads(self, max_downloads: int) -> None:
+		# for a guard created by a plain request first, an existing limit is kept
+		if self._downloads is None:
+			self._downloads = threading.BoundedSemaphore(max(1, max_downloads))
+
+	@contextmanager
+	def download_slot(self, cancellation_token: CancellationToken):
+		""" held for a whole download (the streamed response included), the waiting ends when cancelled """
+		downloads = self._downloads
+		if downloads is None:
+			yield
+			return
+		while not downloads.acquire(timeout=1):
+			cancellation_token.raise_if_cancelled()
+		try:
+			yield
+		finally:
+			downloads.release()
+
+	def before_request(self) -> None:
+		if self._breaker is not None and not self._breaker.allow_request():
+			raise CircuitOpenError(f"Circuit of host '{self.host}' is open, request not sent.")
+		if self._bucket is not None:
+			self._bucket.acquire()
+
+	def record_success(self) -> None:
+		if self._breaker is not None:
+			self._breaker.record_success()
+
+	def record_failure(self) -> None:
+		if self._breaker is not None:
+			self._breaker.record_failure()
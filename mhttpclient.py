@@ -0,0 +1,103 @@
+import threading
+from http import HTTPStatus
+from logging import Logger
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from mconfig import ConfigHttpClient, ConfigRateLimit, ConfigCircuitBreaker
+from mhostguard import HostGuard
+
+
+class HttpClient(object):
+	"""
+	shared http client, all the scrappers go through one pooled session,
+	so the connections (and tls sessions) to the same host are reused
+	"""
+
+	RETRY_METHODS = frozenset({"GET", "HEAD"})
+	# the responses counted as failures of the host by its circuit breaker
+	FAILURE_STATUSES = frozenset({HTTPStatus.TOO_MANY_REQUESTS} | {s for s in HTTPStatus if s >= 500})
+
+	def __init__(self, logger: Logger, config: ConfigHttpClient):
+		self._logger = logger
+		self._config = config
+		self._session = requests.Session()
+		self._host_guards: Dict[str, HostGuard] = {}
+		self._host_guards_lock = threading.Lock()
+
+		retry = Retry(
+			total=config.retry_total,
+			backoff_factor=config.retry_backoff_factor,
+			status_forcelist=tuple(config.retry_status_forcelist),
+			allowed_methods=HttpClient.RETRY_METHODS,
+			raise_on_status=False,
+		)
+
+		adapter = HTTPAdapter(
+			pool_connections=config.pool_connections,
+			pool_maxsize=config.pool_maxsize,
+			pool_block=True,
+			max_retries=retry,
+		)
+
+		self._session.mount("http://", adapter)
+		self._session.mount("https://", adapter)
+
+		if not config.keep_alive:
+			self._session.headers["Connection"] = "close"
+
+		self._logger.info(f"Http client created (pool connections: {config.pool_connections}, pool size: {config.pool_maxsize}, retries: {config.retry_total}).")
+
+	def get_host_guard(
+			self,
+			url: str,
+			rate_limit: ConfigRateLimit | None,
+			circuit_breaker: ConfigCircuitBreaker | None,
+			max_downloads: int | None = None
+	) -> HostGuard:
+		""" one guard per host, shared by all the tasks (the first configuration of the host is used) """
+		host = urlsplit(url).netloc
+		with self._host_guards_lock:
+			if host not in self._host_guards:
+				self._host_guards[host] = HostGuard(host, rate_limit, circuit_breaker, max_downloads)
+			elif max_downloads is not None:
+				self._host_guards[host].limit_downloads(max_downloads)
+			return self._host_guards[host]
+
+	def get(
+			self,
+			url: str,
+			timeout: float | tuple[float, float],
+			rate_limit: ConfigRateLimit | None = None,
+			circuit_breaker: ConfigCircuitBreaker | None = None,
+			**kwargs
+	) -> requests.Response:
+		guard = None
+		if rate_limit is not None or circuit_breaker is not None:
+			guard = self.get_host_guard(url, rate_limit, circuit_breaker)
+			# fails fast (CircuitOpenError) while the host is down, waits for the rate limit otherwise
+			guard.before_request()
+
+		self._logger.debug(f"GET {url}")
+		try:
+			response = self._session.get(url, timeout=timeout, **kwargs)
+		except Exception:
+			# any failure, so a half-open circuit (a probe in flight) is always resolved
+			if guard is not None:
+				guard.record_failure()
+			raise
+
+		if guard is not None:
+			if response.status_code in HttpClient.FAILURE_STATUSES:
+				guard.record_failure()
+			else:
+				guard.record_success()
+		return response
+
+	def close(self):
+		self._logger.info(f"Closing http client.")
+		self._session.close()
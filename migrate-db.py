@@ -4,7 +4,7 @@ from pathlib import Path
 import sqlite3
 from typing import List
 
-from mrepository import Repository, _Table
+from mrepository import RepositorySqlite3, _Table
 from mrepository_entities import *
 from mrepository_installer import RepositoryInstaller
 from msqlite_api import SqliteApi
@@ -79,11 +79,15 @@ def migrate():
 	dst_db = SqliteApi(logger,"sql/medow.sqlite3", False, {})
 
 	print("Initializing repository...")
-	repository = Repository(logger, dst_db)
+	repository = RepositorySqlite3(logger, dst_db)
 
 	def drop_tables(c: sqlite3.Cursor):
 		c.execute("DROP TABLE IF EXISTS " + _Table.TASK.value)
 		c.execute("DROP TABLE IF EXISTS " + _Table.TASK_ITEM.value)
+		# derived from the tasks and the items
+		c.execute("DROP TABLE IF EXISTS " + _Table.SEEN_ITEM.value)
+		c.execute("DROP TABLE IF EXISTS " + _Table.CHANGE_MARKER.value)
+		c.execute("DROP TABLE IF EXISTS schema_version")
 
 	print("Dropping tables...")
 	dst_db.do_with_cursor(drop_tables)
@@ -94,7 +98,8 @@ def migrate():
 	dst_db.do_with_cursor(reset_autoincrement_counters)
 
 	print("Creating tables...")
-	RepositoryInstaller(dst_db).create_tables()
+	installer = RepositoryInstaller(dst_db)
+	installer.upgrade()
 
 	print("Migrating scrap tasks...")
 	tasks = []
@@ -198,6 +203,10 @@ def migrate():
 	for task_item in task_items:
 		repository.save_entity(task_item, False)
 
+	# the installer seeded the seen names from the empty tables
+	print("Seeding seen item names...")
+	installer.seed_seen_items()
+
 	print("Done.")
 
 
@@ -0,0 +1,72 @@
+import urllib.parse
+from abc import ABC, abstractmethod
+from enum import Enum
+from html.parser import HTMLParser
+from typing import List
+
+import bs4
+
+
+class LinkExtractorType(Enum):
+	SOUP = "soup"
+	STREAMING = "streaming"
+
+
+class LinkExtractor(ABC):
+	""" extracts the "file" query values of all the "a" links having href_needle in the href path """
+
+	def __init__(self, href_needle: str):
+		self._href_needle = href_needle
+
+	@abstractmethod
+	def extract(self, content: bytes, encoding: str) -> List[str]:
+		pass
+
+	def _file_names_from_hrefs(self, hrefs) -> List[str]:
+		all_urls = map(urllib.parse.urlparse, hrefs)
+		all_show = [url for url in all_urls if isinstance(url.path, str) and self._href_needle in url.path]
+		all_qstr = [urllib.parse.parse_qs(url.query) for url in all_show]
+		return [qs.get("file").pop() for qs in all_qstr if "file" in qs]
+
+
+class LinkExtractorSoup(LinkExtractor):
+	""" builds the complete document tree """
+
+	def extract(self, content: bytes, encoding: str) -> List[str]:
+		soup = bs4.BeautifulSoup(content.decode(encoding), features="html.parser")
+		return self._file_names_from_hrefs(a.get("href") for a in soup.find_all("a"))
+
+
+class _AnchorHrefParser(HTMLParser):
+	def __init__(self, href_needle: str):
+		super().__init__(convert_charrefs=True)
+		self._href_needle = href_needle
+		self.hrefs = []
+
+	def handle_starttag(self, tag, attrs):
+		if tag != "a":
+			return
+		# the last one of duplicate "href" attributes wins, same as in the document tree
+		href = None
+		for name, value in attrs:
+			if name == "href":
+				href = value
+		if href is not None and self._href_needle in href:
+			self.hrefs.append(href)
+
+
+class LinkExtractorStreaming(LinkExtractor):
+	""" event based parsing, only the "a" start tags with the needle in the href are looked at """
+
+	def extract(self, content: bytes, encoding: str) -> List[str]:
+		parser = _AnchorHrefParser(self._href_needle)
+		parser.feed(content.decode(encoding))
+		parser.close()
+		return self._file_names_from_hrefs(parser.hrefs)
+
+
+def create_link_extractor(extractor_type: LinkExtractorType, href_needle: str) -> LinkExtractor:
+	match extractor_type:
+		case LinkExtractorType.SOUP: return LinkExtractorSoup(href_needle)
+		case LinkExtractorType.STREAMING: return LinkExtractorStreaming(href_needle)
+		case _: raise ValueError(f"Unknown link extractor type {extractor_type}.")
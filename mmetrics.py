@@ -0,0 +1,192 @@
+import bisect
+import math
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds, from a cached sql statement to a long download
+DEFAULT_BUCKETS = (0.001, 0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _escape_label_value(value: str) -> str:
+	return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+	if math.isinf(value):
+		return "+Inf" if value > 0 else "-Inf"
+	return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str | None = None) -> str:
+	labels = [f"{name}=\"{_escape_label_value(value)}\"" for name, value in zip(label_names, label_values)]
+	if extra is not None:
+		labels.append(extra)
+	return "{" + ",".join(labels) + "}" if len(labels) > 0 else ""
+
+
+class _CounterChild(object):
+	def __init__(self):
+		self._value = 0.0
+		self._lock = threading.Lock()
+
+	def inc(self, amount: float = 1) -> None:
+		with self._lock:
+			self._value += amount
+
+	def samples(self, name: str, label_names, label_values) -> List[str]:
+		return [f"{name}{_format_labels(label_names, label_values)} {_format_value(self._value)}"]
+
+
+class _GaugeChild(_CounterChild):
+	def set(self, value: float) -> None:
+		self._value = value
+
+	def dec(self, amount: float = 1) -> None:
+		self.inc(-amount)
+
+
+class _HistogramChild(object):
+	def __init__(self, buckets: Tuple[float, ...]):
+		self._buckets = buckets
+		self._counts = [0] * (len(buckets) + 1)
+		self._sum = 0.0
+		self._lock = threading.Lock()
+
+	def observe(self, value: float) -> None:
+		i = bisect.bisect_left(self._buckets, value)
+		with self._lock:
+			self._counts[i] += 1
+			self._sum += value
+
+	def samples(self, name: str, label_names, label_values) -> List[str]:
+		with self._lock:
+			counts, total_sum = list(self._counts), self._sum
+		lines = []
+		cumulative = 0
+		for bound, count in zip((*self._buckets, math.inf), counts):
+			cumulative += count
+			le = "le=\"" + _format_value(bound) + "\""
+			lines.append(f"{name}_bucket{_format_labels(label_names, label_values, le)} {cumulative}")
+		lines.append(f"{name}_sum{_format_labels(label_names, label_values)} {_format_value(total_sum)}")
+		lines.append(f"{name}_count{_format_labels(label_names, label_values)} {cumulative}")
+		return lines
+
+
+class _Metric(ABC):
+	typ = None
+
+	def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+		self.name = name
+		self._help_text = help_text
+		self._label_names = tuple(label_names)
+		self._children: Dict[Tuple[str, ...], object] = {}
+		self._lock = threading.Lock()
+
+	@abstractmethod
+	def _new_child(self):
+		pass
+
+	def labels(self, *label_values: str):
+		""" the child of the label values, keep it when updated in a loop """
+		child = self._children.get(label_values, None)
+		if child is None:
+			if len(label_values) != len(self._label_names):
+				raise ValueError(f"Metric '{self.name}' expects labels {self._label_names}, got {label_values}.")
+			with self._lock:
+				child = self._children.setdefault(label_values, self._new_child())
+		return child
+
+	def render(self) -> List[str]:
+		lines = [f"# HELP {self.name} {self._help_text}", f"# TYPE {self.name} {self.typ}"]
+		with self._lock:
+			children = list(self._children.items())
+		for label_values, child in children:
+			lines.extend(child.samples(self.name, self._label_names, label_values))
+		return lines
+
+
+class Counter(_Metric):
+	typ = "counter"
+
+	def _new_child(self):
+		return _CounterChild()
+
+
+class Gauge(_Metric):
+	typ = "gauge"
+
+	def _new_child(self):
+		return _GaugeChild()
+
+
+class Histogram(_Metric):
+	typ = "histogram"
+
+	def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+		super().__init__(name, help_text, label_names)
+		self._buckets = tuple(sorted(buckets))
+
+	def _new_child(self):
+		return _HistogramChild(self._buckets)
+
+
+class MetricsRegistry(object):
+	"""
+	counters, gauges and histograms rendered in the prometheus text format.
+	the updates are a dict lookup and a short lock, the collectors refresh the sampled gauges when rendered.
+	"""
+
+	def __init__(self, prefix: str):
+		self._prefix = prefix
+		self._metrics: List[_Metric] = []
+		self._collectors: List[Callable[[], None]] = []
+
+	def _register(self, metric: _Metric) -> _Metric:
+		self._metrics.append(metric)
+		return metric
+
+	def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+		return self._register(Counter(f"{self._prefix}_{name}", help_text, label_names))
+
+	def gauge(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+		return self._register(Gauge(f"{self._prefix}_{name}", help_text, label_names))
+
+	def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+		return self._register(Histogram(f"{self._prefix}_{name}", help_text, label_names, buckets))
+
+	def add_collector(self, collector: Callable[[], None]) -> None:
+		self._collectors.append(collector)
+
+	def render(self) -> str:
+		for collector in self._collectors:
+			collector()
+		lines = []
+		for metric in self._metrics:
+			lines.extend(metric.render())
+		return "\n".join(lines) + "\n"
+
+
+class AppMetrics(object):
+	""" the metrics of the app, updated by the task event handlers and the sqlite api """
+
+	def __init__(self, prefix: str = "medow"):
+		self.registry = MetricsRegistry(prefix)
+		self.tasks = self.registry.counter("tasks_total", "Finished tasks by the end status.", ("task_type", "status"))
+		self.task_duration = self.registry.histogram("task_duration_seconds", "Duration of the started tasks.", ("task_type",))
+		self.items = self.registry.counter("items_total", "Processed items by the end status.", ("task_type", "status"))
+		self.item_bytes = self.registry.counter("item_bytes_total", "Bytes transferred for the finished items.", ("task_type",))
+		self.item_duration = self.registry.histogram("item_duration_seconds", "Download latency of the items.", ("task_type",))
+		self.lane_queued = self.registry.gauge("executor_queued_tasks", "Tasks waiting in the executor lane.", ("lane",))
+		self.lane_active = self.registry.gauge("executor_active_tasks", "Tasks running in the executor lane.", ("lane",))
+		self.sql_duration = self.registry.histogram("sql_duration_seconds", "Latency of the sql calls (including the wait for a connection).", ("operation",))
+
+	def observe_sql(self, operation: str, seconds: float) -> None:
+		self.sql_duration.labels(operation).observe(seconds)
+
+	def collect_lanes(self, stats: List[Dict[str, int | str]]) -> None:
+		for lane_stats in stats:
+			self.lane_queued.labels(lane_stats["name"]).set(lane_stats["queued"])
+			self.lane_active.labels(lane_stats["name"]).set(lane_stats["active"])
@@ -0,0 +1,167 @@
+import logging
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from logging import Logger
+from typing import Any, Callable, Dict, Tuple
+
+from mcancellation import CancellationToken, TaskCancelledError, TaskTimeoutError
+from mconfig import ConfigLogger
+from mscrappers_api import TaskEvents
+
+_DONE = "done"
+
+
+def _init_process(log_format: str, log_level: str | int) -> None:
+	logging.basicConfig(format=log_format, level=log_level)
+
+
+def _marshal_exception(ex: Exception) -> Tuple[str, str]:
+	# the exceptions (their tracebacks) are not always picklable, the handlers record just the type name and the message
+	return ex.__class__.__name__, str(ex)
+
+
+# the ones the handlers tell apart keep their type
+_remote_exception_types: Dict[str, type] = {t.__name__: t for t in (TaskCancelledError, TaskTimeoutError)}
+
+
+def _unmarshal_exception(marshalled: Tuple[str, str]) -> Exception:
+	type_name, message = marshalled
+	if type_name not in _remote_exception_types:
+		_remote_exception_types[type_name] = type(type_name, (Exception,), {})
+	return _remote_exception_types[type_name](message)
+
+
+class TaskEventsQueueWriter(TaskEvents):
+	""" the task events of a worker process, passed over the queue to the handlers of the parent process """
+
+	def __init__(self, event_queue):
+		self._queue = event_queue
+
+	def on_new(self) -> None:
+		self._queue.put(("on_new", ()))
+
+	def on_start(self) -> None:
+		self._queue.put(("on_start", ()))
+
+	def on_finish(self) -> None:
+		self._queue.put(("on_finish", ()))
+
+	def on_error(self, ex: Exception) -> None:
+		self._queue.put(("on_error", (_marshal_exception(ex),)))
+
+	def on_item_start(self, item_name: str, ref_id: int | None = None) -> None:
+		self._queue.put(("on_item_start", (item_name, ref_id)))
+
+	def on_item_progress(self, description: str) -> None:
+		self._queue.put(("on_item_progress", (description,)))
+
+	def on_item_finish(self, destination_path: str | None, transferred_bytes: int | None = None) -> None:
+		self._queue.put(("on_item_finish", (destination_path, transferred_bytes)))
+
+	def on_item_error(self, ex: Exception) -> None:
+		self._queue.put(("on_item_error", (_marshal_exception(ex),)))
+
+
+def _run_in_process(event_queue, cancel_event, timeout_seconds: float | None, fn: Callable[..., Any], args: Tuple) -> Any:
+	try:
+		return fn(TaskEventsQueueWriter(event_queue), CancellationToken(timeout_seconds, event=cancel_event), *args)
+	finally:
+		event_queue.put((_DONE, ()))
+
+
+class SpawnedProcessPool(object):
+	""" a pool of worker processes started on the first submit, started again when a crashed worker broke it """
+
+	def __init__(self, logger: Logger, workers: int, initializer: Callable[..., None] | None = None, initargs: Tuple = ()):
+		self._logger = logger
+		self._workers = workers
+		self._initializer = initializer
+		self._initargs = initargs
+		self._executor = None
+		self._lock = threading.Lock()
+
+	def _create_executor(self) -> ProcessPoolExecutor:
+		# spawned, forking the threaded web app is not safe
+		return ProcessPoolExecutor(
+			max_workers=self._workers,
+			mp_context=multiprocessing.get_context("spawn"),
+			initializer=self._initializer,
+			initargs=self._initargs
+		)
+
+	def submit(self, fn: Callable[..., Any], *args) -> Future:
+		with self._lock:
+			if self._executor is None:
+				self._executor = self._create_executor()
+			try:
+				return self._executor.submit(fn, *args)
+			except BrokenProcessPool:
+				# a crashed worker (e.g. killed on memory) breaks the whole pool, start a new one
+				self._logger.warning("Process pool broken, starting a new one.")
+				self._executor = self._create_executor()
+				return self._executor.submit(fn, *args)
+
+	def shutdown(self) -> None:
+		with self._lock:
+			if self._executor is not None:
+				self._executor.shutdown(wait=True)
+				self._executor = None
+
+
+class ProcessTaskRunner(object):
+	"""
+	runs the cpu heavy task bodies in a pool of worker processes (off the gil of the web process),
+	the task events come back over a queue and are replayed to the task's handlers in the calling thread.
+	"""
+
+	def __init__(self, logger: Logger, config_logger: ConfigLogger, workers: int):
+		self._logger = logger
+		self._pool = SpawnedProcessPool(logger, workers, _init_process, (config_logger.format, config_logger.level))
+		self._manager = None
+		self._lock = threading.Lock()
+
+	def _get_manager(self):
+		# manager queues and events, the plain ones cannot be passed to the pool workers
+		if self._manager is None:
+			self._manager = multiprocessing.get_context("spawn").Manager()
+		return self._manager
+
+	def run(self, event_handler: TaskEvents, cancellation_token: CancellationToken, fn: Callable[..., Any], *args) -> Any:
+		"""
+		calls fn(events, cancellation token, *args) in a worker process, fn must be picklable (a module level function)
+		and report through the events it gets. blocks until fn returns, its result is returned.
+		the worker's token gets the remaining time budget, the cancel requests are passed on.
+		"""
+		with self._lock:
+			event_queue = self._get_manager().Queue()
+			cancel_event = self._get_manager().Event()
+		future = self._pool.submit(_run_in_process, event_queue, cancel_event, cancellation_token.remaining_seconds, fn, args)
+
+		cancel_passed = False
+		while True:
+			if not cancel_passed and cancellation_token.is_cancel_requested:
+				cancel_event.set()
+				cancel_passed = True
+			try:
+				method, method_args = event_queue.get(timeout=1)
+			except queue.Empty:
+				# a killed worker never sends done
+				if future.done():
+					break
+				continue
+			if method == _DONE:
+				break
+			if method in ("on_error", "on_item_error"):
+				method_args = (_unmarshal_exception(method_args[0]),)
+			getattr(event_handler, method)(*method_args)
+		return future.result()
+
+	def close(self) -> None:
+		self._pool.shutdown()
+		with self._lock:
+			if self._manager is not None:
+				self._manager.shutdown()
+				self._manager = None
@@ -0,0 +1,102 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from enum import Enum
+from typing import Dict, List, Tuple
+
+from mformatters import Formatter, TimestampFormat
+
+
+class ProgressEventType(Enum):
+	NEW = "new"
+	START = "start"
+	FINISH = "finish"
+	ERROR = "error"
+	ITEM_START = "item_start"
+	ITEM_PROGRESS = "item_progress"
+	ITEM_FINISH = "item_finish"
+	ITEM_ERROR = "item_error"
+
+
+class _TaskProgress(object):
+	def __init__(self, progress_id: int, task_def: str, events_per_task: int):
+		self.progress_id = progress_id
+		self.task_def = task_def
+		self.events = deque(maxlen=events_per_task)
+		self.finished = False
+
+
+class TaskProgressHub(object):
+	"""
+	recent progress and lifecycle events of the recent tasks, bounded ring buffers per task.
+	a task is found by the (repository type, task id) aliases of its entities, the readers wait for the new events.
+	"""
+
+	def __init__(self, max_tasks: int, events_per_task: int):
+		self._max_tasks = max_tasks
+		self._events_per_task = events_per_task
+		self._tasks: OrderedDict[int, _TaskProgress] = OrderedDict()
+		self._aliases: Dict[Tuple[str, int], int] = {}
+		self._progress_ids = itertools.count(1)
+		# one sequence over all the tasks, the stream readers resume with the last one seen
+		self._sequence = itertools.count(1)
+		self._condition = threading.Condition()
+
+	def open(self, task_def: str, aliases: Dict[str, int | None]) -> int:
+		with self._condition:
+			progress_id = next(self._progress_ids)
+			self._tasks[progress_id] = _TaskProgress(progress_id, task_def, self._events_per_task)
+			for repository_type, task_id in aliases.items():
+				if task_id is not None:
+					self._aliases[(repository_type, int(task_id))] = progress_id
+			self._evict()
+			return progress_id
+
+	def _evict(self) -> None:
+		# the oldest finished tasks go first
+		for progress in list(self._tasks.values()):
+			if len(self._tasks) <= self._max_tasks:
+				break
+			if progress.finished:
+				del self._tasks[progress.progress_id]
+		self._aliases = {alias: progress_id for alias, progress_id in self._aliases.items() if progress_id in self._tasks}
+
+	def find(self, repository_type: str, task_id: int) -> int | None:
+		with self._condition:
+			return self._aliases.get((repository_type, int(task_id)), None)
+
+	def publish(self, progress_id: int, event_type: ProgressEventType, item_name: str | None = None, description: str | None = None) -> None:
+		with self._condition:
+			progress = self._tasks.get(progress_id, None)
+			if progress is None:
+				return
+			progress.events.append({
+				"seq": next(self._sequence),
+				"ts": Formatter.ts_to_str(TimestampFormat.DATETIME_MS),
+				"task": progress.task_def,
+				"type": event_type.value,
+				"item": item_name,
+				"description": description,
+			})
+			progress.finished = event_type in (ProgressEventType.FINISH, ProgressEventType.ERROR)
+			self._condition.notify_all()
+
+	def read(self, progress_id: int, after_seq: int = 0, timeout: float | None = None) -> Tuple[List[dict], bool]:
+		"""
+		events newer than after_seq, waits up to timeout seconds when there are none yet.
+		returns the events and whether the task is finished (or gone), so no more events are coming.
+		"""
+		deadline = None if timeout is None else time.monotonic() + timeout
+		with self._condition:
+			while True:
+				progress = self._tasks.get(progress_id, None)
+				if progress is None:
+					return [], True
+				events = [e for e in progress.events if e["seq"] > after_seq]
+				if len(events) > 0 or progress.finished:
+					return events, progress.finished
+				remaining = None if deadline is None else deadline - time.monotonic()
+				if remaining is not None and remaining <= 0:
+					return [], False
+				self._condition.wait(remaining)
@@ -3,12 +3,16 @@ persistent repository implementation.
 RepositoryFactory is in the end of the file.
 """
 
+import itertools
 import sqlite3
+import threading
+import time
 from abc import ABC, abstractmethod
 from dataclasses import asdict
 from logging import Logger
-from typing import List
+from typing import Dict, List, Set, Tuple
 
+from mconfig import ConfigRepositoryInMemory
 from mrepository_entities import *
 from msqlite_api import SqliteApi
 
@@ -21,6 +25,11 @@ class RepositoryType(Enum):
 class _Table(Enum):
 	TASK = "task"
 	TASK_ITEM = "task_item"
+	SEEN_ITEM = "seen_item"
+	SOURCE_STATE = "source_state"
+	ITEM_VARIANT = "item_variant"
+	ITEM_RETRY = "item_retry"
+	CHANGE_MARKER = "change_marker"
 
 	@staticmethod
 	def for_entity(entity: MTaskE | MTaskItemE) -> str:
@@ -29,6 +38,28 @@ class _Table(Enum):
 			case MTaskItemE(): return _Table.TASK_ITEM.value
 			case _: raise ValueError(f"Unknown entity {entity}.")
 
+	@staticmethod
+	def group_entities(entities: List[MTaskE | MTaskItemE]) -> Dict[str, List[MTaskE | MTaskItemE]]:
+		groups = {}
+		for entity in entities:
+			groups.setdefault(_Table.for_entity(entity), []).append(entity)
+		return groups
+
+
+# explicit column lists, so the rows map positionally onto the entities whatever the table column order is
+_TASK_COLUMNS = ", ".join(MTaskE.COLUMNS)
+_TASK_ITEM_COLUMNS = ", ".join(MTaskItemE.COLUMNS)
+_ITEM_RETRY_COLUMNS = ("task_type", "item_name", "status", "attempts", "ts_next", "exception_type", "exception_value", "ts_update")
+_TASK_ITEM_COLUMNS_TI = ", ".join(f"ti.{c}" for c in MTaskItemE.COLUMNS)
+
+
+def _task_row_mapper(rs) -> MTaskE:
+	return MTaskE(*rs)
+
+
+def _task_item_row_mapper(rs) -> MTaskItemE:
+	return MTaskItemE(*rs)
+
 
 class Repository(ABC):
 	@abstractmethod
@@ -39,23 +70,89 @@ class Repository(ABC):
 	def update_entity(self, entity: MTaskE | MTaskItemE) -> None:
 		pass
 
+	@abstractmethod
+	def save_entities(self, entities: List[MTaskE | MTaskItemE]) -> None:
+		""" saves all the entities at once, pk_id of every entity is set afterwards """
+		pass
+
+	@abstractmethod
+	def update_entities(self, entities: List[MTaskE | MTaskItemE]) -> None:
+		pass
+
 	@abstractmethod
 	def load_entity_task(self, pk_id: int) -> MTaskE | None:
 		pass
 
 	@abstractmethod
-	def read_recent_tasks_all(self, item_limit: int) -> List[MTaskE]:
+	def read_recent_tasks_all(self, item_limit: int, before_pk_id: int | None = None) -> List[MTaskE]:
+		""" newest first, before_pk_id is the pk_id of the last task of the previous page """
+		pass
+
+	@abstractmethod
+	def read_task_items(self, task_entity: MTaskE, item_limit: int | None = None, after_pk_id: int | None = None) -> List[MTaskItemE]:
+		""" oldest first, after_pk_id is the pk_id of the last item of the previous page """
+		pass
+
+	@abstractmethod
+	def read_recent_task_items(self, task_def: TaskClassAndType, item_limit: int, before_pk_id: int | None = None) -> List[MTaskItemE]:
+		""" completed items, newest first, before_pk_id is the pk_id of the last item of the previous page """
+		pass
+
+	@abstractmethod
+	def read_change_marker(self, task_def: TaskClassAndType | None = None) -> str:
+		"""
+		opaque value changing on every write of the tasks (or their items) of the task type (of all the tasks when None),
+		used as the validator of the listings
+		"""
+		pass
+
+	@abstractmethod
+	def read_seen_item_names(self, task_def: TaskClassAndType, item_names: List[str]) -> Set[str]:
+		""" returns the subset of item_names already seen (downloaded) for the task type """
+		pass
+
+	@abstractmethod
+	def save_seen_item_names(self, task_def: TaskClassAndType, item_names: List[str]) -> None:
+		pass
+
+	@abstractmethod
+	def load_source_state(self, task_def: TaskClassAndType) -> MSourceStateE | None:
+		pass
+
+	@abstractmethod
+	def save_source_state(self, entity: MSourceStateE) -> None:
+		pass
+
+	@abstractmethod
+	def read_item_variants(self, destination_paths: List[str]) -> Dict[str, List[MItemVariantE]]:
+		""" variants (thumbnails) by the destination path of the original, narrowest first """
+		pass
+
+	@abstractmethod
+	def save_item_variants(self, entities: List[MItemVariantE]) -> None:
+		pass
+
+	@abstractmethod
+	def read_item_retries(self, task_def: TaskClassAndType, item_names: List[str]) -> Dict[str, MItemRetryE]:
+		""" retry state of the failed items (out of item_names) by the item name """
+		pass
+
+	@abstractmethod
+	def read_recent_item_retries(self, status: str, item_limit: int) -> List[MItemRetryE]:
+		""" last updated first """
 		pass
 
 	@abstractmethod
-	def read_task_items(self, task_entity: MTaskE) -> List[MTaskItemE]:
+	def save_item_retry(self, entity: MItemRetryE) -> None:
 		pass
 
 	@abstractmethod
-	def read_recent_task_items(self, task_def: TaskClassAndType, item_limit: int) -> List[MTaskItemE]:
+	def delete_item_retry(self, task_def: TaskClassAndType, item_name: str) -> None:
 		pass
 
 class RepositorySqlite3(Repository):
+	IN_LIST_CHUNK = 500  # stay well below SQLITE_MAX_VARIABLE_NUMBER
+
 	def __init__(self, logger: Logger, sqlite_api: SqliteApi):
 		super().__init__()
 		self._logger = logger
@@ -66,10 +163,8 @@ class RepositorySqlite3(Repository):
 
 	def save_entity(self, entity: MTaskE | MTaskItemE, get_last_id: bool) -> int | None:
 		table_name = _Table.for_entity(entity)
-		entity_as_dict = asdict(entity)
-		col_names = ",".join(entity_as_dict.keys())
-		bind_names = ",".join((":" + c for c in entity_as_dict.keys()))
-		stmt = f"INSERT INTO {table_name}({col_names}) values ({bind_names})"
+		entity_as_dict = entity.as_row()
+		stmt = RepositorySqlite3._insert_stmt(table_name, entity.COLUMNS)
 
 		def _exec_without_id_return(con: sqlite3.Connection):
 			self._logger.debug(f"SQL: {stmt}, entity: {entity_as_dict}")
@@ -92,81 +187,278 @@ class RepositorySqlite3(Repository):
 		else:
 			return self._sqlite_api.do_with_connection(_exec_without_id_return)
 
+	@staticmethod
+	def _insert_stmt(table_name: str, column_names) -> str:
+		return f"INSERT INTO {table_name}({','.join(column_names)}) values ({','.join(':' + c for c in column_names)})"
+
+	@staticmethod
+	def _update_stmt(table_name: str, column_names) -> str:
+		# rename all value_mapping keys to "new_{key}" and where_condition_mapping keys to "whr_{key}"
+		# statement pattern:
+		# update table_name set col_a=:new_col_a, col_b=:new_col_b where col_c=:where_col_c and col_d=:where_col_d
+		stmt_set = ", ".join(map(lambda k: f"{k}=:new_{k}", column_names))
+		return f"update {table_name} set {stmt_set} where pk_id=:whr_pk_id"
+
+	@staticmethod
+	def _update_binds(entity: MTaskE | MTaskItemE) -> dict:
+		return {
+			**{f"new_{k}": getattr(entity, k) for k in entity.COLUMNS},
+			**{"whr_pk_id": entity.pk_id}
+		}
+
 	def update_entity(self, entity: MTaskE | MTaskItemE) -> None:
 		def _updater(conn: sqlite3.Connection):
-			# rename all value_mapping keys to "new_{key}" and where_condition_mapping keys to "whr_{key}"
-			# statement pattern:
-			# update table_name set col_a=:new_col_a, col_b=:new_col_b where col_c=:where_col_c and col_d=:where_col_d
 			table_name = _Table.for_entity(entity)
-			entity_as_dict = asdict(entity)
-			stmt_set = ", ".join(map(lambda k: f"{k}=:new_{k}", entity_as_dict.keys()))
-			stmt_whr = {
-				**{f"new_{k}": v for (k, v) in entity_as_dict.items()},
-				**{"whr_pk_id": entity.pk_id}
-			}
-			stmt = f"update {table_name} set {stmt_set} where pk_id=:whr_pk_id"
+			stmt_whr = RepositorySqlite3._update_binds(entity)
+			stmt = RepositorySqlite3._update_stmt(table_name, entity.COLUMNS)
 			self._logger.debug(f"SQL: {stmt}, WHR: {stmt_whr}")
 			conn.execute(stmt, stmt_whr)
 
 		self._logger.debug(f"Updating entity {entity.__class__.__name__}.")
 		self._sqlite_api.do_with_connection(_updater)
 
+	def save_entities(self, entities: List[MTaskE | MTaskItemE]) -> None:
+		if any(entity.pk_id is not None for entity in entities):
+			raise ValueError("Only new entities (without pk_id) can be saved in bulk.")
+
+		def _inserter(conn: sqlite3.Connection):
+			assigned_ids = []
+			for table_name, table_entities in _Table.group_entities(entities).items():
+				rows = [entity.as_row() for entity in table_entities]
+				stmt = RepositorySqlite3._insert_stmt(table_name, table_entities[0].COLUMNS)
+				self._logger.debug(f"SQL: {stmt}, {len(rows)} entities.")
+				conn.executemany(stmt, rows)
+				# the transaction holds the write lock, so the inserted rows got consecutive ids
+				last_id = conn.execute("select last_insert_rowid()").fetchone()[0]
+				assigned_ids.extend(zip(table_entities, range(last_id - len(rows) + 1, last_id + 1)))
+			return assigned_ids
+
+		self._logger.debug(f"Saving {len(entities)} entities.")
+		# ids are assigned after the commit only
+		for entity, pk_id in self._sqlite_api.do_with_connection(_inserter):
+			entity.pk_id = pk_id
+
+	def update_entities(self, entities: List[MTaskE | MTaskItemE]) -> None:
+		def _updater(conn: sqlite3.Connection):
+			for table_name, table_entities in _Table.group_entities(entities).items():
+				stmt = RepositorySqlite3._update_stmt(table_name, table_entities[0].COLUMNS)
+				self._logger.debug(f"SQL: {stmt}, {len(table_entities)} entities.")
+				conn.executemany(stmt, [RepositorySqlite3._update_binds(entity) for entity in table_entities])
+
+		self._logger.debug(f"Updating {len(entities)} entities.")
+		self._sqlite_api.do_with_connection(_updater)
+
 	def load_entity_task(self, pk_id: int) -> MTaskE | None:
 		self._logger.debug(f"Reading entity 'MTaskE' for pk_id '{pk_id}'.")
-		item = self._sqlite_api.read(
-			f"select * from {_Table.TASK.value} where pk_id=:pk_id",
+		items = self._sqlite_api.read(
+			f"select {_TASK_COLUMNS} from {_Table.TASK.value} where pk_id=:pk_id",
 			{"pk_id": pk_id},
-			lambda rs: MTaskE(*rs)
-		).pop()
-		self._logger.debug(f"Returning '{item.pk_id}' task.")
+			_task_row_mapper
+		)
+		item = items.pop() if len(items) > 0 else None
+		self._logger.debug(f"Returning '{None if item is None else item.pk_id}' task.")
 		return item
 
-	def read_recent_tasks_all(self, item_limit: int) -> List[MTaskE]:
-		self._logger.debug(f"Reading recent entities 'MTaskE' limited to {item_limit} items.")
+	def read_recent_tasks_all(self, item_limit: int, before_pk_id: int | None = None) -> List[MTaskE]:
+		self._logger.debug(f"Reading recent entities 'MTaskE' limited to {item_limit} items before '{before_pk_id}'.")
 		items = self._sqlite_api.read(
-			sql_stmt=f"select * from {_Table.TASK.value} order by pk_id desc limit :limit",
-			binds={"limit": item_limit},
-			row_mapper=lambda rs: MTaskE(*rs)
+			sql_stmt=f"""
+				select {_TASK_COLUMNS}
+				from {_Table.TASK.value}
+				{"" if before_pk_id is None else "where pk_id<:before_pk_id"}
+				order by pk_id desc
+				limit :limit""",
+			binds={"limit": item_limit, "before_pk_id": before_pk_id},
+			row_mapper=_task_row_mapper
 		)
 		self._logger.debug(f"Returning {len(items)} recent tasks.")
 		return items
 
-	def read_task_items(self, task_entity: MTaskE) -> List[MTaskItemE]:
-		self._logger.debug(f"Reading entities 'MScrapTaskItemE' for task entity '{task_entity.pk_id}.")
+	def read_task_items(self, task_entity: MTaskE, item_limit: int | None = None, after_pk_id: int | None = None) -> List[MTaskItemE]:
+		self._logger.debug(f"Reading entities 'MScrapTaskItemE' for task entity '{task_entity.pk_id}' limited to {item_limit} items after '{after_pk_id}'.")
 		items = self._sqlite_api.read(
-			sql_stmt=f"select * from {_Table.TASK_ITEM.value} where task_id=:task_id order by pk_id asc",
-			binds={"task_id": task_entity.pk_id},
-			row_mapper=lambda rs: MTaskItemE(*rs)
+			sql_stmt=f"""
+				select {_TASK_ITEM_COLUMNS}
+				from {_Table.TASK_ITEM.value}
+				where task_id=:task_id{"" if after_pk_id is None else " and pk_id>:after_pk_id"}
+				order by pk_id asc
+				limit :limit""",
+			binds={"task_id": task_entity.pk_id, "after_pk_id": after_pk_id, "limit": -1 if item_limit is None else item_limit},
+			row_mapper=_task_item_row_mapper
 		)
 		self._logger.debug(f"Returning {len(items)} task items.")
 		return items
 
-	def read_recent_task_items(self, task_def: TaskClassAndType, item_limit: int) -> List[MTaskItemE]:
-		self._logger.debug(f"Reading recent entities 'MTaskItemE' for task '{task_def}' limited to {item_limit} items.")
+	def read_recent_task_items(self, task_def: TaskClassAndType, item_limit: int, before_pk_id: int | None = None) -> List[MTaskItemE]:
+		self._logger.debug(f"Reading recent entities 'MTaskItemE' for task '{task_def}' limited to {item_limit} items before '{before_pk_id}'.")
 		items = self._sqlite_api.read(
 			sql_stmt=f"""
-				select ti.*
+				select {_TASK_ITEM_COLUMNS_TI}
 				from {_Table.TASK.value} t
 				inner join {_Table.TASK_ITEM.value} ti
 					on ti.task_id=t.pk_id and ti.status=:item_status
-				where t.task_class=:task_class and t.task_type=:task_type
+				where t.task_class=:task_class and t.task_type=:task_type{"" if before_pk_id is None else " and ti.pk_id<:before_pk_id"}
 				order by ti.pk_id desc
 				limit :limit""",
 			binds={
 				"task_class": task_def.cls.value,
 				"task_type": task_def.typ.value,
 				"item_status": TaskStatusEnum.COMPLETED.value,
+				"before_pk_id": before_pk_id,
 				"limit": item_limit
 			},
-			row_mapper=lambda rs: MTaskItemE(*rs)
+			row_mapper=_task_item_row_mapper
 		)
 		self._logger.debug(f"Returning {len(items)} recent task items.")
 
 		return items
 
+	def read_change_marker(self, task_def: TaskClassAndType | None = None) -> str:
+		name = "*" if task_def is None else task_def.typ.value
+		generations = self._sqlite_api.read(
+			sql_stmt=f"select generation from {_Table.CHANGE_MARKER.value} where name=:name",
+			binds={"name": name},
+			row_mapper=lambda rs: rs[0]
+		)
+		return f"{name}:{generations.pop() if len(generations) > 0 else 0}"
+
+	def read_seen_item_names(self, task_def: TaskClassAndType, item_names: List[str]) -> Set[str]:
+		self._logger.debug(f"Reading seen item names for task '{task_def}' out of {len(item_names)} names.")
+		seen_names = set()
+		unique_names = list(set(item_names))
+		for i in range(0, len(unique_names), RepositorySqlite3.IN_LIST_CHUNK):
+			chunk = unique_names[i:i + RepositorySqlite3.IN_LIST_CHUNK]
+			binds = {"task_type": task_def.typ.value, **{f"n{j}": name for j, name in enumerate(chunk)}}
+			seen_names.update(self._sqlite_api.read(
+				sql_stmt=f"""
+					select item_name
+					from {_Table.SEEN_ITEM.value}
+					where task_type=:task_type and item_name in ({",".join(f":n{j}" for j in range(len(chunk)))})""",
+				binds=binds,
+				row_mapper=lambda rs: rs[0]
+			))
+		self._logger.debug(f"Returning {len(seen_names)} seen item names.")
+		return seen_names
+
+	def save_seen_item_names(self, task_def: TaskClassAndType, item_names: List[str]) -> None:
+		stmt = f"insert or ignore into {_Table.SEEN_ITEM.value}(task_type, item_name) values (:task_type, :item_name)"
+
+		def _inserter(conn: sqlite3.Connection):
+			self._logger.debug(f"SQL: {stmt}, {len(item_names)} names.")
+			conn.executemany(stmt, [{"task_type": task_def.typ.value, "item_name": name} for name in item_names])
+
+		self._logger.debug(f"Saving {len(item_names)} seen item names for task '{task_def}'.")
+		self._sqlite_api.do_with_connection(_inserter)
+
+	def load_source_state(self, task_def: TaskClassAndType) -> MSourceStateE | None:
+		self._logger.debug(f"Reading entity 'MSourceStateE' for task '{task_def}'.")
+		items = self._sqlite_api.read(
+			sql_stmt=f"select task_type, etag, last_modified, content_hash, ts_update from {_Table.SOURCE_STATE.value} where task_type=:task_type",
+			binds={"task_type": task_def.typ.value},
+			row_mapper=lambda rs: MSourceStateE(*rs)
+		)
+		return items.pop() if len(items) > 0 else None
+
+	def save_source_state(self, entity: MSourceStateE) -> None:
+		entity_as_dict = asdict(entity)
+		col_names = ",".join(entity_as_dict.keys())
+		bind_names = ",".join((":" + c for c in entity_as_dict.keys()))
+		stmt = f"INSERT OR REPLACE INTO {_Table.SOURCE_STATE.value}({col_names}) values ({bind_names})"
+
+		def _upsert(conn: sqlite3.Connection):
+			self._logger.debug(f"SQL: {stmt}, entity: {entity_as_dict}")
+			conn.execute(stmt, entity_as_dict)
+
+		self._logger.debug(f"Saving entity {entity.__class__.__name__}.")
+		self._sqlite_api.do_with_connection(_upsert)
+
+	def read_item_variants(self, destination_paths: List[str]) -> Dict[str, List[MItemVariantE]]:
+		self._logger.debug(f"Reading entities 'MItemVariantE' for {len(destination_paths)} destination paths.")
+		variants = {}
+		unique_paths = list(set(destination_paths))
+		for i in range(0, len(unique_paths), RepositorySqlite3.IN_LIST_CHUNK):
+			chunk = unique_paths[i:i + RepositorySqlite3.IN_LIST_CHUNK]
+			for variant in self._sqlite_api.read(
+				sql_stmt=f"""
+					select destination_path, variant, path, width, height
+					from {_Table.ITEM_VARIANT.value}
+					where destination_path in ({",".join(f":p{j}" for j in range(len(chunk)))})
+					order by destination_path, width""",
+				binds={f"p{j}": path for j, path in enumerate(chunk)},
+				row_mapper=lambda rs: MItemVariantE(*rs)
+			):
+				variants.setdefault(variant.destination_path, []).append(variant)
+		self._logger.debug(f"Returning variants of {len(variants)} destination paths.")
+		return variants
+
+	def save_item_variants(self, entities: List[MItemVariantE]) -> None:
+		stmt = f"""INSERT OR REPLACE INTO {_Table.ITEM_VARIANT.value}(destination_path, variant, path, width, height)
+			values (:destination_path, :variant, :path, :width, :height)"""
+
+		def _upsert(conn: sqlite3.Connection):
+			self._logger.debug(f"SQL: {stmt}, {len(entities)} entities.")
+			conn.executemany(stmt, [asdict(entity) for entity in entities])
+
+		self._logger.debug(f"Saving {len(entities)} entities 'MItemVariantE'.")
+		if len(entities) > 0:
+			self._sqlite_api.do_with_connection(_upsert)
+
+	def read_item_retries(self, task_def: TaskClassAndType, item_names: List[str]) -> Dict[str, MItemRetryE]:
+		self._logger.debug(f"Reading entities 'MItemRetryE' for task '{task_def}' out of {len(item_names)} names.")
+		retries = {}
+		unique_names = list(set(item_names))
+		for i in range(0, len(unique_names), RepositorySqlite3.IN_LIST_CHUNK):
+			chunk = unique_names[i:i + RepositorySqlite3.IN_LIST_CHUNK]
+			for retry in self._sqlite_api.read(
+				sql_stmt=f"""
+					select {", ".join(_ITEM_RETRY_COLUMNS)}
+					from {_Table.ITEM_RETRY.value}
+					where task_type=:task_type and item_name in ({",".join(f":n{j}" for j in range(len(chunk)))})""",
+				binds={"task_type": task_def.typ.value, **{f"n{j}": name for j, name in enumerate(chunk)}},
+				row_mapper=lambda rs: MItemRetryE(*rs)
+			):
+				retries[retry.item_name] = retry
+		self._logger.debug(f"Returning {len(retries)} entities 'MItemRetryE'.")
+		return retries
+
+	def read_recent_item_retries(self, status: str, item_limit: int) -> List[MItemRetryE]:
+		self._logger.debug(f"Reading {item_limit} recent entities 'MItemRetryE' with status '{status}'.")
+		return self._sqlite_api.read(
+			sql_stmt=f"""
+				select {", ".join(_ITEM_RETRY_COLUMNS)}
+				from {_Table.ITEM_RETRY.value}
+				where status=:status
+				order by ts_update desc
+				limit :limit""",
+			binds={"status": status, "limit": item_limit},
+			row_mapper=lambda rs: MItemRetryE(*rs)
+		)
+
+	def save_item_retry(self, entity: MItemRetryE) -> None:
+		stmt = f"""INSERT OR REPLACE INTO {_Table.ITEM_RETRY.value}({", ".join(_ITEM_RETRY_COLUMNS)})
+			values ({", ".join(f":{c}" for c in _ITEM_RETRY_COLUMNS)})"""
+		entity_as_dict = asdict(entity)
+
+		def _upsert(conn: sqlite3.Connection):
+			self._logger.debug(f"SQL: {stmt}, entity: {entity_as_dict}")
+			conn.execute(stmt, entity_as_dict)
+
+		self._logger.debug(f"Saving entity {entity.__class__.__name__}.")
+		self._sqlite_api.do_with_connection(_upsert)
+
+	def delete_item_retry(self, task_def: TaskClassAndType, item_name: str) -> None:
+		stmt = f"DELETE FROM {_Table.ITEM_RETRY.value} WHERE task_type=:task_type AND item_name=:item_name"
+		binds = {"task_type": task_def.typ.value, "item_name": item_name}
+
+		def _delete(conn: sqlite3.Connection):
+			self._logger.debug(f"SQL: {stmt}, binds: {binds}")
+			conn.execute(stmt, binds)
+
+		self._sqlite_api.do_with_connection(_delete)
+
 class _RepositoryInMemoryTable(object):
 	def __init__(self):
-		self.data = {}
+		self.data = {}  # pk_id -> entity, in insertion (= pk_id) order
 		self.pk_id_sequence = 0
 
 	def get_next_id_if_none(self, existing_id: int):
@@ -177,10 +469,27 @@ class _RepositoryInMemoryTable(object):
 
 
 class RepositoryInMemory(Repository):
-	def __init__(self, logger: Logger):
+	"""
+	tasks and items of the current process, bounded by the capacity (the oldest finished tasks are evicted with their items).
+	items are indexed by task and by task class & type, so no read has to go through all the items.
+	"""
+
+	def __init__(self, logger: Logger, max_tasks: int = 1000, max_task_items: int = 100000):
 		self._logger = logger
+		self._max_tasks = max_tasks
+		self._max_task_items = max_task_items
+		self._lock = threading.RLock()
 		self._tasks = _RepositoryInMemoryTable()
 		self._task_items = _RepositoryInMemoryTable()
+		self._items_by_task: Dict[int, Dict[int, MTaskItemE]] = {}
+		self._items_by_task_def: Dict[tuple, Dict[int, MTaskItemE]] = {}
+		self._seen_item_names: Dict[str, Set[str]] = {}
+		self._source_states: Dict[str, MSourceStateE] = {}
+		self._item_variants: Dict[str, Dict[str, MItemVariantE]] = {}
+		self._item_retries: Dict[Tuple[str, str], MItemRetryE] = {}
+		# write generations per task type and for everything ("*"), the instance id tells apart the restarted process
+		self._instance_id = f"{id(self):x}.{time.time_ns():x}"
+		self._generations: Dict[str, int] = {}
 
 	def get_table_for_entity(self, entity: MTaskE | MTaskItemE) -> _RepositoryInMemoryTable:
 		match entity:
@@ -188,51 +497,194 @@ class RepositoryInMemory(Repository):
 			case MTaskItemE(): return self._task_items
 			case _: raise ValueError(f"Unknown entity {entity}.")
 
-	def save_entity(self, entity: MTaskE | MTaskItemE, get_last_id: bool) -> int | None:
-		self._logger.debug(f"Saving entity {entity.__class__.__name__}.")
+	def _task_def_key(self, task_id: int) -> tuple | None:
+		task = self._tasks.data.get(task_id, None)
+		return None if task is None else (task.task_class, task.task_type)
+
+	def _put(self, entity: MTaskE | MTaskItemE) -> None:
 		t = self.get_table_for_entity(entity)
 		entity.pk_id = t.get_next_id_if_none(entity.pk_id)
 		t.data[entity.pk_id] = entity
-		self._logger.debug(f"Entity {entity.__class__.__name__} count: {len(t.data)}.")
+		if isinstance(entity, MTaskItemE):
+			self._items_by_task.setdefault(entity.task_id, {})[entity.pk_id] = entity
+			task_def_key = self._task_def_key(entity.task_id)
+			if task_def_key is not None:
+				self._items_by_task_def.setdefault(task_def_key, {})[entity.pk_id] = entity
+				self._bump_generation(task_def_key[1])
+		else:
+			self._bump_generation(entity.task_type)
+		# a size check only, unless over the limits (the items of a long task count too)
+		self._evict()
+
+	def _bump_generation(self, task_type: str) -> None:
+		for name in (task_type, "*"):
+			self._generations[name] = self._generations.get(name, 0) + 1
+
+	def _evict(self) -> None:
+		if len(self._tasks.data) <= self._max_tasks and len(self._task_items.data) <= self._max_task_items:
+			return
+
+		unfinished = (TaskStatusEnum.CREATED.value, TaskStatusEnum.RUNNING.value)
+		for task in list(self._tasks.data.values()):
+			if len(self._tasks.data) <= self._max_tasks and len(self._task_items.data) <= self._max_task_items:
+				break
+			if task.status in unfinished:
+				continue
+			self._logger.debug(f"Evicting task '{task.pk_id}'.")
+			del self._tasks.data[task.pk_id]
+			task_items = self._items_by_task.pop(task.pk_id, {})
+			items_by_task_def = self._items_by_task_def.get((task.task_class, task.task_type), {})
+			for pk_id in task_items.keys():
+				self._task_items.data.pop(pk_id, None)
+				items_by_task_def.pop(pk_id, None)
+
+	def save_entity(self, entity: MTaskE | MTaskItemE, get_last_id: bool) -> int | None:
+		self._logger.debug(f"Saving entity {entity.__class__.__name__}.")
+		with self._lock:
+			self._put(entity)
+		self._logger.debug(f"Entity {entity.__class__.__name__} count: {len(self.get_table_for_entity(entity).data)}.")
 		return entity.pk_id
 
 	def update_entity(self, entity: MTaskE | MTaskItemE) -> None:
 		self._logger.debug(f"Updating entity {entity.__class__.__name__}.")
-		t = self.get_table_for_entity(entity)
-		t.data[entity.pk_id] = entity
-		self._logger.debug(f"Entity {entity.__class__.__name__} count: {len(t.data)}.")
+		with self._lock:
+			self._put(entity)
+		self._logger.debug(f"Entity {entity.__class__.__name__} count: {len(self.get_table_for_entity(entity).data)}.")
+
+	def save_entities(self, entities: List[MTaskE | MTaskItemE]) -> None:
+		self._logger.debug(f"Saving {len(entities)} entities.")
+		with self._lock:
+			for entity in entities:
+				self._put(entity)
+
+	def update_entities(self, entities: List[MTaskE | MTaskItemE]) -> None:
+		self._logger.debug(f"Updating {len(entities)} entities.")
+		with self._lock:
+			for entity in entities:
+				self._put(entity)
 
 	def load_entity_task(self, pk_id: int) -> MTaskE | None:
 		self._logger.debug(f"Reading entity 'MTaskE' for pk_id '{pk_id}'.")
-		item = self._tasks.data[int(pk_id)]
-		self._logger.debug(f"Returning '{item.pk_id}' task.")
+		with self._lock:
+			item = self._tasks.data.get(int(pk_id), None)
+		self._logger.debug(f"Returning '{None if item is None else item.pk_id}' task.")
 		return item
 
-	def read_recent_tasks_all(self, item_limit: int) -> List[MTaskE]:
-		self._logger.debug(f"Reading recent entities 'MTaskE' limited to {item_limit} items (total items {len(self._tasks.data)}).")
-		items = list(sorted(self._tasks.data.values(), key=lambda item: item.pk_id, reverse=True))[:int(item_limit)]
+	@staticmethod
+	def _page(entities, item_limit: int | None, skip_while) -> list:
+		return list(itertools.islice(itertools.dropwhile(skip_while, entities), None if item_limit is None else int(item_limit)))
+
+	def read_recent_tasks_all(self, item_limit: int, before_pk_id: int | None = None) -> List[MTaskE]:
+		self._logger.debug(f"Reading recent entities 'MTaskE' limited to {item_limit} items before '{before_pk_id}' (total items {len(self._tasks.data)}).")
+		with self._lock:
+			items = RepositoryInMemory._page(
+				reversed(self._tasks.data.values()),
+				item_limit,
+				lambda task: before_pk_id is not None and task.pk_id >= before_pk_id
+			)
 		self._logger.debug(f"Returning {len(items)} recent tasks.")
 		return items
 
-	def read_task_items(self, task_entity: MTaskE) -> List[MTaskItemE]:
-		self._logger.debug(f"Reading entities 'MScrapTaskItemE' for task entity '{task_entity.pk_id}.")
-		items = list(filter(lambda item: item.task_id == task_entity.pk_id, self._task_items.data.values()))
+	def read_task_items(self, task_entity: MTaskE, item_limit: int | None = None, after_pk_id: int | None = None) -> List[MTaskItemE]:
+		self._logger.debug(f"Reading entities 'MScrapTaskItemE' for task entity '{task_entity.pk_id}' limited to {item_limit} items after '{after_pk_id}'.")
+		with self._lock:
+			items = RepositoryInMemory._page(
+				self._items_by_task.get(task_entity.pk_id, {}).values(),
+				item_limit,
+				lambda item: after_pk_id is not None and item.pk_id <= after_pk_id
+			)
 		self._logger.debug(f"Returning {len(items)} task items.")
 		return items
 
-	def read_recent_task_items(self, task_def: TaskClassAndType, item_limit: int) -> List[MTaskItemE]:
-		self._logger.debug(f"Reading recent entities 'MTaskItemE' for task '{task_def}' limited to {item_limit} items.")
-		raise NotImplementedError("In-memory repository does not offer list of recent task items.")
+	def read_recent_task_items(self, task_def: TaskClassAndType, item_limit: int, before_pk_id: int | None = None) -> List[MTaskItemE]:
+		self._logger.debug(f"Reading recent entities 'MTaskItemE' for task '{task_def}' limited to {item_limit} items before '{before_pk_id}'.")
+		with self._lock:
+			task_def_items = self._items_by_task_def.get((task_def.cls.value, task_def.typ.value), {})
+			items = RepositoryInMemory._page(
+				(item for item in reversed(task_def_items.values()) if item.status == TaskStatusEnum.COMPLETED.value),
+				item_limit,
+				lambda item: before_pk_id is not None and item.pk_id >= before_pk_id
+			)
+		self._logger.debug(f"Returning {len(items)} recent task items.")
+		return items
+
+	def read_change_marker(self, task_def: TaskClassAndType | None = None) -> str:
+		name = "*" if task_def is None else task_def.typ.value
+		with self._lock:
+			return f"{self._instance_id}:{name}:{self._generations.get(name, 0)}"
+
+	def read_seen_item_names(self, task_def: TaskClassAndType, item_names: List[str]) -> Set[str]:
+		self._logger.debug(f"Reading seen item names for task '{task_def}' out of {len(item_names)} names.")
+		with self._lock:
+			return self._seen_item_names.get(task_def.typ.value, set()).intersection(item_names)
+
+	def save_seen_item_names(self, task_def: TaskClassAndType, item_names: List[str]) -> None:
+		self._logger.debug(f"Saving {len(item_names)} seen item names for task '{task_def}'.")
+		with self._lock:
+			self._seen_item_names.setdefault(task_def.typ.value, set()).update(item_names)
+
+	def load_source_state(self, task_def: TaskClassAndType) -> MSourceStateE | None:
+		self._logger.debug(f"Reading entity 'MSourceStateE' for task '{task_def}'.")
+		with self._lock:
+			return self._source_states.get(task_def.typ.value, None)
+
+	def save_source_state(self, entity: MSourceStateE) -> None:
+		self._logger.debug(f"Saving entity {entity.__class__.__name__}.")
+		with self._lock:
+			self._source_states[entity.task_type] = entity
+
+	def read_item_variants(self, destination_paths: List[str]) -> Dict[str, List[MItemVariantE]]:
+		self._logger.debug(f"Reading entities 'MItemVariantE' for {len(destination_paths)} destination paths.")
+		with self._lock:
+			return {
+				path: sorted(self._item_variants[path].values(), key=lambda v: v.width)
+				for path in destination_paths if path in self._item_variants
+			}
+
+	def save_item_variants(self, entities: List[MItemVariantE]) -> None:
+		self._logger.debug(f"Saving {len(entities)} entities 'MItemVariantE'.")
+		with self._lock:
+			for entity in entities:
+				self._item_variants.setdefault(entity.destination_path, {})[entity.variant] = entity
+				self._bump_generation(entity.destination_path.split("/", 1)[0])
+
+	def read_item_retries(self, task_def: TaskClassAndType, item_names: List[str]) -> Dict[str, MItemRetryE]:
+		self._logger.debug(f"Reading entities 'MItemRetryE' for task '{task_def}' out of {len(item_names)} names.")
+		with self._lock:
+			return {
+				item_name: self._item_retries[(task_def.typ.value, item_name)]
+				for item_name in item_names if (task_def.typ.value, item_name) in self._item_retries
+			}
+
+	def read_recent_item_retries(self, status: str, item_limit: int) -> List[MItemRetryE]:
+		self._logger.debug(f"Reading {item_limit} recent entities 'MItemRetryE' with status '{status}'.")
+		with self._lock:
+			retries = [retry for retry in self._item_retries.values() if retry.status == status]
+		return sorted(retries, key=lambda r: r.ts_update, reverse=True)[:item_limit]
+
+	def save_item_retry(self, entity: MItemRetryE) -> None:
+		self._logger.debug(f"Saving entity {entity.__class__.__name__}.")
+		with self._lock:
+			self._item_retries[(entity.task_type, entity.item_name)] = entity
+
+	def delete_item_retry(self, task_def: TaskClassAndType, item_name: str) -> None:
+		with self._lock:
+			self._item_retries.pop((task_def.typ.value, item_name), None)
 
 class RepositoryFactory(object):
-	def __init__(self, logger: Logger, sqlite_api: SqliteApi):
+	def __init__(self, logger: Logger, sqlite_api: SqliteApi, config_in_memory: ConfigRepositoryInMemory):
 		self._logger = logger
 		self._sqlite_api = sqlite_api
+		self._config_in_memory = config_in_memory
 
 	def create(self, repository_type: RepositoryType) -> Repository:
 		match repository_type:
 			case RepositoryType.IN_MEMORY:
-				return RepositoryInMemory(self._logger.getChild(repository_type.value))
+				return RepositoryInMemory(
+					self._logger.getChild(repository_type.value),
+					self._config_in_memory.max_tasks,
+					self._config_in_memory.max_task_items
+				)
 			case RepositoryType.PERSISTENT:
 				return RepositorySqlite3(self._logger.getChild(repository_type.value), self._sqlite_api)
 			case _:
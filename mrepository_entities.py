@@ -1,6 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from enum import Enum
+from typing import ClassVar, Tuple
 
 from mformatters import Formatter, TimestampFormat
 
@@ -26,37 +27,55 @@ class TaskClassAndType:
 		return f"{self.cls.value}.{self.typ.value}"
 
 
+class ItemRetryStatusEnum(Enum):
+	RETRY = "retry"
+	DEAD = "dead"
+
+
 class TaskStatusEnum(Enum):
 	CREATED = "created"
 	RUNNING = "running"
 	COMPLETED = "completed"
 	ERROR = "error"
+	CANCELLED = "cancelled"
 
 
-@dataclass
-class MTaskE:
-	pk_id: int | None
-	task_class: str
-	task_type: str
-	ts_start: str
-	ts_end: str | None
-	status: str
-	item_count_success: int
-	item_count_fail: int
-	exception_type: str | None
-	exception_value: str | None
+def _columns(entity_class) -> Tuple[str, ...]:
+	return tuple(f.name for f in fields(entity_class) if f.init)
+
+
+class _MTimedEntity(object):
+	"""
+	timestamps parsed lazily and cached together with the string they were parsed from,
+	so a changed ts_start / ts_end is parsed again
+	"""
+	__slots__ = ()
+
+	COLUMNS: ClassVar[Tuple[str, ...]] = ()
+
+	def as_row(self) -> dict:
+		return {c: getattr(self, c) for c in self.COLUMNS}
+
+	def _parsed_start(self) -> tuple:
+		# (ts_start, parsed, formatted date)
+		if self._ts_start_parsed is None or self._ts_start_parsed[0] != self.ts_start:
+			s = Formatter.str_to_ts_safe(TimestampFormat.DATETIME_MS, self.ts_start, None)
+			self._ts_start_parsed = (self.ts_start, s, Formatter.NOT_AVAILABLE_STR if s is None else Formatter.ts_to_str(TimestampFormat.DATETIME, s))
+		return self._ts_start_parsed
 
 	@property
 	def start_as_timestamp(self) -> datetime | None:
-		return Formatter.str_to_ts_safe(TimestampFormat.DATETIME_MS, self.ts_start, None)
+		return self._parsed_start()[1]
 
 	@property
-	def start_date(self) -> datetime | None:
-		return Formatter.ts_to_str(TimestampFormat.DATETIME, self.start_as_timestamp)
+	def start_date(self) -> str:
+		return self._parsed_start()[2]
 
 	@property
 	def end_as_timestamp(self) -> datetime | None:
-		return Formatter.str_to_ts_safe(TimestampFormat.DATETIME_MS, self.ts_end, None)
+		if self._ts_end_parsed is None or self._ts_end_parsed[0] != self.ts_end:
+			self._ts_end_parsed = (self.ts_end, Formatter.str_to_ts_safe(TimestampFormat.DATETIME_MS, self.ts_end, None))
+		return self._ts_end_parsed[1]
 
 	@property
 	def age(self) -> str:
@@ -68,6 +87,22 @@ class MTaskE:
 		s, e = self.start_as_timestamp, self.end_as_timestamp
 		return Formatter.NOT_AVAILABLE_STR if None in (s, e) else Formatter.ts_diff_to_str(s, e, False)
 
+
+@dataclass(slots=True)
+class MTaskE(_MTimedEntity):
+	pk_id: int | None
+	task_class: str
+	task_type: str
+	ts_start: str
+	ts_end: str | None
+	status: str
+	item_count_success: int
+	item_count_fail: int
+	exception_type: str | None
+	exception_value: str | None
+	_ts_start_parsed: tuple | None = field(default=None, init=False, repr=False, compare=False)
+	_ts_end_parsed: tuple | None = field(default=None, init=False, repr=False, compare=False)
+
 	@property
 	def success_percentage(self) -> str:
 		s, f = self.item_count_success, self.item_count_fail
@@ -88,8 +123,8 @@ class MTaskE:
 		return task_class_mapper.get(self.task_class, "?") + "/" + task_type_mapper.get(self.task_type, "?")
 
 
-@dataclass
-class MTaskItemE:
+@dataclass(slots=True)
+class MTaskItemE(_MTimedEntity):
 	pk_id: int | None
 	ref_id: int | None
 	task_id: int
@@ -101,25 +136,40 @@ class MTaskItemE:
 	exception_type: str | None
 	exception_value: str | None
 	sync_status: str
+	_ts_start_parsed: tuple | None = field(default=None, init=False, repr=False, compare=False)
+	_ts_end_parsed: tuple | None = field(default=None, init=False, repr=False, compare=False)
 
-	@property
-	def start_as_timestamp(self) -> datetime | None:
-		return Formatter.str_to_ts_safe(TimestampFormat.DATETIME_MS, self.ts_start, None)
 
-	@property
-	def start_date(self) -> datetime | None:
-		return Formatter.ts_to_str(TimestampFormat.DATETIME, self.start_as_timestamp)
+@dataclass(slots=True)
+class MSourceStateE:
+	task_type: str
+	etag: str | None
+	last_modified: str | None
+	content_hash: str | None
+	ts_update: str
 
-	@property
-	def end_as_timestamp(self) -> datetime | None:
-		return Formatter.str_to_ts_safe(TimestampFormat.DATETIME_MS, self.ts_end, None)
 
-	@property
-	def age(self) -> str:
-		s = self.start_as_timestamp
-		return Formatter.NOT_AVAILABLE_STR if s is None else Formatter.ts_diff_to_str(s, datetime.now(), False)
+@dataclass(slots=True)
+class MItemVariantE:
+	destination_path: str
+	variant: str
+	path: str
+	width: int
+	height: int
 
-	@property
-	def time_taken(self) -> str:
-		s, e = self.start_as_timestamp, self.end_as_timestamp
-		return Formatter.NOT_AVAILABLE_STR if None in (s, e) else Formatter.ts_diff_to_str(s, e, False)
+
+@dataclass(slots=True)
+class MItemRetryE:
+	task_type: str
+	item_name: str
+	status: str
+	attempts: int
+	ts_next: str | None
+	exception_type: str | None
+	exception_value: str | None
+	ts_update: str
+
+
+# persisted columns in the table order, the parse caches are not persisted
+MTaskE.COLUMNS = _columns(MTaskE)
+MTaskItemE.COLUMNS = _columns(MTaskItemE)
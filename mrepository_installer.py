@@ -1,39 +1,199 @@
+from logging import Logger
 from sqlite3 import Connection
+from typing import Callable, Tuple
+
+from mformatters import Formatter, TimestampFormat
 from msqlite_api import SqliteApi
 
 
+def _create_tables_impl(c: Connection):
+	c.execute("""CREATE TABLE IF NOT EXISTS task(
+		pk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+		task_class TEXT,
+		task_type TEXT,
+		ts_start TEXT,
+		ts_end TEXT,
+		status TEXT,
+		item_count_success INTEGER,
+		item_count_fail INTEGER,
+		exception_type TEXT,
+		exception_value TEXT
+	);""")
+
+	c.execute("""CREATE TABLE IF NOT EXISTS task_item(
+		pk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+		ref_id INTEGER,
+		task_id INTEGER,
+		ts_start TEXT,
+		ts_end TEXT,
+		status TEXT,
+		item_name TEXT,
+		destination_path TEXT,
+		exception_type TEXT,
+		exception_value TEXT,
+		sync_status TEXT,
+		FOREIGN KEY (task_id) REFERENCES scrap_task(pk_id)
+	);""")
+
+
+def _create_indexes_for_reads(c: Connection):
+	# key columns only, the task item reads select every column (a covering index would be a second copy of the table)
+	# RepositorySqlite3.read_task_items (the index keeps the rowid order, so no sort is needed)
+	c.execute("CREATE INDEX IF NOT EXISTS ix_task_item_task_id ON task_item(task_id);")
+	# RepositorySqlite3.read_recent_task_items, the join condition (the status alone is not selective)
+	c.execute("CREATE INDEX IF NOT EXISTS ix_task_item_task_id_status ON task_item(task_id, status);")
+	# lookups of the tasks of one source, covering for the join of read_recent_task_items (pk_id is the rowid)
+	c.execute("CREATE INDEX IF NOT EXISTS ix_task_class_type ON task(task_class, task_type);")
+
+
+def _create_seen_item_table(c: Connection):
+	c.execute("""CREATE TABLE IF NOT EXISTS seen_item(
+		task_type TEXT NOT NULL,
+		item_name TEXT NOT NULL,
+		PRIMARY KEY (task_type, item_name)
+	) WITHOUT ROWID;""")
+	_seed_seen_items(c)
+
+
+def _seed_seen_items(c: Connection):
+	# everything downloaded so far is seen
+	c.execute("""INSERT OR IGNORE INTO seen_item(task_type, item_name)
+		SELECT t.task_type, ti.item_name
+		FROM task t
+		INNER JOIN task_item ti ON ti.task_id=t.pk_id AND ti.status='completed'
+		WHERE ti.item_name IS NOT NULL;""")
+
+
+def _create_source_state_table(c: Connection):
+	c.execute("""CREATE TABLE IF NOT EXISTS source_state(
+		task_type TEXT PRIMARY KEY,
+		etag TEXT,
+		last_modified TEXT,
+		content_hash TEXT,
+		ts_update TEXT
+	);""")
+
+
+def _create_change_marker_table(c: Connection):
+	# generation counters bumped by triggers in the writing transaction, per task type and for everything ("*"),
+	# so the validators of the listings are a primary key lookup (and see the writes of other processes too)
+	c.execute("""CREATE TABLE IF NOT EXISTS change_marker(
+		name TEXT PRIMARY KEY,
+		generation INTEGER NOT NULL
+	);""")
+
+	bump_stmt = """INSERT INTO change_marker(name, generation) VALUES ({name}, 1)
+		ON CONFLICT(name) DO UPDATE SET generation=generation+1;"""
+	bump_task = bump_stmt.format(name="NEW.task_type")
+	bump_task_item = bump_stmt.format(name="(SELECT task_type FROM task WHERE pk_id=NEW.task_id)")
+	bump_all = bump_stmt.format(name="'*'")
+
+	for event in ("INSERT", "UPDATE"):
+		c.execute(f"""CREATE TRIGGER IF NOT EXISTS tr_task_change_{event.lower()} AFTER {event} ON task
+			BEGIN {bump_task} {bump_all} END;""")
+		c.execute(f"""CREATE TRIGGER IF NOT EXISTS tr_task_item_change_{event.lower()} AFTER {event} ON task_item
+			BEGIN {bump_task_item} {bump_all} END;""")
+
+
+def _create_item_variant_table(c: Connection):
+	c.execute("""CREATE TABLE IF NOT EXISTS item_variant(
+		destination_path TEXT NOT NULL,
+		variant TEXT NOT NULL,
+		path TEXT NOT NULL,
+		width INTEGER,
+		height INTEGER,
+		PRIMARY KEY (destination_path, variant)
+	) WITHOUT ROWID;""")
+
+	# the image view shows the variants, the destination paths start with the task type directory
+	c.execute("""CREATE TRIGGER IF NOT EXISTS tr_item_variant_change_insert AFTER INSERT ON item_variant
+		BEGIN
+			INSERT INTO change_marker(name, generation) VALUES (substr(NEW.destination_path, 1, instr(NEW.destination_path, '/') - 1), 1)
+				ON CONFLICT(name) DO UPDATE SET generation=generation+1;
+		END;""")
+
+
+def _create_item_retry_table(c: Connection):
+	# the failed items, retried with a backoff (ts_next) until dead
+	c.execute("""CREATE TABLE IF NOT EXISTS item_retry(
+		task_type TEXT NOT NULL,
+		item_name TEXT NOT NULL,
+		status TEXT NOT NULL,
+		attempts INTEGER NOT NULL,
+		ts_next TEXT,
+		exception_type TEXT,
+		exception_value TEXT,
+		ts_update TEXT NOT NULL,
+		PRIMARY KEY (task_type, item_name)
+	) WITHOUT ROWID;""")
+	# the retry queue listing
+	c.execute("CREATE INDEX IF NOT EXISTS ix_item_retry_status ON item_retry(status, ts_update);")
+
+
 class RepositoryInstaller(object):
-	def __init__(self, sql_api: SqliteApi):
+	# ordered schema migrations, (version, description, migration), append only - never change the released ones
+	MIGRATIONS: Tuple[Tuple[int, str, Callable[[Connection], None]], ...] = (
+		(1, "task and task_item tables", _create_tables_impl),
+		(2, "indexes for the repository reads", _create_indexes_for_reads),
+		(3, "seen item names index", _create_seen_item_table),
+		(4, "source page state", _create_source_state_table),
+		(5, "change markers of the listings", _create_change_marker_table),
+		(6, "image variants (thumbnails)", _create_item_variant_table),
+		(7, "retry queue of the failed items", _create_item_retry_table),
+	)
+
+	def __init__(self, sql_api: SqliteApi, logger: Logger | None = None):
 		self._sql_api = sql_api
+		self._logger = logger
 
-	def create_tables(self):
-		def _create_tables_impl(c: Connection):
-			c.execute("""CREATE TABLE IF NOT EXISTS task(
-				pk_id INTEGER PRIMARY KEY AUTOINCREMENT,
-				task_class TEXT,
-				task_type TEXT,
-				ts_start TEXT,
-				ts_end TEXT,
-				status TEXT,
-				item_count_success INTEGER,
-				item_count_fail INTEGER,
-				exception_type TEXT,
-				exception_value TEXT
-			);""")
-
-			c.execute("""CREATE TABLE IF NOT EXISTS task_item(
-				pk_id INTEGER PRIMARY KEY AUTOINCREMENT,
-				ref_id INTEGER,
-				task_id INTEGER,
-				ts_start TEXT,
-				ts_end TEXT,
-				status TEXT,
-				item_name TEXT,
-				destination_path TEXT,
-				exception_type TEXT,
-				exception_value TEXT,
-				sync_status TEXT,
-				FOREIGN KEY (task_id) REFERENCES scrap_task(pk_id)
-			);""")
+	def _log(self, message: str):
+		if self._logger is not None:
+			self._logger.info(message)
 
+	def create_tables(self):
 		self._sql_api.do_with_connection(_create_tables_impl)
+
+	def seed_seen_items(self):
+		""" marks the completed items as seen, for the items written after the upgrade (an import of old data) """
+		self._sql_api.do_with_connection(_seed_seen_items)
+
+	def read_schema_version(self) -> int:
+		self._sql_api.do_with_connection(RepositoryInstaller._create_schema_version_table)
+		return self._sql_api.read("select coalesce(max(version), 0) from schema_version", {}).pop()[0]
+
+	def upgrade(self) -> int:
+		"""
+		applies all the pending migrations, each one in its own transaction.
+		safe to be called on every startup (even from several processes at once).
+		"""
+		self._sql_api.do_with_connection(RepositoryInstaller._create_schema_version_table)
+
+		for version, description, migration in RepositoryInstaller.MIGRATIONS:
+			def _migrate(c: Connection) -> bool:
+				# write lock first, then check the version again, someone else could have been faster
+				c.execute("BEGIN IMMEDIATE")
+				if c.execute("select count(*) from schema_version where version=?", (version, )).fetchone()[0] > 0:
+					return False
+				migration(c)
+				c.execute(
+					"insert into schema_version(version, description, ts_applied) values (?, ?, ?)",
+					(version, description, Formatter.ts_to_str(TimestampFormat.DATETIME_MS))
+				)
+				return True
+
+			if self._sql_api.do_with_connection(_migrate):
+				self._log(f"Schema migrated to version {version} ({description}).")
+
+		self._sql_api.do_with_connection(lambda c: c.execute("PRAGMA optimize"))
+
+		schema_version = self.read_schema_version()
+		self._log(f"Schema version is {schema_version}.")
+		return schema_version
+
+	@staticmethod
+	def _create_schema_version_table(c: Connection):
+		c.execute("""CREATE TABLE IF NOT EXISTS schema_version(
+			version INTEGER PRIMARY KEY,
+			description TEXT,
+			ts_applied TEXT
+		);""")
@@ -0,0 +1,118 @@
+import queue
+import threading
+import time
+from logging import Logger
+
+from mrepository import Repository
+from mrepository_entities import MTaskE, MTaskItemE
+
+
+class _FlushRequest(object):
+	def __init__(self):
+		self.done = threading.Event()
+		self.written = False
+
+
+class RepositoryWriteBehind(object):
+	"""
+	entities are queued and written by a single writer thread in batched transactions.
+	an entity queued several times before the batch is written is written just once (in its latest state),
+	entities without pk_id are inserted (and get their pk_id from the writer thread), the rest is updated.
+	a failed batch is written entity by entity, the entities still failing stay queued for the next batch.
+	"""
+
+	_STOP = object()
+
+	def __init__(self, logger: Logger, repository: Repository, batch_size: int, flush_interval_seconds: float):
+		self._logger = logger
+		self._repository = repository
+		self._batch_size = max(1, batch_size)
+		self._flush_interval_seconds = flush_interval_seconds
+		self._queue = queue.Queue()
+		self._thread = threading.Thread(target=self._run, name="repository-write-behind", daemon=True)
+		self._thread.start()
+
+	def put(self, entity: MTaskE | MTaskItemE) -> None:
+		self._queue.put(entity)
+
+	def flush(self, timeout: float | None = None) -> bool:
+		""" blocks until all the entities queued so far are written, False when some of them failed (or on timeout) """
+		flush_request = _FlushRequest()
+		self._queue.put(flush_request)
+		return flush_request.done.wait(timeout) and flush_request.written
+
+	def close(self) -> None:
+		self._queue.put(RepositoryWriteBehind._STOP)
+		self._thread.join()
+
+	def _run(self):
+		self._logger.info(f"Write-behind writer started (batch size: {self._batch_size}, flush interval: {self._flush_interval_seconds}s).")
+		pending = {}  # id(entity) -> entity, the dict holds the reference so the id stays unique
+		flush_deadline = None
+
+		while True:
+			timeout = None if flush_deadline is None else max(0.0, flush_deadline - time.monotonic())
+			try:
+				queued = self._queue.get(timeout=timeout)
+			except queue.Empty:
+				queued = None
+
+			flush_requests = []
+			stop = False
+			match queued:
+				case None: pass
+				case _FlushRequest(): flush_requests.append(queued)
+				case RepositoryWriteBehind._STOP: stop = True
+				case _:
+					pending[id(queued)] = queued
+					if flush_deadline is None:
+						flush_deadline = time.monotonic() + self._flush_interval_seconds
+
+			if len(pending) > 0 and (
+					stop
+					or len(flush_requests) > 0
+					or len(pending) >= self._batch_size
+					or time.monotonic() >= flush_deadline
+			):
+				failed = self._write(list(pending.values()))
+				pending = {id(entity): entity for entity in failed}
+				flush_deadline = None if len(pending) == 0 else time.monotonic() + self._flush_interval_seconds
+
+			for flush_request in flush_requests:
+				flush_request.written = len(pending) == 0
+				flush_request.done.set()
+
+			if stop:
+				if len(pending) > 0:
+					self._logger.error(f"Write-behind writer stopped, {len(pending)} entities not written.")
+				else:
+					self._logger.info(f"Write-behind writer stopped.")
+				return
+
+	def _write(self, entities: list) -> list:
+		""" returns the entities not written """
+		inserts = [entity for entity in entities if entity.pk_id is None]
+		updates = [entity for entity in entities if entity.pk_id is not None]
+		self._logger.debug(f"Writing batch of {len(inserts)} inserts and {len(updates)} updates.")
+		try:
+			if len(inserts) > 0:
+				self._repository.save_entities(inserts)
+				inserts = []
+			if len(updates) > 0:
+				self._repository.update_entities(updates)
+			return []
+		except Exception as ex:
+			self._logger.error(f"Write-behind batch of {len(entities)} entities failed, writing them one by one: {ex!s}.")
+
+		# the batch is rolled back as a whole (the inserted ones got no pk_id), the updates are idempotent
+		failed = []
+		for entity in inserts + updates:
+			try:
+				if entity.pk_id is None:
+					entity.pk_id = self._repository.save_entity(entity, True)
+				else:
+					self._repository.update_entity(entity)
+			except Exception as ex:
+				self._logger.error(f"Write-behind of entity {entity.__class__.__name__} failed, kept queued: {ex!s}.")
+				failed.append(entity)
+		return failed
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from logging import Logger
+from typing import Dict, List, Tuple
+
+from mconfig import ConfigRetry
+from mformatters import Formatter, TimestampFormat
+from mrepository import Repository
+from mrepository_entities import TaskClassAndType, MItemRetryE, ItemRetryStatusEnum
+
+
+class RetryQueue(object):
+	"""
+	failed items of a task type with their attempt count and the time they are due again.
+	the backoff doubles with every failed attempt, after max_attempts the item is dead (not retried anymore).
+	"""
+
+	def __init__(self, logger: Logger, repository: Repository, config: ConfigRetry):
+		self._logger = logger
+		self._repository = repository
+		self._config = config
+
+	def _get_backoff_seconds(self, attempts: int) -> float:
+		return min(self._config.backoff_max_seconds, self._config.backoff_base_seconds * 2 ** (attempts - 1))
+
+	def filter_eligible(self, task_def: TaskClassAndType, item_names: List[str]) -> Tuple[List[str], Dict[str, MItemRetryE]]:
+		"""
+		drops the dead items and the ones not due yet, order is kept.
+		returns the eligible names and the retry state of all the names failed before.
+		"""
+		if len(item_names) == 0:
+			return item_names, {}
+		retries = self._repository.read_item_retries(task_def, item_names)
+		if len(retries) == 0:
+			return item_names, retries
+		# same format, compared as strings
+		now = Formatter.ts_to_str(TimestampFormat.DATETIME_MS)
+		eligible_names = [
+			item_name for item_name in item_names
+			if item_name not in retries or (retries[item_name].status == ItemRetryStatusEnum.RETRY.value and retries[item_name].ts_next <= now)
+		]
+		self._logger.debug(f"{len(item_names) - len(eligible_names)} names of '{task_def}' held back by the retry queue.")
+		return eligible_names, retries
+
+	def record_failure(self, task_def: TaskClassAndType, item_name: str, ex: Exception) -> MItemRetryE:
+		previous = self._repository.read_item_retries(task_def, [item_name]).get(item_name, None)
+		attempts = 1 if previous is None else previous.attempts + 1
+		ts = datetime.now()
+		if attempts >= self._config.max_attempts:
+			status, ts_next = ItemRetryStatusEnum.DEAD, None
+			self._logger.warning(f"Item '{item_name}' of '{task_def}' failed {attempts} times, dead-lettered.")
+		else:
+			status = ItemRetryStatusEnum.RETRY
+			ts_next = Formatter.ts_to_str(TimestampFormat.DATETIME_MS, ts + timedelta(seconds=self._get_backoff_seconds(attempts)))
+			self._logger.debug(f"Item '{item_name}' of '{task_def}' failed {attempts} times, retry after {ts_next}.")
+		entity = MItemRetryE(
+			task_type=task_def.typ.value,
+			item_name=item_name,
+			status=status.value,
+			attempts=attempts,
+			ts_next=ts_next,
+			exception_type=ex.__class__.__name__,
+			exception_value=str(ex),
+			ts_update=Formatter.ts_to_str(TimestampFormat.DATETIME_MS, ts)
+		)
+		self._repository.save_item_retry(entity)
+		return entity
+
+	def record_success(self, task_def: TaskClassAndType, item_name: str) -> None:
+		self._repository.delete_item_retry(task_def, item_name)
+
+	def read_recent(self, status: ItemRetryStatusEnum, item_limit: int) -> List[MItemRetryE]:
+		return self._repository.read_recent_item_retries(status.value, item_limit)
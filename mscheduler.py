@@ -0,0 +1,173 @@
+import fcntl
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from logging import Logger
+from typing import Callable, Dict, List, Set
+
+from mconfig import ConfigScheduler, ConfigSchedulerSource
+from mexecutorlanes import ExecutorLanes
+from mrepository_entities import TaskClassAndType
+
+
+class TaskDispatcher(object):
+	"""
+	submits the tasks to their executor lanes, an exclusive task is refused (and not even created)
+	while another one of the same class and type is queued or running.
+	"""
+
+	def __init__(self, logger: Logger, executor_lanes: ExecutorLanes):
+		self._logger = logger
+		self._executor_lanes = executor_lanes
+		self._in_flight: Set[str] = set()
+		self._lock = threading.Lock()
+
+	def is_in_flight(self, task_def: TaskClassAndType) -> bool:
+		with self._lock:
+			return str(task_def) in self._in_flight
+
+	def submit(self, task_def: TaskClassAndType, create_task: Callable[[], Callable], exclusive: bool = True) -> Future | None:
+		key = str(task_def)
+		if exclusive:
+			with self._lock:
+				if key in self._in_flight:
+					self._logger.info(f"Task '{key}' already queued or running, not submitted again.")
+					return None
+				self._in_flight.add(key)
+		try:
+			future = self._executor_lanes.submit(task_def, create_task)
+		except Exception:
+			if exclusive:
+				self._release(key)
+			raise
+		if exclusive:
+			future.add_done_callback(lambda _: self._release(key))
+		return future
+
+	def _release(self, key: str) -> None:
+		with self._lock:
+			self._in_flight.discard(key)
+
+
+class _ScheduledSource(object):
+	def __init__(self, task_def: TaskClassAndType, config: ConfigSchedulerSource, create_task: Callable[[], Callable]):
+		self.task_def = task_def
+		self.config = config
+		self.create_task = create_task
+		self.interval = float(config.interval_seconds)
+		self.rate = None  # smoothed new items per second
+		self.last_fetch = None
+		self.next_run = 0.0
+
+
+class ScrapScheduler(object):
+	"""
+	triggers the scrap tasks periodically (with jitter), every source adapts its interval to the observed rate of the new items,
+	so a fetch finds about target_new_items of them (within the min/max interval of the source).
+	the tasks go through the dispatcher, a source still running is not submitted again.
+	the dispatcher knows the tasks of its own process only, so just the process holding the lock file runs the scheduler
+	(one of the wsgi workers, the reloader child of the dev server).
+	"""
+
+	def __init__(self, logger: Logger, config: ConfigScheduler, dispatcher: TaskDispatcher, lock_file: str):
+		self._logger = logger
+		self._config = config
+		self._dispatcher = dispatcher
+		self._lock_file = lock_file
+		self._lock_fd = None
+		self._sources: List[_ScheduledSource] = []
+		self._stopped = False
+		self._wake = threading.Event()
+		self._thread = None
+
+	def add_source(self, task_def: TaskClassAndType, config: ConfigSchedulerSource, create_task: Callable[[], Callable]) -> None:
+		source = _ScheduledSource(task_def, config, create_task)
+		source.next_run = time.monotonic() + self._jittered(config.initial_delay_seconds)
+		self._sources.append(source)
+
+	@property
+	def intervals(self) -> Dict[str, float]:
+		return {str(source.task_def): source.interval for source in self._sources}
+
+	def _try_lock(self) -> bool:
+		# released by the os with the process, a crashed scheduler process does not block the others
+		fd = os.open(self._lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+		try:
+			fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+		except OSError:
+			os.close(fd)
+			return False
+		self._lock_fd = fd
+		return True
+
+	def start(self) -> bool:
+		""" False when another process runs the scheduler already """
+		if not self._try_lock():
+			self._logger.info(f"Scheduler not started, another process holds '{self._lock_file}'.")
+			return False
+		self._thread = threading.Thread(target=self._run, name="scrap-scheduler", daemon=True)
+		self._thread.start()
+		return True
+
+	def close(self) -> None:
+		self._stopped = True
+		self._wake.set()
+		if self._thread is not None:
+			self._thread.join()
+		if self._lock_fd is not None:
+			os.close(self._lock_fd)
+			self._lock_fd = None
+
+	def _jittered(self, seconds: float) -> float:
+		return max(0.0, seconds * (1 + random.uniform(-self._config.jitter, self._config.jitter)))
+
+	def _run(self) -> None:
+		self._logger.info(f"Scheduler started for {', '.join(str(s.task_def) for s in self._sources)}.")
+		while not self._stopped:
+			now = time.monotonic()
+			for source in self._sources:
+				if source.next_run <= now:
+					self._trigger(source, now)
+			next_run = min((source.next_run for source in self._sources), default=now + 60)
+			self._wake.wait(max(1.0, next_run - time.monotonic()))
+			self._wake.clear()
+
+	def _trigger(self, source: _ScheduledSource, now: float) -> None:
+		# the next run counts from the trigger, a long running task is refused by the dispatcher meanwhile
+		source.next_run = now + self._jittered(source.interval)
+		try:
+			future = self._dispatcher.submit(source.task_def, source.create_task)
+		except Exception as ex:
+			self._logger.warning(f"Task '{source.task_def}' not submitted: {ex!s}.")
+			return
+		if future is not None:
+			future.add_done_callback(lambda f: self._on_done(source, now, f))
+
+	def _on_done(self, source: _ScheduledSource, fetch_time: float, future: Future) -> None:
+		new_items = None if future.cancelled() or future.exception() is not None else future.result()
+		config = source.config
+		if new_items is None:
+			# failed, back off
+			interval = source.interval * 2
+		else:
+			if source.last_fetch is not None:
+				rate = new_items / max(1.0, fetch_time - source.last_fetch)
+				smoothing = self._config.smoothing
+				source.rate = rate if source.rate is None else smoothing * rate + (1 - smoothing) * source.rate
+			source.last_fetch = fetch_time
+			if source.rate is None:
+				interval = source.interval
+			elif source.rate > 0:
+				interval = self._config.target_new_items / source.rate
+			else:
+				interval = source.interval * 2
+		interval = min(float(config.max_interval_seconds), max(float(config.min_interval_seconds), interval))
+
+		if interval != source.interval:
+			self._logger.debug(f"Interval of '{source.task_def}': {source.interval:.0f}s -> {interval:.0f}s ({new_items=}).")
+			source.interval = interval
+			# the already planned run is planned again with the new interval
+			source.next_run = fetch_time + self._jittered(interval)
+			self._wake.set()
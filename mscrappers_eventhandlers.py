@@ -1,10 +1,23 @@
+import os
+import threading
+import time
 from logging import Logger
+from typing import Dict
 
+from mcancellation import CancellationToken, TaskCancellations, TaskCancelledError
 from mformatters import Formatter, TimestampFormat
+from mmetrics import AppMetrics
 from mrepository import Repository
+from mrepository_writebehind import RepositoryWriteBehind
 from mrepository_entities import MTaskE, TaskStatusEnum, MTaskItemE
 from mrepository_entities import TaskClassAndType
+from mprogress import ProgressEventType, TaskProgressHub
 from mscrappers_api import TaskEvents
+from mthumbnails import Thumbnailer
+
+
+def _get_error_status(ex: Exception) -> str:
+	return (TaskStatusEnum.CANCELLED if isinstance(ex, TaskCancelledError) else TaskStatusEnum.ERROR).value
 
 
 class TaskEventLogger(TaskEvents):
@@ -29,7 +42,7 @@ class TaskEventLogger(TaskEvents):
 	def on_item_progress(self, description: str) -> None:
 		self._l.debug(f"Item progress: {description}.")
 
-	def on_item_finish(self, destination_path: str | None) -> None:
+	def on_item_finish(self, destination_path: str | None, transferred_bytes: int | None = None) -> None:
 		self._l.info(f"Item finished: '{destination_path}'.")
 
 	def on_item_error(self, ex: Exception) -> None:
@@ -37,11 +50,18 @@ class TaskEventLogger(TaskEvents):
 
 
 class TaskEventRepositoryWriter(TaskEvents):
-	def __init__(self, repository: Repository, task_def: TaskClassAndType):
+	def __init__(self, repository: Repository, task_def: TaskClassAndType, write_behind: RepositoryWriteBehind | None = None):
 		self._repository = repository
 		self._task_def = task_def
+		self._write_behind = write_behind
 		self._entity_task = None
-		self._entity_task_item = None
+		# items may be processed by several worker threads at once, each thread owns its current item
+		self._item_state = threading.local()
+		self._counter_lock = threading.Lock()
+
+	@property
+	def task_id(self) -> int | None:
+		return None if self._entity_task is None else self._entity_task.pk_id
 
 	@staticmethod
 	def _get_current_timestamp() -> str:
@@ -58,6 +78,22 @@ class TaskEventRepositoryWriter(TaskEvents):
 
 		return ex_str
 
+	def _save_item(self, entity: MTaskItemE) -> None:
+		if self._write_behind is not None:
+			# pk_id is set by the write-behind writer thread
+			self._write_behind.put(entity)
+		else:
+			entity.pk_id = self._repository.save_entity(entity, True)
+
+	def _update(self, entity: MTaskE | MTaskItemE, flush: bool = False) -> None:
+		if self._write_behind is not None:
+			self._write_behind.put(entity)
+			if flush:
+				# False when the write failed, the entity is kept queued by the writer and written with a later batch
+				self._write_behind.flush()
+		else:
+			self._repository.update_entity(entity)
+
 	def on_new(self) -> None:
 		self._entity_task = MTaskE(
 			pk_id=None,
@@ -77,22 +113,24 @@ class TaskEventRepositoryWriter(TaskEvents):
 	def on_start(self) -> None:
 		self._entity_task.status = TaskStatusEnum.RUNNING.value
 		self._entity_task.ts_start = TaskEventRepositoryWriter._get_current_timestamp()
-		self._repository.update_entity(self._entity_task)
+		self._update(self._entity_task)
 
 	def on_finish(self) -> None:
 		self._entity_task.status = TaskStatusEnum.COMPLETED.value
 		self._entity_task.ts_end = TaskEventRepositoryWriter._get_current_timestamp()
-		self._repository.update_entity(self._entity_task)
+		self._update(self._entity_task, flush=True)
 
 	def on_error(self, ex: Exception) -> None:
-		self._entity_task.status = TaskStatusEnum.ERROR.value
+		self._entity_task.status = _get_error_status(ex)
 		self._entity_task.ts_end = TaskEventRepositoryWriter._get_current_timestamp()
 		self._entity_task.exception_type = ex.__class__.__name__
 		self._entity_task.exception_value = TaskEventRepositoryWriter._sanitize_exception_for_write(ex)
-		self._repository.update_entity(self._entity_task)
+		self._update(self._entity_task, flush=True)
 
 	def on_item_start(self, item_name: str, ref_id: int | None = None) -> None:
-		self._entity_task_item = MTaskItemE(
+		# the previous item of the thread is done, an error before the save below is not its error
+		self._item_state.entity = None
+		entity_task_item = MTaskItemE(
 			pk_id=None,
 			ref_id=ref_id,
 			task_id=self._entity_task.pk_id,
@@ -105,26 +143,205 @@ class TaskEventRepositoryWriter(TaskEvents):
 			exception_value=None,
 			sync_status="ignore",
 		)
-		pk_id = self._repository.save_entity(self._entity_task_item, True)
-		self._entity_task_item.pk_id = pk_id
+		self._save_item(entity_task_item)
+		self._item_state.entity = entity_task_item
 
 	def on_item_progress(self, description: str) -> None:
 		# do nothing
 		pass
 
-	def on_item_finish(self, destination_path: str | None) -> None:
-		self._entity_task_item.status = TaskStatusEnum.COMPLETED.value
-		self._entity_task_item.ts_end = TaskEventRepositoryWriter._get_current_timestamp()
-		self._entity_task_item.destination_path = destination_path
-		self._entity_task_item.sync_status = "ignore"
-		self._repository.update_entity(self._entity_task_item)
-		self._entity_task.item_count_success += 1
+	def on_item_finish(self, destination_path: str | None, transferred_bytes: int | None = None) -> None:
+		entity_task_item = self._item_state.entity
+		self._item_state.entity = None
+		entity_task_item.status = TaskStatusEnum.COMPLETED.value
+		entity_task_item.ts_end = TaskEventRepositoryWriter._get_current_timestamp()
+		entity_task_item.destination_path = destination_path
+		entity_task_item.sync_status = "ignore"
+		self._update(entity_task_item)
+		with self._counter_lock:
+			self._entity_task.item_count_success += 1
+
+	def on_item_error(self, ex: Exception) -> None:
+		entity_task_item = getattr(self._item_state, "entity", None)
+		self._item_state.entity = None
+		# no current item when the item failed before it was saved, only the task counter is updated
+		if entity_task_item is not None:
+			entity_task_item.status = _get_error_status(ex)
+			entity_task_item.ts_end = TaskEventRepositoryWriter._get_current_timestamp()
+			entity_task_item.exception_type = ex.__class__.__name__
+			entity_task_item.exception_value = TaskEventRepositoryWriter._sanitize_exception_for_write(ex)
+			entity_task_item.sync_status = "ignore"
+			self._update(entity_task_item)
+		with self._counter_lock:
+			self._entity_task.item_count_fail += 1
+
+
+class TaskEventThumbnailer(TaskEvents):
+	""" hands the finished images over to the thumbnailer, the variants are generated in the background """
+
+	def __init__(self, thumbnailer: Thumbnailer):
+		self._thumbnailer = thumbnailer
+
+	def on_new(self) -> None:
+		pass
+
+	def on_start(self) -> None:
+		pass
+
+	def on_finish(self) -> None:
+		pass
+
+	def on_error(self, ex: Exception) -> None:
+		pass
+
+	def on_item_start(self, item_name: str, ref_id: int | None = None) -> None:
+		pass
+
+	def on_item_progress(self, description: str) -> None:
+		pass
+
+	def on_item_finish(self, destination_path: str | None, transferred_bytes: int | None = None) -> None:
+		if self._thumbnailer.accepts(destination_path):
+			self._thumbnailer.submit(destination_path)
+
+	def on_item_error(self, ex: Exception) -> None:
+		pass
+
+
+class TaskEventProgress(TaskEvents):
+	"""
+	publishes the events into the progress hub, the task is found there by its ids in the repositories
+	(so it has to follow the repository writers)
+	"""
+
+	def __init__(self, progress_hub: TaskProgressHub, task_def: TaskClassAndType, task_writers: Dict[str, TaskEventRepositoryWriter]):
+		self._progress_hub = progress_hub
+		self._task_def = task_def
+		self._task_writers = task_writers
+		self._progress_id = None
+		self._item_state = threading.local()
+
+	def _publish(self, event_type: ProgressEventType, description: str | None = None, with_item: bool = False) -> None:
+		item_name = getattr(self._item_state, "item_name", None) if with_item else None
+		self._progress_hub.publish(self._progress_id, event_type, item_name, description)
+
+	def on_new(self) -> None:
+		self._progress_id = self._progress_hub.open(
+			str(self._task_def),
+			{repository_type: writer.task_id for repository_type, writer in self._task_writers.items()}
+		)
+		self._publish(ProgressEventType.NEW)
+
+	def on_start(self) -> None:
+		self._publish(ProgressEventType.START)
+
+	def on_finish(self) -> None:
+		self._publish(ProgressEventType.FINISH)
+
+	def on_error(self, ex: Exception) -> None:
+		self._publish(ProgressEventType.ERROR, f"{ex.__class__.__name__}: {ex!s}")
+
+	def on_item_start(self, item_name: str, ref_id: int | None = None) -> None:
+		self._item_state.item_name = item_name
+		self._publish(ProgressEventType.ITEM_START, with_item=True)
+
+	def on_item_progress(self, description: str) -> None:
+		self._publish(ProgressEventType.ITEM_PROGRESS, description, with_item=True)
+
+	def on_item_finish(self, destination_path: str | None, transferred_bytes: int | None = None) -> None:
+		self._publish(ProgressEventType.ITEM_FINISH, destination_path, with_item=True)
+
+	def on_item_error(self, ex: Exception) -> None:
+		self._publish(ProgressEventType.ITEM_ERROR, f"{ex.__class__.__name__}: {ex!s}", with_item=True)
+
+
+class TaskEventCancellationRegistrar(TaskEvents):
+	""" makes the task cancellable by its ids in the repositories (so it has to follow the repository writers) """
+
+	def __init__(self, task_cancellations: TaskCancellations, cancellation_token: CancellationToken, task_writers: Dict[str, TaskEventRepositoryWriter]):
+		self._task_cancellations = task_cancellations
+		self._cancellation_token = cancellation_token
+		self._task_writers = task_writers
+
+	def on_new(self) -> None:
+		self._task_cancellations.register(
+			{repository_type: writer.task_id for repository_type, writer in self._task_writers.items()},
+			self._cancellation_token
+		)
+
+	def on_start(self) -> None:
+		pass
+
+	def on_finish(self) -> None:
+		pass
+
+	def on_error(self, ex: Exception) -> None:
+		pass
+
+	def on_item_start(self, item_name: str, ref_id: int | None = None) -> None:
+		pass
+
+	def on_item_progress(self, description: str) -> None:
+		pass
+
+	def on_item_finish(self, destination_path: str | None, transferred_bytes: int | None = None) -> None:
+		pass
+
+	def on_item_error(self, ex: Exception) -> None:
+		pass
+
+
+class TaskEventMetrics(TaskEvents):
+	""" counts the tasks and items, times them and sums the bytes transferred for the finished items """
+
+	def __init__(self, metrics: AppMetrics, task_def: TaskClassAndType, storage_path: str):
+		task_type = task_def.typ.value
+		self._metrics = metrics
+		self._task_type = task_type
+		self._storage_path = storage_path
+		# the children are looked up once per task
+		self._task_duration = metrics.task_duration.labels(task_type)
+		self._item_duration = metrics.item_duration.labels(task_type)
+		self._item_bytes = metrics.item_bytes.labels(task_type)
+		self._ts_start = None
+		self._item_state = threading.local()
+
+	def on_new(self) -> None:
+		pass
+
+	def on_start(self) -> None:
+		self._ts_start = time.perf_counter()
+
+	def _end(self, status: str) -> None:
+		self._metrics.tasks.labels(self._task_type, status).inc()
+		if self._ts_start is not None:
+			self._task_duration.observe(time.perf_counter() - self._ts_start)
+
+	def on_finish(self) -> None:
+		self._end(TaskStatusEnum.COMPLETED.value)
+
+	def on_error(self, ex: Exception) -> None:
+		self._end(_get_error_status(ex))
+
+	def on_item_start(self, item_name: str, ref_id: int | None = None) -> None:
+		self._item_state.ts_start = time.perf_counter()
+
+	def on_item_progress(self, description: str) -> None:
+		pass
+
+	def on_item_finish(self, destination_path: str | None, transferred_bytes: int | None = None) -> None:
+		ts_start = getattr(self._item_state, "ts_start", None)
+		if ts_start is not None:
+			self._item_duration.observe(time.perf_counter() - ts_start)
+		self._metrics.items.labels(self._task_type, TaskStatusEnum.COMPLETED.value).inc()
+		if transferred_bytes is not None:
+			self._item_bytes.inc(transferred_bytes)
+		elif destination_path is not None:
+			# not reported by the task, the whole file is counted
+			try:
+				self._item_bytes.inc(os.stat(os.path.join(self._storage_path, destination_path)).st_size)
+			except OSError:
+				pass
 
 	def on_item_error(self, ex: Exception) -> None:
-		self._entity_task_item.status = TaskStatusEnum.ERROR.value
-		self._entity_task_item.ts_end = TaskEventRepositoryWriter._get_current_timestamp()
-		self._entity_task_item.exception_type = ex.__class__.__name__
-		self._entity_task_item.exception_value = TaskEventRepositoryWriter._sanitize_exception_for_write(ex)
-		self._entity_task_item.sync_status = "ignore"
-		self._repository.update_entity(self._entity_task_item)
-		self._entity_task.item_count_fail += 1
+		self._metrics.items.labels(self._task_type, _get_error_status(ex)).inc()
@@ -1,74 +1,142 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
-from logging import Logger
+from logging import Logger, getLogger
 from typing import Dict, Tuple, List
 from pathlib import Path
 from datetime import datetime
-import urllib
-import requests
+import hashlib
 from http import HTTPStatus
 
 
 from youtube_dl.youtube_dl import YoutubeDL
-import bs4
 
 from mconfig import Config, ConfigScrapperRoumen
-from mrepository import Repository
-from mrepository_entities import TaskClassAndType, TaskClass, TaskType
+from mcontentstore import ContentStore
+from mhostguard import CircuitOpenError
+from mhttpclient import HttpClient
+from mlinkextractors import create_link_extractor
+from mmetrics import AppMetrics
+from mrepository import Repository, RepositoryType
+from mrepository_writebehind import RepositoryWriteBehind
+from mrepository_entities import TaskClassAndType, TaskClass, TaskType, MSourceStateE, ItemRetryStatusEnum
 from mscrappers_api import TaskEvents, TaskEventDispatcher
-from mscrappers_eventhandlers import TaskEventLogger, TaskEventRepositoryWriter
-from mformatters import Formatter
+from mcancellation import CancellationToken, TaskCancellations, TaskCancelledError
+from mprocesspool import ProcessTaskRunner
+from mprogress import TaskProgressHub
+from mretryqueue import RetryQueue
+from mscrappers_eventhandlers import TaskEventLogger, TaskEventRepositoryWriter, TaskEventThumbnailer, TaskEventProgress
+from mscrappers_eventhandlers import TaskEventCancellationRegistrar, TaskEventMetrics
+from mseenindex import SeenItemIndex
+from mthumbnails import Thumbnailer
+from mformatters import Formatter, TimestampFormat
 
 
 class TaskFactory(object):
-	def __init__(self, logger: Logger, config: Config, repository_persistent: Repository, repository_in_memory: Repository):
+	def __init__(
+			self,
+			logger: Logger,
+			config: Config,
+			repository_persistent: Repository,
+			repository_in_memory: Repository,
+			repository_write_behind: RepositoryWriteBehind | None,
+			seen_item_index: SeenItemIndex,
+			retry_queue: RetryQueue,
+			http_client: HttpClient,
+			content_store: ContentStore | None,
+			thumbnailer: Thumbnailer | None,
+			progress_hub: TaskProgressHub,
+			process_runner: ProcessTaskRunner | None,
+			task_cancellations: TaskCancellations,
+			metrics: AppMetrics | None
+	):
 		self._logger = logger
 		self._config = config
 		self._repository_persistent = repository_persistent
 		self._repository_in_memory = repository_in_memory
+		self._repository_write_behind = repository_write_behind
+		self._seen_item_index = seen_item_index
+		self._retry_queue = retry_queue
+		self._http_client = http_client
+		self._content_store = content_store
+		self._thumbnailer = thumbnailer
+		self._progress_hub = progress_hub
+		self._process_runner = process_runner
+		self._task_cancellations = task_cancellations
+		self._metrics = metrics
 
 	def _create_event_handler(
 			self,
-			task_def: TaskClassAndType
+			task_def: TaskClassAndType,
+			cancellation_token: CancellationToken
 	):
-		return TaskEventDispatcher((
+		task_writers = {
+			RepositoryType.IN_MEMORY.value: TaskEventRepositoryWriter(self._repository_in_memory, task_def),
+			RepositoryType.PERSISTENT.value: TaskEventRepositoryWriter(self._repository_persistent, task_def, self._repository_write_behind),
+		}
+		event_handlers = [
 			TaskEventLogger(self._logger.getChild("event"), task_def),
-			TaskEventRepositoryWriter(self._repository_in_memory, task_def),
-			TaskEventRepositoryWriter(self._repository_persistent, task_def),
-		))
+			*task_writers.values(),
+			TaskEventProgress(self._progress_hub, task_def, task_writers),
+			TaskEventCancellationRegistrar(self._task_cancellations, cancellation_token, task_writers),
+		]
+		if self._thumbnailer is not None:
+			event_handlers.append(TaskEventThumbnailer(self._thumbnailer))
+		if self._metrics is not None:
+			event_handlers.append(TaskEventMetrics(self._metrics, task_def, self._config.scrappers.storage_path))
+		return TaskEventDispatcher(tuple(event_handlers))
 
 	def create_task_dummy(self, description: str):
 		task_def = TaskClassAndType(TaskClass.DUMMY, TaskType.DUMMY)
-		return _TaskDummy(self._create_event_handler(task_def), description)
+		cancellation_token = CancellationToken()
+		return _TaskDummy(self._create_event_handler(task_def, cancellation_token), cancellation_token, description)
 
 	def create_task_roumen_kecy(self):
 		task_def = TaskClassAndType(TaskClass.SCRAP, TaskType.ROUMEN_KECY)
+		cancellation_token = CancellationToken(self._config.scrappers.roumen_kecy.task_timeout_seconds, started=False)
 		return TaskRoumen(
-			self._create_event_handler(task_def),
+			self._create_event_handler(task_def, cancellation_token),
+			cancellation_token,
 			self._logger.getChild(str(task_def)),
 			task_def,
 			self._config.scrappers.roumen_kecy,
 			self._config.scrappers.storage_path,
-			self._repository_persistent
+			self._repository_persistent,
+			self._seen_item_index,
+			self._retry_queue,
+			self._http_client,
+			self._content_store
 		)
 
 	def create_task_roumen_maso(self):
 		task_def = TaskClassAndType(TaskClass.SCRAP, TaskType.ROUMEN_MASO)
+		cancellation_token = CancellationToken(self._config.scrappers.roumen_maso.task_timeout_seconds, started=False)
 		return TaskRoumen(
-			self._create_event_handler(task_def),
+			self._create_event_handler(task_def, cancellation_token),
+			cancellation_token,
 			self._logger.getChild(str(task_def)),
 			task_def,
 			self._config.scrappers.roumen_maso,
 			self._config.scrappers.storage_path,
-			self._repository_persistent
+			self._repository_persistent,
+			self._seen_item_index,
+			self._retry_queue,
+			self._http_client,
+			self._content_store
 		)
 
 	def create_task_youtube_dl(self, urls: Tuple[str, ...]):
 		task_def = TaskClassAndType(TaskClass.SCRAP, TaskType.YOUTUBE_DL)
+		config_youtube_dl = self._config.scrappers.youtube_dl
+		cancellation_token = CancellationToken(config_youtube_dl.task_timeout_seconds, started=False)
 		return TaskYoutubeDownload(
-			self._create_event_handler(task_def),
+			self._create_event_handler(task_def, cancellation_token),
+			cancellation_token,
+			config_youtube_dl.item_timeout_seconds,
 			self._logger.getChild(str(task_def)),
 			f"{self._config.scrappers.storage_path}",
-			urls
+			urls,
+			self._process_runner
 		)
 
 
@@ -78,21 +146,26 @@ class TaskFactory(object):
 
 
 class _TaskDummy(object):
-	def __init__(self, scrapper_event_handler: TaskEvents, description: str):
+	def __init__(self, scrapper_event_handler: TaskEvents, cancellation_token: CancellationToken, description: str):
 		self._event = scrapper_event_handler
+		self._cancellation_token = cancellation_token
 		self._description = description
 		self._event.on_new()
 
 	def __call__(self):
 		i_max, j_max = 10, 10
 		self._event.on_start()
-		for i in range(i_max):
-			self._event.on_item_start(f"item '{self._description}' #{i+1} of #{i_max}")
-			for j in range(j_max):
-				sleep(.1)
-				self._event.on_item_progress(f"item '{self._description}' #{i+1} progress: {Formatter.percentage_str(j+1, j_max)}")
-			self._event.on_item_finish(None)
-		self._event.on_finish()
+		try:
+			for i in range(i_max):
+				self._cancellation_token.raise_if_cancelled()
+				self._event.on_item_start(f"item '{self._description}' #{i+1} of #{i_max}")
+				for j in range(j_max):
+					sleep(.1)
+					self._event.on_item_progress(f"item '{self._description}' #{i+1} progress: {Formatter.percentage_str(j+1, j_max)}")
+				self._event.on_item_finish(None)
+			self._event.on_finish()
+		except TaskCancelledError as ex:
+			self._event.on_error(ex)
 
 
 """
@@ -100,9 +173,11 @@ class _TaskDummy(object):
 """
 
 
-class TaskRoumen(object):
+class IncompleteDownloadError(Exception):
+	pass
+
 
-	RECENT_ITEMS_LIMIT = 5000  # how many recent items should be read (this images won't be downloaded again)
+class TaskRoumen(object):
 
 	REQUEST_HEADERS = {
 			"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:81.0) Gecko/20100101 Firefox/81.0",
@@ -111,74 +186,227 @@ class TaskRoumen(object):
 	def __init__(
 			self,
 			task_event_handler: TaskEvents,
+			cancellation_token: CancellationToken,
 			logger: Logger,
 			task_def: TaskClassAndType,
 			config_scrapper: ConfigScrapperRoumen,
 			storage_dir: str,
-			repository: Repository
+			repository: Repository,
+			seen_item_index: SeenItemIndex,
+			retry_queue: RetryQueue,
+			http_client: HttpClient,
+			content_store: ContentStore | None
 	):
 		self._event = task_event_handler
+		self._cancellation_token = cancellation_token
 		self._logger = logger
 		self._task_def = task_def
 		self._config_scrapper = config_scrapper
 		self._storage_dir = storage_dir
 		self._repository = repository
+		self._seen_item_index = seen_item_index
+		self._retry_queue = retry_queue
+		self._retries = {}
+		self._http_client = http_client
+		self._content_store = content_store
+		self._page_source_state = None
+		# the download workers of all the tasks of the host share its download slots
+		self._image_host_guard = http_client.get_host_guard(
+			config_scrapper.img_base,
+			config_scrapper.rate_limit,
+			config_scrapper.circuit_breaker,
+			max(1, config_scrapper.download_workers)
+		)
+		self._skipped_on_open_circuit = False
 		self._event.on_new()
 
-	def __call__(self):
+	def __call__(self) -> int | None:
+		""" returns the count of the new items found (None on error), the scheduler adapts the polling to it """
+		self._cancellation_token.start()
 		self._event.on_start()
 		try:
 			ts = datetime.now()
-
-			for image_name_to_download in self._get_image_names_to_download():
-				try:
-					self._event.on_item_start(image_name_to_download)
-
-					# path will be like "{scrap_path}/{source}/{yyyy}/{week}/{image.jpg}"
-					relative_path = Path(self._task_def.typ.value).joinpath(f"{ts:%Y}").joinpath(f"{ts:%V}")
-					destination_path = self._storage_dir / relative_path
-
-					destination_path.mkdir(parents=True, exist_ok=True)
-					relative_file_path = relative_path / image_name_to_download
-
-					remote_file_url = f"{self._config_scrapper.img_base}/{image_name_to_download}"
-					self._logger.debug(f"Downloading {remote_file_url!s} to {destination_path!s}...")
-					r = requests.get(
-						remote_file_url,
-						stream=True,
-						headers=TaskRoumen.REQUEST_HEADERS,
-						timeout=self._config_scrapper.request_timeout_seconds
-					)
-
-					self._logger.debug(f"Request finished with status '{r.status_code}'.")
-					if r.status_code != HTTPStatus.OK:
-						raise RuntimeError(f"Unexpected status {r.status_code}: {r.text}.")
-
-					self._logger.debug(f"Writing response content to file '{(destination_path / image_name_to_download)!s}'.")
-					with open(str(destination_path / image_name_to_download), "wb") as fh:
-						for chunk in r.iter_content(chunk_size=self._config_scrapper.request_chunk_size):
-							if chunk:
-								fh.write(chunk)
-
-					self._logger.debug(f"File '{image_name_to_download}' scrapped successfully.")
-					self._event.on_item_finish(str(relative_file_path))
-
-				except Exception as ex:
-					self._event.on_item_error(ex)
+			self._cancellation_token.raise_if_cancelled()
+			image_names_to_download = self._get_image_names_to_download()
+			download_workers = max(1, self._config_scrapper.download_workers)
+
+			if download_workers == 1 or len(image_names_to_download) < 2:
+				results = [self._download_image(ts, image_name) for image_name in image_names_to_download]
+			else:
+				self._logger.debug(f"Downloading {len(image_names_to_download)} images using {download_workers} workers.")
+				with ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix=str(self._task_def)) as executor:
+					results = list(executor.map(lambda image_name: self._download_image(ts, image_name), image_names_to_download))
+
+			# the items not started are not recorded at all
+			self._cancellation_token.raise_if_cancelled()
+			if self._skipped_on_open_circuit:
+				raise CircuitOpenError(f"Circuit of host '{self._image_host_guard.host}' opened, the remaining images skipped.")
+
+			# page is remembered as processed only when nothing failed (or waits for a retry), otherwise the next run has to parse it again
+			retry_waiting = any(r.status == ItemRetryStatusEnum.RETRY.value and r.item_name not in image_names_to_download for r in self._retries.values())
+			if self._page_source_state is not None and all(results) and not retry_waiting:
+				self._repository.save_source_state(self._page_source_state)
 
 			self._event.on_finish()
+			return len(image_names_to_download)
 		except Exception as ex:
 			self._event.on_error(ex)
+			return None
+
+	def _download_image(self, ts: datetime, image_name_to_download: str) -> bool:
+		if self._cancellation_token.is_cancelled:
+			return False
+		if self._image_host_guard.is_open:
+			# the host is down, the item is left for the next run
+			self._skipped_on_open_circuit = True
+			return False
+		try:
+			self._event.on_item_start(image_name_to_download)
+			item_cancellation_token = self._cancellation_token.child(self._config_scrapper.item_timeout_seconds)
+
+			# path will be like "{scrap_path}/{source}/{yyyy}/{week}/{image.jpg}"
+			relative_path = Path(self._task_def.typ.value).joinpath(f"{ts:%Y}").joinpath(f"{ts:%V}")
+			destination_path = self._storage_dir / relative_path
+
+			destination_path.mkdir(parents=True, exist_ok=True)
+			relative_file_path = relative_path / image_name_to_download
+
+			remote_file_url = f"{self._config_scrapper.img_base}/{image_name_to_download}"
+			destination_file = destination_path / image_name_to_download
+			# the final name appears only complete, a partial transfer is resumed by the next attempt (even in another week)
+			parts_path = self._storage_dir / Path(self._task_def.typ.value) / ".parts"
+			parts_path.mkdir(parents=True, exist_ok=True)
+			part_file = parts_path / f"{image_name_to_download}.part"
+			self._logger.debug(f"Downloading {remote_file_url!s} to {part_file!s}...")
+			# the content hash is computed while writing, only for the content store
+			hasher = None if self._content_store is None else ContentStore.new_hasher()
+			with self._image_host_guard.download_slot(item_cancellation_token):
+				transferred_bytes = self._download_to_part_file(remote_file_url, part_file, item_cancellation_token, hasher)
+
+			if self._content_store is None:
+				os.replace(part_file, destination_file)
+			else:
+				# the content is moved into the content store
+				digest = hasher.hexdigest()
+				if self._content_store.store_file(part_file, digest, destination_file):
+					self._logger.debug(f"File '{image_name_to_download}' is a duplicate of already stored content {digest}.")
+
+			self._logger.debug(f"File '{image_name_to_download}' scrapped successfully.")
+			self._seen_item_index.add(self._task_def, image_name_to_download)
+			if image_name_to_download in self._retries:
+				self._retry_queue.record_success(self._task_def, image_name_to_download)
+			self._event.on_item_finish(str(relative_file_path), transferred_bytes)
+			return True
+
+		except Exception as ex:
+			# the item is not to blame when the task is cancelled or the host is down
+			if not self._cancellation_token.is_cancelled and not isinstance(ex, CircuitOpenError):
+				self._retry_queue.record_failure(self._task_def, image_name_to_download, ex)
+			self._event.on_item_error(ex)
+			return False
+
+	def _download_to_part_file(self, remote_file_url: str, part_file: Path, cancellation_token: CancellationToken, hasher=None) -> int:
+		"""
+		streams the remote file into the part file, resumes with a range request when the part file exists.
+		the validator of the response (etag or last-modified) is kept next to the part file and sent as If-Range,
+		so a remote file changed in the meantime comes whole. a part file without the validator is downloaded again.
+		raises (keeping the part file) when the transfer ends short of the content length.
+		the hasher (if any) gets the whole content, the resumed bytes are read from the part file.
+		returns the bytes transferred by this call.
+		"""
+		validator_file = part_file.with_name(f"{part_file.name}.validator")
+		validator = validator_file.read_text().strip() if validator_file.exists() else ""
+		offset = part_file.stat().st_size if part_file.exists() and validator != "" else 0
+		request_headers = dict(TaskRoumen.REQUEST_HEADERS)
+		if offset > 0:
+			self._logger.debug(f"Resuming '{part_file!s}' from byte {offset} if still '{validator}'.")
+			request_headers["Range"] = f"bytes={offset}-"
+			request_headers["If-Range"] = validator
+
+		# response is closed in any case, so the pooled connection is released
+		with self._http_client.get(
+			remote_file_url,
+			stream=True,
+			headers=request_headers,
+			timeout=self._config_scrapper.request_timeout,
+			rate_limit=self._config_scrapper.rate_limit,
+			circuit_breaker=self._config_scrapper.circuit_breaker
+		) as r:
+			self._logger.debug(f"Request finished with status '{r.status_code}'.")
+			match r.status_code:
+				case HTTPStatus.OK:
+					# the whole content (the range is not supported, not asked or the remote file changed)
+					offset = 0
+					TaskRoumen._write_validator(validator_file, r.headers)
+				case HTTPStatus.PARTIAL_CONTENT if TaskRoumen._get_range_start(r.headers) == offset:
+					TaskRoumen._hash_file(hasher, part_file)
+				case HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE if TaskRoumen._get_range_total(r.headers) == offset:
+					self._logger.debug(f"File '{part_file!s}' already complete.")
+					TaskRoumen._hash_file(hasher, part_file)
+					validator_file.unlink(missing_ok=True)
+					return 0
+				case _:
+					part_file.unlink(missing_ok=True)
+					validator_file.unlink(missing_ok=True)
+					raise RuntimeError(f"Unexpected status {r.status_code}: {r.text}.")
+
+			# the length of the decoded content is not known
+			content_length = None if "Content-Encoding" in r.headers else r.headers.get("Content-Length", None)
+			expected_size = None if content_length is None else offset + int(content_length)
+
+			with open(str(part_file), "ab" if offset > 0 else "wb") as fh:
+				for chunk in r.iter_content(chunk_size=self._config_scrapper.request_chunk_size):
+					cancellation_token.raise_if_cancelled()
+					if chunk:
+						fh.write(chunk)
+						if hasher is not None:
+							hasher.update(chunk)
+				size = fh.tell()
+
+			if expected_size is not None and size != expected_size:
+				raise IncompleteDownloadError(f"Transfer of '{remote_file_url}' ended at byte {size} of {expected_size}.")
+			validator_file.unlink(missing_ok=True)
+			return size - offset
+
+	@staticmethod
+	def _write_validator(validator_file: Path, headers) -> None:
+		# If-Range takes a strong etag or a date only
+		etag = headers.get("ETag", "")
+		validator = etag if etag != "" and not etag.startswith("W/") else headers.get("Last-Modified", "")
+		if validator != "":
+			validator_file.write_text(validator)
+		else:
+			validator_file.unlink(missing_ok=True)
+
+	@staticmethod
+	def _get_range_start(headers) -> int | None:
+		# "Content-Range: bytes 100-199/200"
+		content_range = headers.get("Content-Range", "")
+		if not content_range.startswith("bytes ") or "-" not in content_range:
+			return None
+		start = content_range[len("bytes "):].split("-", 1)[0]
+		return int(start) if start.isdigit() else None
+
+	@staticmethod
+	def _get_range_total(headers) -> int | None:
+		# "Content-Range: bytes */200"
+		total = headers.get("Content-Range", "").rpartition("/")[2]
+		return int(total) if total.isdigit() else None
+
+	@staticmethod
+	def _hash_file(hasher, file: Path) -> None:
+		if hasher is None:
+			return
+		with open(str(file), "rb") as fh:
+			while chunk := fh.read(1024 * 1024):
+				hasher.update(chunk)
 
 	def _get_image_names_to_download(self) -> List[str]:
-		self._logger.debug(f"Reading recent task items for '{self._task_def}' task.")
-		recent_items = self._repository.read_recent_task_items(self._task_def, TaskRoumen.RECENT_ITEMS_LIMIT)
-		self._logger.debug(f"{len(recent_items)} recent items read.")
-		recent_items_names = set(i.item_name for i in recent_items)
-		self._logger.debug(f"{len(recent_items_names)} recent item names available.")
 		remote_images = self._scrap_image_names_from_website()
-		remote_images = [_ for _ in remote_images if _ not in recent_items_names]
+		self._logger.debug(f"Filtering {len(remote_images)} remote images already scrapped for '{self._task_def}' task.")
+		remote_images = self._seen_item_index.filter_new(self._task_def, remote_images)
 		self._logger.debug(f"{len(remote_images)} remote images not scrapped yet.")
+		remote_images, self._retries = self._retry_queue.filter_eligible(self._task_def, remote_images)
 
 		self._logger.debug(f"Removing duplicate image names...")
 		seen = set()
@@ -189,21 +417,51 @@ class TaskRoumen(object):
 
 	""" mine all the image paths from website """
 	def _scrap_image_names_from_website(self) -> List[str]:
+		source_state = self._repository.load_source_state(self._task_def) if self._config_scrapper.skip_unchanged_page else None
+		request_headers = dict(TaskRoumen.REQUEST_HEADERS)
+		if source_state is not None:
+			if source_state.etag is not None:
+				request_headers["If-None-Match"] = source_state.etag
+			if source_state.last_modified is not None:
+				request_headers["If-Modified-Since"] = source_state.last_modified
+
 		self._logger.debug(f"Requesting page '{self._config_scrapper.base_url}' for images.")
-		get_result = requests.get(self._config_scrapper.base_url, params=self._config_scrapper.url_params)
+		get_result = self._http_client.get(
+			self._config_scrapper.base_url,
+			params=self._config_scrapper.url_params,
+			headers=request_headers,
+			timeout=self._config_scrapper.request_timeout,
+			rate_limit=self._config_scrapper.rate_limit,
+			circuit_breaker=self._config_scrapper.circuit_breaker
+		)
 		self._logger.debug(f"'{self._config_scrapper.base_url}' result code: '{get_result.status_code}'.")
-		soup = bs4.BeautifulSoup(get_result.content.decode(get_result.apparent_encoding), features="html.parser")
-
-		# extract all "a" tags having "roumingShow.php" present in the "href"
-		self._logger.debug(f"Extracting links from the page.")
-		all_urls = map(lambda a: urllib.parse.urlparse(a.get("href")), soup.find_all("a"))
-		all_show = [url for url in all_urls if isinstance(url.path, str) and self._config_scrapper.href_needle in url.path]
-		self._logger.debug(f"{len(all_show)} links extracted.")
-
-		# extract all "file" values from the query string
-		self._logger.debug(f"Extracing image names...")
-		all_qstr = [urllib.parse.parse_qs(url.query) for url in all_show]
-		all_imgs = [qs.get("file").pop() for qs in all_qstr if "file" in qs]
+
+		if get_result.status_code == HTTPStatus.NOT_MODIFIED:
+			self._logger.info(f"Page '{self._config_scrapper.base_url}' not modified since the last run.")
+			return []
+
+		if get_result.status_code != HTTPStatus.OK:
+			raise RuntimeError(f"Unexpected status {get_result.status_code} of page '{self._config_scrapper.base_url}'.")
+
+		content_hash = hashlib.sha256(get_result.content).hexdigest()
+		if source_state is not None and source_state.content_hash == content_hash:
+			self._logger.info(f"Page '{self._config_scrapper.base_url}' content unchanged since the last run.")
+			return []
+
+		self._page_source_state = MSourceStateE(
+			task_type=self._task_def.typ.value,
+			etag=get_result.headers.get("ETag", None),
+			last_modified=get_result.headers.get("Last-Modified", None),
+			content_hash=content_hash,
+			ts_update=Formatter.ts_to_str(TimestampFormat.DATETIME_MS),
+		)
+
+		# charset detection over the whole body is expensive, the declared one is preferred
+		encoding = get_result.encoding if "charset" in get_result.headers.get("Content-Type", "").lower() else get_result.apparent_encoding
+
+		self._logger.debug(f"Extracting image names from the page ({self._config_scrapper.link_extractor.value} extractor, encoding {encoding}).")
+		link_extractor = create_link_extractor(self._config_scrapper.link_extractor, self._config_scrapper.href_needle)
+		all_imgs = link_extractor.extract(get_result.content, encoding)
 		self._logger.debug(f"{len(all_imgs)} image names extracted.")
 
 		return all_imgs
@@ -229,18 +487,81 @@ class _YoutubeLogger(object):
 
 
 class TaskYoutubeDownload(object):
-	def __init__(self, task_event_handler: TaskEvents, yt_logger: Logger, storage_directory: str, urls: Tuple[str, ...]):
+	def __init__(
+			self,
+			task_event_handler: TaskEvents,
+			cancellation_token: CancellationToken,
+			item_timeout_seconds: float | None,
+			yt_logger: Logger,
+			storage_directory: str,
+			urls: Tuple[str, ...],
+			process_runner: ProcessTaskRunner | None = None
+	):
 		self._event = task_event_handler
+		self._cancellation_token = cancellation_token
+		self._item_timeout_seconds = item_timeout_seconds
 		self._yt_logger = yt_logger
-		self._urls = [url.strip() for url in urls if len(url.strip()) > 0]
+		self._urls = tuple(url.strip() for url in urls if len(url.strip()) > 0)
 		self._storage_directory = storage_directory
+		self._process_runner = process_runner
 		self._event.on_new()
-		self._destination_path = None
 
 	def __call__(self):
+		self._cancellation_token.start()
+		if self._process_runner is None:
+			_YoutubeDownloader(
+				self._event, self._cancellation_token, self._item_timeout_seconds, self._yt_logger, self._storage_directory, self._urls
+			).download()
+			return
+
+		try:
+			# the events are replayed here, to the handlers of this process
+			self._process_runner.run(
+				self._event,
+				self._cancellation_token,
+				_youtube_download_in_process,
+				self._item_timeout_seconds,
+				self._yt_logger.name,
+				self._storage_directory,
+				self._urls
+			)
+		except Exception as ex:
+			# the worker process died
+			self._event.on_error(ex)
+
+
+def _youtube_download_in_process(
+		task_event_handler: TaskEvents,
+		cancellation_token: CancellationToken,
+		item_timeout_seconds: float | None,
+		yt_logger_name: str,
+		storage_directory: str,
+		urls: Tuple[str, ...]
+):
+	_YoutubeDownloader(task_event_handler, cancellation_token, item_timeout_seconds, getLogger(yt_logger_name), storage_directory, urls).download()
+
+
+class _YoutubeDownloader(object):
+	def __init__(
+			self,
+			task_event_handler: TaskEvents,
+			cancellation_token: CancellationToken,
+			item_timeout_seconds: float | None,
+			yt_logger: Logger,
+			storage_directory: str,
+			urls: Tuple[str, ...]
+	):
+		self._event = task_event_handler
+		self._cancellation_token = cancellation_token
+		self._item_timeout_seconds = item_timeout_seconds
+		self._item_cancellation_token = None
+		self._yt_logger = yt_logger
+		self._urls = urls
+		self._storage_directory = storage_directory
+
+	def download(self):
 		ts = datetime.now()
 		self._event.on_start()
-
 		try:
 			ydl_opts = {
 				# "format": "bestvideo",
@@ -256,13 +577,16 @@ class TaskYoutubeDownload(object):
 			}
 
 			for url in self._urls:
+				self._cancellation_token.raise_if_cancelled()
 				try:
 					self._event.on_item_start(url)
+					self._item_cancellation_token = self._cancellation_token.child(self._item_timeout_seconds)
 
+					# youtube-dl streams into "*.part" files renamed when complete (and resumes them) by default
 					with YoutubeDL(ydl_opts) as ydl:
-						ydl.download([url])
+						destination_file = self._get_final_file(ydl, ydl.extract_info(url, download=True))
 
-					self._event.on_item_finish(self._destination_path)
+					self._event.on_item_finish(destination_file.removeprefix(self._storage_directory))
 
 				except Exception as ex:
 					self._event.on_item_error(ex)
@@ -272,7 +596,18 @@ class TaskYoutubeDownload(object):
 		except Exception as ex:
 			self._event.on_error(ex)
 
+	@staticmethod
+	def _get_final_file(ydl: YoutubeDL, info: Dict) -> str:
+		""" the file name youtube-dl ends with (after merging the formats), the last one of a playlist """
+		entries = [e for e in info.get("entries", None) or [info] if e is not None]
+		final_file = None if len(entries) == 0 else ydl.prepare_filename(entries[-1])
+		if final_file is None or not os.path.isfile(final_file):
+			raise IncompleteDownloadError(f"Downloaded file '{final_file}' not found.")
+		return final_file
+
 	def _progress_hook(self, info: Dict[str, str], *args, **kwargs):
+		# raised through youtube-dl, the item ends with the error
+		self._item_cancellation_token.raise_if_cancelled()
 		try:
 			# status, downloaded_bytes, fragment_index, fragment_count, filename, tmpfilename, elapsed, total_bytes_estimate, speed, eta, _eta_str, _percent_str, _speed_str, _total_bytes_estimate_str
 			self._event.on_item_progress(
@@ -283,11 +618,5 @@ class TaskYoutubeDownload(object):
 				f" speed: {info.get('_speed_str', 'n/a').strip()}"
 			)
 
-			if info.get("status", "-").lower() == "finished":
-				self._destination_path = None
-
-			if self._destination_path is None and info.get("filename", None) is not None:
-				self._destination_path = info.get("filename").removeprefix(self._storage_directory)
-
 		except Exception as ex:
 			self._event.on_item_progress(f"Exception {ex}.")
@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+from logging import Logger
+from typing import Dict, List
+
+from mrepository import Repository
+from mrepository_entities import TaskClassAndType
+
+
+class SeenItemIndex(object):
+	"""
+	answers "which of these item names were not downloaded yet" for a task type.
+	the repository is the source of truth, names known to be seen are kept in a bounded lru cache,
+	so the names repeating on the source page don't hit the database on every run.
+	"""
+
+	def __init__(self, logger: Logger, repository: Repository, cache_size: int):
+		self._logger = logger
+		self._repository = repository
+		self._cache_size = max(0, cache_size)
+		self._cache: Dict[str, OrderedDict] = {}
+		self._lock = threading.Lock()
+
+	def _cache_for(self, task_def: TaskClassAndType) -> OrderedDict:
+		return self._cache.setdefault(task_def.typ.value, OrderedDict())
+
+	def _cache_add(self, task_def: TaskClassAndType, item_names) -> None:
+		cache = self._cache_for(task_def)
+		for item_name in item_names:
+			cache[item_name] = None
+			cache.move_to_end(item_name)
+		while len(cache) > self._cache_size:
+			cache.popitem(last=False)
+
+	def filter_new(self, task_def: TaskClassAndType, item_names: List[str]) -> List[str]:
+		""" returns item names not seen yet, order is kept """
+		with self._lock:
+			cache = self._cache_for(task_def)
+			unknown_names = [item_name for item_name in set(item_names) if item_name not in cache]
+			for item_name in item_names:
+				if item_name in cache:
+					cache.move_to_end(item_name)
+
+		self._logger.debug(f"{len(item_names) - len(unknown_names)} names of '{task_def}' found in the cache, {len(unknown_names)} to look up.")
+		seen_names = self._repository.read_seen_item_names(task_def, unknown_names) if len(unknown_names) > 0 else set()
+
+		with self._lock:
+			self._cache_add(task_def, seen_names)
+
+		new_names = set(unknown_names).difference(seen_names)
+		return [item_name for item_name in item_names if item_name in new_names]
+
+	def add(self, task_def: TaskClassAndType, item_name: str) -> None:
+		self._repository.save_seen_item_names(task_def, [item_name])
+		with self._lock:
+			self._cache_add(task_def, (item_name, ))
@@ -1,24 +1,86 @@
+import queue
 import sqlite3
+import threading
+import time
 from logging import Logger
+from typing import Callable, Dict, List
+
+from msqlprofiler import SqlProfiler
 
 
 class SqliteApi(object):
-	def __init__(self, logger: Logger, sqlite_datafile: str) -> None:
+	def __init__(
+			self,
+			logger: Logger,
+			sqlite_datafile: str,
+			pool_size: int = 4,
+			pragmas: Dict[str, str | int] | None = None,
+			profiler: SqlProfiler | None = None
+	) -> None:
 		self._logger = logger
 		self._logger_sql = logger.getChild("sql")
 		self.sqlite_datafile = sqlite_datafile
-
-	def do_with_connection(self, connection_cb: callable):
+		self._pragmas = dict(pragmas) if pragmas is not None else {}
+		# long-lived connections are shared by all threads, at most pool_size of them are in use at once
+		self._pool = queue.LifoQueue()
+		self._pool_slots = threading.BoundedSemaphore(max(1, pool_size))
+		self._observers: List[Callable[[str, float], None]] = []
+		self._profiler = profiler
+
+	def add_observer(self, observer: Callable[[str, float], None]) -> None:
+		""" observer(operation, seconds) is called after each call (read, write, update or connection) """
+		self._observers.append(observer)
+
+	def _open_connection(self) -> sqlite3.Connection:
 		self._logger.debug(f"Opening connection for '{self.sqlite_datafile}'.")
 		db_conn = sqlite3.connect(self.sqlite_datafile, check_same_thread=False)
 		try:
-			with db_conn:
-				return connection_cb(db_conn)
-		finally:
+			for pragma_name, pragma_value in self._pragmas.items():
+				self._logger_sql.debug(f"SQL: PRAGMA {pragma_name}={pragma_value}")
+				db_conn.execute(f"PRAGMA {pragma_name}={pragma_value}")
+		except Exception:
+			db_conn.close()
+			raise
+		return db_conn
+
+	def _acquire_connection(self) -> sqlite3.Connection:
+		self._pool_slots.acquire()
+		try:
+			return self._pool.get_nowait()
+		except queue.Empty:
+			pass
+
+		try:
+			return self._open_connection()
+		except Exception:
+			self._pool_slots.release()
+			raise
+
+	def _release_connection(self, db_conn: sqlite3.Connection):
+		self._pool.put(db_conn)
+		self._pool_slots.release()
+
+	def close(self):
+		while True:
+			try:
+				db_conn = self._pool.get_nowait()
+			except queue.Empty:
+				break
 			self._logger.debug(f"Closing connection for '{self.sqlite_datafile}'.")
 			db_conn.close()
 
-	def do_with_cursor(self, cursor_cb: callable):
+	def do_with_connection(self, connection_cb: callable, operation: str = "connection"):
+		ts_start = time.perf_counter()
+		db_conn = self._acquire_connection()
+		try:
+			with db_conn:
+				return connection_cb(db_conn if self._profiler is None else self._profiler.wrap(db_conn))
+		finally:
+			self._release_connection(db_conn)
+			for observer in self._observers:
+				observer(operation, time.perf_counter() - ts_start)
+
+	def do_with_cursor(self, cursor_cb: callable, operation: str = "cursor"):
 		def _cursor_call(connection):
 			db_cursor = connection.cursor()
 			try:
@@ -28,18 +90,19 @@ class SqliteApi(object):
 			finally:
 				db_cursor.close()
 
-		return self.do_with_connection(_cursor_call)
+		return self.do_with_connection(_cursor_call, operation)
 
 	def read(self, sql_stmt: str, binds, row_mapper: callable = None):
 		def _reader(cursor):
-			r_mapper = row_mapper if row_mapper is not None else lambda row: row
-			result = list()
-			for r in cursor.execute(sql_stmt, binds):
-				result.append(r_mapper(r))
-			return result
+			if self._profiler is not None:
+				rows = cursor.read(sql_stmt, binds)
+				return rows if row_mapper is None else list(map(row_mapper, rows))
+			if row_mapper is None:
+				return cursor.execute(sql_stmt, binds).fetchall()
+			return list(map(row_mapper, cursor.execute(sql_stmt, binds)))
 
 		self._logger_sql.debug(f"SQL: {sql_stmt}, binds: {binds}")
-		return self.do_with_cursor(_reader)
+		return self.do_with_cursor(_reader, "read")
 
 	def compose_and_read(
 			self,
@@ -73,7 +136,7 @@ class SqliteApi(object):
 			self._logger_sql.debug(f"SQL: {sql_stmt}")
 			connection.execute(sql_stmt, value_mapping)
 
-		return self.do_with_connection(_writer)
+		return self.do_with_connection(_writer, "write")
 
 	def update(self, table_name, value_mapping: dict, where_condition_mapping: dict):
 		def _writer(connection):
@@ -89,7 +152,7 @@ class SqliteApi(object):
 				**{f"where_{k}": v for (k, v) in where_condition_mapping.items()}
 			})
 
-		return self.do_with_connection(_writer)
+		return self.do_with_connection(_writer, "update")
 
 	def read_last_seq(self, table_name):
 		def _reader(cursor):
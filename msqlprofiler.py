@@ -0,0 +1,150 @@
+import math
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from logging import Logger
+from sqlite3 import Connection, Cursor
+from typing import Dict, List
+
+from mconfig import ConfigSqlProfiler
+
+OTHER_STATEMENTS = "(other statements)"
+
+_EXPLAINABLE = ("select", "insert", "update", "delete", "replace", "with")
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(sql_stmt: str) -> str:
+	""" the statement without the layout, the numbered binds of the in-lists and the number literals """
+	shape = re.sub(r"\s+", " ", sql_stmt).strip()
+	shape = re.sub(r":([a-z_]+)\d+(?:\s*,\s*:\1\d+)*", r":\1*", shape)
+	return re.sub(r"(?<![\w:])\d+\b", "?", shape)
+
+
+class _StatementStats(object):
+	__slots__ = ("calls", "seconds", "max_seconds", "rows", "samples")
+
+	def __init__(self, samples: int):
+		self.calls = 0
+		self.seconds = 0.0
+		self.max_seconds = 0.0
+		self.rows = 0
+		self.samples = deque(maxlen=samples)
+
+	def p95_seconds(self) -> float:
+		ordered = sorted(self.samples)
+		return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)] if len(ordered) > 0 else 0.0
+
+
+class SqlProfiler(object):
+	"""
+	call counts, times and rows of the sql statements by their shape (the recent calls give the p95).
+	the statements slower than the threshold are logged with their query plan.
+	"""
+
+	def __init__(self, logger: Logger, config: ConfigSqlProfiler):
+		self._logger = logger
+		self._config = config
+		self._stats: Dict[str, _StatementStats] = {}
+		self._lock = threading.Lock()
+
+	def wrap(self, db_conn: Connection) -> "_ProfiledConnection":
+		return _ProfiledConnection(self, db_conn)
+
+	def record(self, db_conn: Connection, sql_stmt: str, binds, seconds: float, rows: int) -> None:
+		shape = statement_shape(sql_stmt)
+		with self._lock:
+			stats = self._stats.get(shape, None)
+			if stats is None:
+				if len(self._stats) >= self._config.max_statements:
+					shape = OTHER_STATEMENTS
+				stats = self._stats.setdefault(shape, _StatementStats(self._config.samples))
+			stats.calls += 1
+			stats.seconds += seconds
+			stats.max_seconds = max(stats.max_seconds, seconds)
+			stats.rows += rows
+			stats.samples.append(seconds)
+
+		if seconds * 1000 >= self._config.slow_query_ms:
+			self._logger.warning(f"Slow SQL ({seconds * 1000:.1f} ms, {rows} rows): {shape}{self._explain(db_conn, sql_stmt, binds)}")
+
+	def _explain(self, db_conn: Connection, sql_stmt: str, binds) -> str:
+		if not sql_stmt.lstrip().lower().startswith(_EXPLAINABLE):
+			return ""
+		try:
+			plan = db_conn.execute(f"EXPLAIN QUERY PLAN {sql_stmt}", binds).fetchall()
+		except Exception as ex:
+			return f"\nQuery plan not available: {ex!s}"
+		return "".join(f"\n  {row[3]}" for row in plan)
+
+	def stats(self) -> List[Dict[str, int | float | str]]:
+		""" the statements taking the most time first """
+		with self._lock:
+			stats = [
+				{
+					"statement": shape,
+					"calls": s.calls,
+					"total_ms": s.seconds * 1000,
+					"avg_ms": s.seconds * 1000 / s.calls,
+					"p95_ms": s.p95_seconds() * 1000,
+					"max_ms": s.max_seconds * 1000,
+					"rows": s.rows,
+				}
+				for shape, s in self._stats.items()
+			]
+		return sorted(stats, key=lambda s: s["total_ms"], reverse=True)
+
+
+class _ProfiledCursor(object):
+	""" times the statements of the cursor, the rows are counted for read() only (the others report the changed rows) """
+
+	def __init__(self, profiler: SqlProfiler, db_cursor: Cursor, db_conn: Connection):
+		self._profiler = profiler
+		self._cursor = db_cursor
+		self._conn = db_conn
+
+	def __getattr__(self, name: str):
+		return getattr(self._cursor, name)
+
+	def __iter__(self):
+		return iter(self._cursor)
+
+	def execute(self, sql_stmt: str, binds=()) -> "_ProfiledCursor":
+		ts_start = time.perf_counter()
+		self._cursor.execute(sql_stmt, binds)
+		self._profiler.record(self._conn, sql_stmt, binds, time.perf_counter() - ts_start, max(0, self._cursor.rowcount))
+		return self
+
+	def executemany(self, sql_stmt: str, binds_seq) -> "_ProfiledCursor":
+		binds_seq = list(binds_seq)
+		ts_start = time.perf_counter()
+		self._cursor.executemany(sql_stmt, binds_seq)
+		self._profiler.record(self._conn, sql_stmt, binds_seq[0] if len(binds_seq) > 0 else (), time.perf_counter() - ts_start, max(0, self._cursor.rowcount))
+		return self
+
+	def read(self, sql_stmt: str, binds) -> list:
+		""" executes and fetches all the rows, both timed """
+		ts_start = time.perf_counter()
+		rows = self._cursor.execute(sql_stmt, binds).fetchall()
+		self._profiler.record(self._conn, sql_stmt, binds, time.perf_counter() - ts_start, len(rows))
+		return rows
+
+
+class _ProfiledConnection(object):
+	def __init__(self, profiler: SqlProfiler, db_conn: Connection):
+		self._profiler = profiler
+		self._conn = db_conn
+
+	def __getattr__(self, name: str):
+		return getattr(self._conn, name)
+
+	def cursor(self) -> _ProfiledCursor:
+		return _ProfiledCursor(self._profiler, self._conn.cursor(), self._conn)
+
+	def execute(self, sql_stmt: str, binds=()) -> _ProfiledCursor:
+		return self.cursor().execute(sql_stmt, binds)
+
+	def executemany(self, sql_stmt: str, binds_seq) -> _ProfiledCursor:
+		return self.cursor().executemany(sql_stmt, binds_seq)
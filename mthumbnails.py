@@ -0,0 +1,113 @@
+import os
+from concurrent.futures import Future
+from logging import Logger
+from pathlib import Path
+from typing import List, Tuple
+
+from mconfig import ConfigThumbnails
+from mprocesspool import SpawnedProcessPool
+from mrepository import Repository
+from mrepository_entities import MItemVariantE
+
+try:
+	from PIL import Image, ImageOps
+except ImportError:  # optional, thumbnails are not generated without it
+	Image, ImageOps = None, None
+
+ORIGINAL_VARIANT = "original"
+
+# PIL format names and the file suffixes of the variants
+_VARIANT_FORMATS = {
+	"jpeg": ("JPEG", "jpg"),
+	"webp": ("WEBP", "webp"),
+}
+
+
+def is_available() -> bool:
+	return Image is not None
+
+
+def variant_name(width: int, variant_format: str) -> str:
+	return f"w{width}.{_VARIANT_FORMATS[variant_format][1]}"
+
+
+def make_variants(
+		storage_path: str,
+		destination_path: str,
+		thumbnails_path: str,
+		widths: Tuple[int, ...],
+		variant_formats: Tuple[str, ...],
+		quality: int,
+		overwrite: bool = False
+) -> List[Tuple[str, str, int, int]]:
+	"""
+	downscales the stored image "{storage_path}/{destination_path}" to the widths (only the ones narrower than the original),
+	the variants are written as "{storage_path}/{thumbnails_path}/w{width}/{destination_path}.{suffix}".
+	runs in the worker processes, returns plain (variant, path, width, height) tuples, the original one included.
+	"""
+	source_file = Path(storage_path) / destination_path
+	with Image.open(source_file) as original:
+		image = ImageOps.exif_transpose(original)
+		variants = [(ORIGINAL_VARIANT, destination_path, image.width, image.height)]
+		for width in sorted(widths):
+			if width >= image.width:
+				continue
+			height = max(1, round(image.height * width / image.width))
+			resized = None
+			for variant_format in variant_formats:
+				pil_format, suffix = _VARIANT_FORMATS[variant_format]
+				variant_path = f"{thumbnails_path.rstrip('/')}/w{width}/{destination_path}.{suffix}"
+				variant_file = Path(storage_path) / variant_path
+				if overwrite or not variant_file.exists():
+					if resized is None:
+						resized = image.convert("RGB").resize((width, height), Image.Resampling.LANCZOS)
+					variant_file.parent.mkdir(parents=True, exist_ok=True)
+					# written under a temporary name, so the view never gets a half written file
+					variant_tmp = variant_file.with_name(f".{variant_file.name}.tmp")
+					resized.save(variant_tmp, pil_format, quality=quality)
+					os.replace(variant_tmp, variant_file)
+				variants.append((variant_name(width, variant_format), variant_path, width, height))
+	return variants
+
+
+class Thumbnailer(object):
+	"""
+	generates the downscaled variants of the downloaded images in a pool of processes (off the scrapper threads),
+	the variants are recorded in the repository by the destination path of the original.
+	"""
+
+	def __init__(self, logger: Logger, config: ConfigThumbnails, storage_path: str, repository: Repository):
+		self._logger = logger
+		self._config = config
+		self._storage_path = storage_path
+		self._repository = repository
+		# submitted from all the download workers at once, the pool is locked
+		self._pool = SpawnedProcessPool(logger, config.workers)
+
+	def accepts(self, destination_path: str | None) -> bool:
+		return destination_path is not None and Path(destination_path).suffix.lower() in self._config.extensions
+
+	def submit(self, destination_path: str) -> Future:
+		self._logger.debug(f"Generating variants of '{destination_path}'.")
+		future = self._pool.submit(
+			make_variants,
+			self._storage_path,
+			destination_path,
+			self._config.path,
+			tuple(self._config.widths),
+			tuple(self._config.formats),
+			self._config.quality
+		)
+		future.add_done_callback(lambda f: self._on_done(destination_path, f))
+		return future
+
+	def _on_done(self, destination_path: str, future: Future) -> None:
+		try:
+			variants = future.result()
+			self._repository.save_item_variants([MItemVariantE(destination_path, *variant) for variant in variants])
+			self._logger.debug(f"{len(variants)} variants of '{destination_path}' generated.")
+		except Exception as ex:
+			self._logger.warning(f"Variants of '{destination_path}' not generated: {ex!s}.")
+
+	def close(self) -> None:
+		self._pool.shutdown()
@@ -0,0 +1,89 @@
+import logging
+import os
+import sys
+from typing import List, Tuple
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mrepository import RepositorySqlite3
+from mrepository_entities import MTaskE, TaskClass, TaskClassAndType, TaskType
+from mrepository_installer import RepositoryInstaller
+from msqlite_api import SqliteApi
+
+TASK_DEF = TaskClassAndType(TaskClass.SCRAP, TaskType.ROUMEN_KECY)
+
+# the reads walking a table in the rowid order, stopped by the limit
+ROWID_ORDER_SCANS = {
+	("read_recent_tasks_all_first_page", "task"),
+}
+
+
+class _RecordingSqliteApi(SqliteApi):
+	""" remembers the statements of read() with their binds """
+
+	def __init__(self, logger: logging.Logger, sqlite_datafile: str):
+		super().__init__(logger, sqlite_datafile)
+		self.statements: List[Tuple[str, dict]] = []
+
+	def read(self, sql_stmt: str, binds, row_mapper: callable = None):
+		self.statements.append((sql_stmt, binds))
+		return super().read(sql_stmt, binds, row_mapper)
+
+
+@pytest.fixture
+def sqlite_api(tmp_path):
+	api = _RecordingSqliteApi(logging.getLogger("test"), str(tmp_path / "medow.sqlite3"))
+	RepositoryInstaller(api).upgrade()
+	api.statements.clear()
+	yield api
+	api.close()
+
+
+def _task_entity() -> MTaskE:
+	return MTaskE(1, TASK_DEF.cls.value, TASK_DEF.typ.value, "2024-01-01 00:00:00.000", None, "completed", 0, 0, None, None)
+
+
+READS = {
+	"load_entity_task": lambda r: r.load_entity_task(1),
+	"read_recent_tasks_all": lambda r: r.read_recent_tasks_all(10, 100),
+	"read_recent_tasks_all_first_page": lambda r: r.read_recent_tasks_all(10),
+	"read_task_items": lambda r: r.read_task_items(_task_entity(), 10, 100),
+	"read_recent_task_items": lambda r: r.read_recent_task_items(TASK_DEF, 10, 100),
+	"read_change_marker": lambda r: r.read_change_marker(TASK_DEF),
+	"read_seen_item_names": lambda r: r.read_seen_item_names(TASK_DEF, ["a", "b"]),
+	"load_source_state": lambda r: r.load_source_state(TASK_DEF),
+	"read_item_variants": lambda r: r.read_item_variants(["a/b.jpg", "a/c.jpg"]),
+	"read_item_retries": lambda r: r.read_item_retries(TASK_DEF, ["a", "b"]),
+	"read_recent_item_retries": lambda r: r.read_recent_item_retries("retry", 10),
+}
+
+
+def _query_plan(sqlite_api: SqliteApi, read_name: str) -> List[str]:
+	sqlite_api.statements.clear()
+	READS[read_name](RepositorySqlite3(logging.getLogger("test"), sqlite_api))
+	assert len(sqlite_api.statements) > 0, f"'{read_name}' did not read anything"
+	plan = []
+	for sql_stmt, binds in list(sqlite_api.statements):
+		plan.extend(row[3] for row in sqlite_api.read(f"EXPLAIN QUERY PLAN {sql_stmt}", binds))
+	return plan
+
+
+@pytest.mark.parametrize("read_name", sorted(READS.keys()))
+def test_read_uses_index(sqlite_api, read_name):
+	for detail in _query_plan(sqlite_api, read_name):
+		if detail.startswith("SCAN ") and "INDEX" not in detail:
+			table = detail.split()[1]
+			assert (read_name, table) in ROWID_ORDER_SCANS, f"'{read_name}' scans the table: {detail}"
+
+
+def test_read_recent_task_items_uses_task_id_status_index(sqlite_api):
+	plan = _query_plan(sqlite_api, "read_recent_task_items")
+	assert any("ix_task_item_task_id_status" in detail for detail in plan), plan
+	assert any("COVERING INDEX ix_task_class_type" in detail for detail in plan), plan
+
+
+def test_read_task_items_keeps_pk_order(sqlite_api):
+	plan = _query_plan(sqlite_api, "read_task_items")
+	assert not any("TEMP B-TREE" in detail for detail in plan), plan
@@ -0,0 +1,95 @@
+"""
+generates the missing thumbnails of the already downloaded images (the completed task items) in parallel.
+usage: python thumbnails-backfill.py [--config config.yaml] [--workers 4] [--overwrite]
+"""
+
+import argparse
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from mconfig import Config
+from mrepository import RepositorySqlite3
+from mrepository_entities import MItemVariantE, TaskStatusEnum
+from mrepository_installer import RepositoryInstaller
+from msqlite_api import SqliteApi
+from mthumbnails import ORIGINAL_VARIANT, is_available, make_variants
+
+SAVE_BATCH_SIZE = 200
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--config", default="config.yaml")
+	parser.add_argument("--workers", type=int, default=None, help="defaults to the thumbnails workers of the config")
+	parser.add_argument("--overwrite", action="store_true", help="generate again the variants already recorded")
+	args = parser.parse_args()
+
+	config = Config.from_yaml_file(args.config)
+	logging.basicConfig(format=config.logger.format, level=config.logger.level)
+	logger = logging.getLogger("thumbnails-backfill")
+
+	thumbnails = config.scrappers.thumbnails
+	if thumbnails is None:
+		raise SystemExit(f"No thumbnails configured in '{args.config}'.")
+	if not is_available():
+		raise SystemExit("Pillow is not installed.")
+
+	sqlite_api = SqliteApi(logger.getChild("sqlite3"), config.persistence.sqlite_datafile)
+	RepositoryInstaller(sqlite_api, logger.getChild("installer")).upgrade()
+	repository = RepositorySqlite3(logger.getChild("repository"), sqlite_api)
+
+	destination_paths = sqlite_api.read(
+		"select distinct destination_path from task_item where status=:status and destination_path is not null",
+		{"status": TaskStatusEnum.COMPLETED.value},
+		lambda rs: rs[0]
+	)
+	destination_paths = [
+		p for p in destination_paths
+		if Path(p).suffix.lower() in thumbnails.extensions and (Path(config.scrappers.storage_path) / p).is_file()
+	]
+	if not args.overwrite:
+		done = repository.read_item_variants(destination_paths)
+		destination_paths = [p for p in destination_paths if not any(v.variant == ORIGINAL_VARIANT for v in done.get(p, []))]
+
+	workers = args.workers or thumbnails.workers
+	logger.info(f"Generating the variants of {len(destination_paths)} images using {workers} processes.")
+
+	ts_start = time.perf_counter()
+	pending, done_count, fail_count = [], 0, 0
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		futures = {
+			executor.submit(
+				make_variants,
+				config.scrappers.storage_path,
+				destination_path,
+				thumbnails.path,
+				tuple(thumbnails.widths),
+				tuple(thumbnails.formats),
+				thumbnails.quality,
+				args.overwrite
+			): destination_path
+			for destination_path in destination_paths
+		}
+		for future in as_completed(futures):
+			destination_path = futures[future]
+			try:
+				pending.extend(MItemVariantE(destination_path, *variant) for variant in future.result())
+				done_count += 1
+			except Exception as ex:
+				logger.warning(f"Variants of '{destination_path}' not generated: {ex!s}.")
+				fail_count += 1
+
+			if len(pending) >= SAVE_BATCH_SIZE:
+				repository.save_item_variants(pending)
+				pending = []
+				logger.info(f"{done_count + fail_count}/{len(destination_paths)} images processed.")
+
+	repository.save_item_variants(pending)
+	sqlite_api.close()
+	logger.info(f"Done in {time.perf_counter() - ts_start:.1f}s, succ/fail: {done_count}/{fail_count}.")
+
+
+if __name__ == "__main__":
+	main()